@@ -0,0 +1,236 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import json
+import logging
+import math
+import random
+import shutil
+from pathlib import Path
+
+import pya
+
+from checks.makefile_check import MAKEFILE_TARGETS
+
+DESIGN_PARAMETERS_FILE = 'benchmark_design.json'
+USER_MODULE = 'user_project_wrapper'
+MACRO_MODULE = 'benchmark_macro'
+# Note: size (um) of a macro, spacing (um) between macros and margin (um) kept free along the edges of the wrapper (pins)
+MACRO_SIZE = 200
+MACRO_SPACING = 20
+CORE_MARGIN = 100
+# Note: width (um) and maximum length (um) of the wires drawn into a macro
+WIRE_WIDTH = 0.3
+WIRE_LENGTH = 50
+# Note: standard cell chained by the netlist (input pin, output pin, power pins), drawing layers of the wires of the macros
+PDK_PARAMETERS = {
+    'sky130': dict(std_cell_library='sky130_fd_sc_hd',
+                   std_cell='sky130_fd_sc_hd__inv_1',
+                   std_cell_pins=('A', 'Y'),
+                   power_pins=dict(VPWR='vccd1', VGND='vssd1', VPB='vccd1', VNB='vssd1'),
+                   power_nets=['vccd1', 'vssd1'],
+                   routing_layers=[(68, 20), (69, 20), (70, 20), (71, 20)]),
+    'gf180mcu': dict(std_cell_library='gf180mcu_fd_sc_mcu7t5v0',
+                     std_cell='gf180mcu_fd_sc_mcu7t5v0__inv_1',
+                     std_cell_pins=('I', 'ZN'),
+                     power_pins=dict(VDD='vdd', VSS='vss', VNW='vdd', VPW='vss'),
+                     power_nets=['vdd', 'vss'],
+                     routing_layers=[(34, 0), (36, 0), (42, 0), (46, 0)]),
+}
+
+
+def get_pdk_parameters(pdk_path):
+    return PDK_PARAMETERS['gf180mcu' if 'gf180mcu' in Path(pdk_path).name else 'sky130']
+
+
+def get_golden_wrapper(caravel_root, pdk_path):
+    if 'gf180mcu' in Path(pdk_path).name:
+        return Path(__file__).parent.parent / '_default_content/gds/user_project_wrapper_empty_gf180mcu.gds'
+    return Path(caravel_root) / f'gds/{USER_MODULE}_empty.gds'
+
+
+def draw_macro(layout, routing_layers, shapes, rng):
+    """Create the macro cell, `shapes` wires spread over the routing layers (horizontal & vertical on alternate layers)"""
+    macro = layout.create_cell(MACRO_MODULE)
+    layers = [layout.layer(layer, datatype) for layer, datatype in routing_layers]
+    for _ in range(shapes):
+        index = rng.randrange(len(layers))
+        length = rng.uniform(WIRE_WIDTH, WIRE_LENGTH)
+        x = rng.uniform(0, MACRO_SIZE - (length if index % 2 == 0 else WIRE_WIDTH))
+        y = rng.uniform(0, MACRO_SIZE - (WIRE_WIDTH if index % 2 == 0 else length))
+        width, height = (length, WIRE_WIDTH) if index % 2 == 0 else (WIRE_WIDTH, length)
+        macro.shapes(layers[index]).insert(pya.DBox(x, y, x + width, y + height))
+    return macro
+
+
+def place_macros(top, macro, core, count):
+    """Place the macros on a grid filling the core from its top edge, returns the lowest y occupied by a macro"""
+    pitch = MACRO_SIZE + MACRO_SPACING
+    columns = max(1, int(core.width() // pitch))
+    rows = math.ceil(count / columns)
+    if rows * pitch > core.height():
+        raise ValueError(f"{count} macros of {MACRO_SIZE}um do not fit into the wrapper")
+    for index in range(count):
+        row, column = divmod(index, columns)
+        x = core.left + column * pitch
+        y = core.top - (row + 1) * pitch + MACRO_SPACING
+        top.insert(pya.DCellInstArray(macro.cell_index(), pya.DTrans(pya.DVector(x, y))))
+    return core.top - rows * pitch if count else core.top
+
+
+def place_std_cells(top, std_cell, core, top_y, count):
+    """Place the standard cells in rows from the bottom of the core up to top_y, every other row is flipped"""
+    bbox = std_cell.dbbox()
+    columns = max(1, int(core.width() // bbox.width()))
+    rows = math.ceil(count / columns)
+    if core.bottom + rows * bbox.height() > top_y:
+        raise ValueError(f"{count} standard cells do not fit into the wrapper next to the macros")
+    for index in range(count):
+        row, column = divmod(index, columns)
+        x = core.left + column * bbox.width() - bbox.left
+        if row % 2:
+            trans = pya.DTrans(pya.DTrans.M0, pya.DVector(x, core.bottom + (row + 1) * bbox.height() + bbox.bottom))
+        else:
+            trans = pya.DTrans(pya.DVector(x, core.bottom + row * bbox.height() - bbox.bottom))
+        top.insert(pya.DCellInstArray(std_cell.cell_index(), trans))
+
+
+def write_layout(gds_path, golden_wrapper, std_cell_gds, pdk_parameters, cells, macros, shapes, rng):
+    layout = pya.Layout()
+    layout.read(str(golden_wrapper))
+    top = layout.top_cell()
+    core = top.dbbox().enlarged(-CORE_MARGIN, -CORE_MARGIN)
+
+    macro_bottom = core.top
+    if macros:
+        macro = draw_macro(layout, pdk_parameters['routing_layers'], shapes, rng)
+        macro_bottom = place_macros(top, macro, core, macros)
+    if cells:
+        library = pya.Layout()
+        library.read(str(std_cell_gds))
+        std_cell = layout.create_cell(pdk_parameters['std_cell'])
+        std_cell.copy_tree(library.cell(pdk_parameters['std_cell']))
+        place_std_cells(top, std_cell, core, macro_bottom, cells)
+    layout.write(str(gds_path))
+
+
+def write_netlists(design_directory, golden_wrapper_netlist, pdk_parameters, cells, macros):
+    """Write the gate-level netlists: the golden wrapper ports, a chain of `cells` standard cells driven by wb_clk_i & the macros"""
+    power_nets = pdk_parameters['power_nets']
+    with open(design_directory / f'verilog/gl/{MACRO_MODULE}.v', 'w') as f:
+        f.write(f"module {MACRO_MODULE} (\n`ifdef USE_POWER_PINS\n    {', '.join(power_nets)}\n`endif\n);\n")
+        f.write(f"`ifdef USE_POWER_PINS\n    inout {', '.join(power_nets)};\n`endif\nendmodule\n")
+
+    with open(golden_wrapper_netlist) as f:
+        wrapper = f.read()
+    header = wrapper[:wrapper.rindex('endmodule')]
+    input_pin, output_pin = pdk_parameters['std_cell_pins']
+    power_connections = ''.join(f", .{pin}({net})" for pin, net in pdk_parameters['power_pins'].items())
+    with open(design_directory / f'verilog/gl/{USER_MODULE}.v', 'w') as f:
+        f.write(header)
+        if cells:
+            f.write(f"    wire [{cells}:1] benchmark_net;\n")
+            for index in range(cells):
+                input_net = f"benchmark_net[{index}]" if index else 'wb_clk_i'
+                f.write(f"    {pdk_parameters['std_cell']} benchmark_cell_{index} (.{input_pin}({input_net}), .{output_pin}(benchmark_net[{index + 1}])\n")
+                f.write(f"`ifdef USE_POWER_PINS\n        {power_connections}\n`endif\n    );\n")
+        for index in range(macros):
+            f.write(f"    {MACRO_MODULE} benchmark_macro_{index} (\n`ifdef USE_POWER_PINS\n        {', '.join(f'.{net}({net})' for net in power_nets)}\n`endif\n    );\n")
+        f.write("endmodule\n")
+
+
+def write_lvs_config(design_directory, pdk_parameters):
+    lvs_config = {
+        "STD_CELL_LIBRARY": pdk_parameters['std_cell_library'],
+        "INCLUDE_CONFIGS": ["$LVS_ROOT/tech/$PDK/lvs_config.base.json"],
+        "TOP_SOURCE": USER_MODULE,
+        "TOP_LAYOUT": "$TOP_SOURCE",
+        "EXTRACT_FLATGLOB": [""],
+        "EXTRACT_ABSTRACT": [MACRO_MODULE],
+        "EXTRACT_CREATE_SUBCUT": [""],
+        "LVS_FLATTEN": [""],
+        "LVS_NOFLATTEN": [MACRO_MODULE],
+        "LVS_IGNORE": [""],
+        "LVS_SPICE_FILES": [""],
+        "LVS_VERILOG_FILES": [f"$UPRJ_ROOT/verilog/gl/{MACRO_MODULE}.v", f"$UPRJ_ROOT/verilog/gl/{USER_MODULE}.v"],
+        "LAYOUT_FILE": f"$UPRJ_ROOT/gds/{USER_MODULE}.gds",
+    }
+    with open(design_directory / f'lvs/{USER_MODULE}/lvs_config.json', 'w') as f:
+        json.dump(lvs_config, f, indent=4)
+
+
+def write_project_files(design_directory, caravel_root, parameters):
+    """Write the files read by the non layout checks (README, LICENSE, Makefile, user_defines.v)"""
+    with open(design_directory / 'README.md', 'w') as f:
+        f.write("# Precheck Benchmark Design\n\n")
+        f.write("Synthetic user project generated by benchmarks/synthetic_design.py to measure the runtime of the precheck.\n\n")
+        f.write("| Parameter | Value |\n| --- | --- |\n")
+        f.write(''.join(f"| {key} | {value} |\n" for key, value in parameters.items()))
+    shutil.copyfile(Path(__file__).parent.parent / 'LICENSE', design_directory / 'LICENSE')
+    with open(design_directory / 'Makefile', 'w') as f:
+        f.write("# SPDX-FileCopyrightText: 2024 Efabless Corporation\n# SPDX-License-Identifier: Apache-2.0\n\n")
+        f.write(''.join(f".PHONY: {target}\n{target}:\n\t@echo {target}\n\n" for target in MAKEFILE_TARGETS))
+    user_defines = Path(caravel_root) / 'verilog/rtl/user_defines.v'
+    if user_defines.exists():
+        shutil.copyfile(user_defines, design_directory / 'verilog/rtl/user_defines.v')
+
+
+def generate_design(design_directory, caravel_root, pdk_path, cells=0, macros=0, shapes=0, seed=0):
+    """Generate a synthetic digital user project: the golden empty wrapper filled with `cells` standard cells and `macros`
+    macros holding `shapes` wires each, with a matching gate-level netlist and lvs_config.json
+
+    The design exercises every check at a known scale, it is not meant to pass them all (the instances are not routed).
+    A design generated with the same parameters is reused.
+    """
+    design_directory = Path(design_directory)
+    parameters = dict(cells=cells, macros=macros, shapes=shapes, seed=seed, pdk=Path(pdk_path).name)
+    parameters_path = design_directory / DESIGN_PARAMETERS_FILE
+    try:
+        with open(parameters_path) as f:
+            if json.load(f) == parameters:
+                logging.info(f"{{{{BENCHMARK}}}} Reusing the design generated in {design_directory}")
+                return design_directory
+    except (OSError, ValueError):
+        pass
+
+    logging.info(f"{{{{BENCHMARK}}}} Generating a design with {cells} standard cells and {macros} macros of {shapes} shapes in {design_directory}")
+    shutil.rmtree(design_directory, ignore_errors=True)
+    for directory in ['gds', 'verilog/gl', 'verilog/rtl', f'lvs/{USER_MODULE}']:
+        (design_directory / directory).mkdir(parents=True, exist_ok=True)
+    pdk_parameters = get_pdk_parameters(pdk_path)
+    std_cell_gds = Path(pdk_path) / f"libs.ref/{pdk_parameters['std_cell_library']}/gds/{pdk_parameters['std_cell_library']}.gds"
+    write_layout(design_directory / f'gds/{USER_MODULE}.gds', get_golden_wrapper(caravel_root, pdk_path), std_cell_gds, pdk_parameters, cells, macros, shapes, random.Random(seed))
+    write_netlists(design_directory, Path(caravel_root) / f'verilog/rtl/__{USER_MODULE}.v', pdk_parameters, cells, macros)
+    write_lvs_config(design_directory, pdk_parameters)
+    write_project_files(design_directory, caravel_root, parameters)
+    with open(parameters_path, 'w') as f:
+        json.dump(parameters, f, indent=2)
+    return design_directory
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format=f"%(asctime)s | %(levelname)-7s | %(message)s", datefmt='%d-%b-%Y %H:%M:%S')
+    parser = argparse.ArgumentParser(description="Generates a synthetic user project to benchmark the precheck.")
+    parser.add_argument('--design_directory', '-d', required=True, help='Directory the design is generated in')
+    parser.add_argument('--caravel_root', '-c', required=True, help='Golden caravel root')
+    parser.add_argument('--pdk_path', '-p', required=True, help='PDK path (variant specific)')
+    parser.add_argument('--cells', type=int, default=0, help='Number of standard cells')
+    parser.add_argument('--macros', type=int, default=0, help='Number of macros')
+    parser.add_argument('--shapes', type=int, default=0, help='Number of shapes per macro')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the shape generator')
+    args = parser.parse_args()
+
+    generate_design(args.design_directory, args.caravel_root, args.pdk_path, args.cells, args.macros, args.shapes, args.seed)
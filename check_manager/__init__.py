@@ -13,29 +13,19 @@
 # limitations under the License.
 # SPDX-License-Identifier: Apache-2.0
 
+import importlib
 import logging
 import os
 import sys
 from collections import OrderedDict
 from pathlib import Path
 
-from checks import defaults_check
-from checks import documentation_check
-from checks import makefile_check
-from checks import manifest_check
-from checks.consistency_check import consistency_check
-from checks.drc_checks.klayout import klayout_gds_drc_check
-from checks.drc_checks.magic import magic_gds_drc_check
-from checks.gpio_defines_check import gpio_defines_check
-from checks.license_check import license_check
-from checks.xor_check import xor_check
-from checks.lvs_check.lvs import run_lvs
-from checks.oeb_check.oeb import run_oeb
-from checks.pdn_check.pdn import run_pdn
-from checks.metal_check.metal_check import run_metal_check
-from checks.spike_check.spike import run_spike_check
-from checks.illegal_cellname_check.illegal_cellname import run_illegal_cellname_check
-from checks.topcell_check.topcell import check_top_cells
+from checks.utils.gds import index_source
+from checks.utils.utils import file_hash, file_hashes, get_be_check_inputs, golden_file_hash
+
+CHECKS_ROOT = Path(__file__).parent.parent / 'checks'
+# Note: margin applied to the peak memory of a check measured in previous runs
+MEMORY_MARGIN = 1.25
 
 
 class CheckManagerNotFound(Exception):
@@ -43,57 +33,164 @@ class CheckManagerNotFound(Exception):
 
 
 class CheckManager:
+    # Note: checks are declared by their metadata (__ref__, __surname__, __supported_pdks__, __supported_type__), the
+    # module implementing a check (__implementation__) is only imported once the check runs
+    __implementation__ = None
+    # Note: refs of the checks that have to finish before this check may start (if they are part of the sequence)
+    __depends_on__ = []
+    # Note: resources (CPUs, GiB of memory) the check is expected to occupy while running, used by the scheduler
+    __cpus__ = 1
+    __memory__ = 1
+    # Note: GiB of memory per GiB of user GDS the tools of the check occupy, the memory estimate grows with the design
+    __memory_per_gds__ = 0
+    # Note: estimated wall time (seconds) of the check on a full size project, used to order the checks in fail fast mode
+    # (superseded by the wall time measured in previous runs)
+    __cost__ = 1
+    # Note: checks running a KLayout DRC deck share a single KLayout process through precheck_config['klayout_session']
+    __klayout_deck__ = False
+
     def __init__(self, precheck_config, project_config):
         self.precheck_config = precheck_config
         self.project_config = project_config
         self.result = True
 
+    @classmethod
+    def is_supported(cls, pdk, project_type):
+        return pdk in cls.__supported_pdks__ and project_type in cls.__supported_type__
+
+    @property
+    def implementation(self):
+        return importlib.import_module(self.__implementation__)
+
     def run(self):
         """
         Define the check running steps. This version does nothing and is intended to be implemented by subclasses.
         """
 
+    def release(self):
+        """
+        Release the resources shared with other checks, called once the check is done (or its result was restored from the cache).
+        This version does nothing and is intended to be implemented by subclasses.
+        """
+
+    def gds_index_path(self):
+        """
+        File the structure index of the user GDS (cells, hierarchy, layers) is persisted in, the checks only needing the
+        hierarchy query the index instead of loading the geometry. The index is kept in the GDS index cache, keyed on the
+        GDS as submitted, so that the later runs of the project reuse it; in the output directory without a cache.
+        """
+        index_cache = self.precheck_config.get('index_cache')
+        if index_cache:
+            try:
+                return index_cache.entry(index_source(self.gds_source_path))
+            except OSError:
+                pass
+        return self.precheck_config['output_directory'] / f"outputs/{self.project_config['user_module']}.gds.index.json"
+
+    @property
+    def gds_source_path(self):
+        """
+        User GDS of the project as submitted (on the shared filesystem, see gds_input_file_path for the copy the checks read).
+        """
+        return self.precheck_config['input_directory'] / f"gds/{self.project_config['user_module']}.gds"
+
+    @property
+    def gds_input_file_path(self):
+        """
+        User GDS the check reads: its copy staged to node-local storage when the GDS was staged (see StagedGds).
+        """
+        staged_gds = self.precheck_config.get('staged_gds')
+        if staged_gds:
+            return staged_gds.checkout(self.__ref__)
+        return self.gds_source_path
+
+    def memory_estimate(self, history=None):
+        """
+        GiB of memory the check is expected to occupy: the largest of its declared memory, its memory scaled from the size
+        of the user GDS and the peak memory of its tools measured in previous runs (with a margin).
+        """
+        estimates = [self.__memory__]
+        gds_path = self.gds_source_path
+        if self.__memory_per_gds__ and gds_path.exists():
+            estimates.append(self.__memory_per_gds__ * gds_path.stat().st_size / 1024 ** 3)
+        measured = history.peak_rss(self) if history else None
+        if measured is not None:
+            estimates.append(MEMORY_MARGIN * measured / 1024 ** 2)
+        return max(estimates)
+
+    def cache_inputs(self):
+        """
+        Describe everything the check result depends on besides the PDK & the tools (file hashes, scripts, arguments).
+        Checks returning None (the default) are never cached.
+        """
+        return None
+
+    def cache_artifacts(self):
+        """
+        List the files (relative to the output directory) the check writes, restored alongside a cached result.
+        """
+        return []
+
+    def cache_result(self, result):
+        """
+        Result of the check to record for later runs (result cache, incremental runs), None to not record it.
+        This version records the result returned by run().
+        """
+        return result
+
 
 class Consistency(CheckManager):
     __ref__ = 'consistency'
     __surname__ = 'Consistency'
     __supported_pdks__ = ['sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe']
+    __implementation__ = 'checks.consistency_check.consistency_check'
+    __cost__ = 30
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
 
     def run(self):
-        self.result = consistency_check.main(input_directory=self.precheck_config['input_directory'],
-                                             output_directory=self.precheck_config['output_directory'],
-                                             project_config=self.project_config,
-                                             golden_wrapper_netlist=self.precheck_config['caravel_root'] / f"verilog/rtl/__{self.project_config['user_module']}.v",
-                                             defines_file_path=self.precheck_config['caravel_root'] / 'verilog/rtl/defines.v')
+        self.result = self.implementation.main(input_directory=self.precheck_config['input_directory'],
+                                               output_directory=self.precheck_config['output_directory'],
+                                               project_config=self.project_config,
+                                               golden_wrapper_netlist=self.precheck_config['caravel_root'] / f"verilog/rtl/__{self.project_config['user_module']}.v",
+                                               defines_file_path=self.precheck_config['caravel_root'] / 'verilog/rtl/defines.v',
+                                               gds_input_file_path=self.gds_input_file_path,
+                                               gds_index_path=self.gds_index_path())
         if self.result:
             logging.info("{{CONSISTENCY CHECK PASSED}} The user netlist and the top netlist are valid.")
         else:
             logging.warning("{{CONSISTENCY CHECK FAILED}} The user netlist and the top netlist are not valid.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(gds=self.precheck_config['run_info']['gds_hash'],
+                    user_netlist=file_hash(self.project_config['user_netlist']),
+                    top_netlist=golden_file_hash(self.project_config['top_netlist']),
+                    golden_wrapper_netlist=golden_file_hash(self.precheck_config['caravel_root'] / f"verilog/rtl/__{self.project_config['user_module']}.v"),
+                    defines=golden_file_hash(self.precheck_config['caravel_root'] / 'verilog/rtl/defines.v'))
+
 
 class Defaults(CheckManager):
     __ref__ = 'default'
     __surname__ = 'Default'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.defaults_check'
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
 
     def run(self):
-        default_readme_result = defaults_check.has_default_readme(self.precheck_config['input_directory'], self.precheck_config['default_content'])
+        default_readme_result = self.implementation.has_default_readme(self.precheck_config['input_directory'], self.precheck_config['default_content'])
         if default_readme_result:
             logging.info("{{README DEFAULT CHECK PASSED}} Project 'README.md' was modified and is not identical to the default 'README.md'")
         else:
             self.result = False
             logging.warning("{{README DEFAULT CHECK FAILED}} Project 'README.md' was not modified and is identical to the default 'README.md'")
 
-        default_content_result = defaults_check.has_default_content(self.precheck_config['input_directory'], self.precheck_config['default_content'])
+        default_content_result = self.implementation.has_default_content(self.precheck_config['input_directory'], self.precheck_config['default_content'])
         if default_content_result:
             logging.info("{{CONTENT DEFAULT CHECK PASSED}} Project 'gds' was modified and is not identical to the default 'gds'")
         else:
@@ -102,53 +199,89 @@ class Defaults(CheckManager):
 
         return self.result
 
+    def cache_inputs(self):
+        readme = self.precheck_config['input_directory'] / 'README.md'
+        return dict(readme=file_hash(readme) if readme.exists() else None,
+                    gds={path.name: digest for path, digest in file_hashes(sorted((self.precheck_config['input_directory'] / 'gds').glob('*'))).items()})
+
 
 class Documentation(CheckManager):
     __ref__ = 'documentation'
     __surname__ = 'Documentation'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.documentation_check'
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
 
     def run(self):
-        self.result = documentation_check.main(input_directory=self.precheck_config['input_directory'])
+        self.result = self.implementation.main(input_directory=self.precheck_config['input_directory'])
         if self.result:
             logging.info("{{DOCUMENTATION CHECK PASSED}} Project documentation is appropriate.")
         else:
             logging.warning("{{DOCUMENTATION CHECK FAILED}} Project documentation is not appropriate.")
         return self.result
 
+    def cache_inputs(self):
+        documents = []
+        for root, _, files in os.walk(self.precheck_config['input_directory']):
+            documents.extend(Path(root) / file for file in sorted(files) if Path(file).suffix in self.implementation.DOCUMENTATION_EXTS)
+        return {str(document.relative_to(self.precheck_config['input_directory'])): digest for document, digest in file_hashes(documents).items()}
+
 
 class GpioDefines(CheckManager):
     __ref__ = 'gpio_defines'
     __surname__ = 'GPIO-Defines'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital']
+    __implementation__ = 'checks.gpio_defines_check.gpio_defines_check'
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
 
     def run(self):
-        self.result = gpio_defines_check.main(input_directory=self.precheck_config['input_directory'],
-                                              output_directory=self.precheck_config['output_directory'],
-                                              project_type=self.project_config['type'],
-                                              user_defines_v=Path("verilog/rtl/user_defines.v"),
-                                              include_extras=[],
-                                              precheck_config=self.precheck_config)
+        self.result = self.implementation.main(input_directory=self.precheck_config['input_directory'],
+                                               output_directory=self.precheck_config['output_directory'],
+                                               project_type=self.project_config['type'],
+                                               user_defines_v=Path("verilog/rtl/user_defines.v"),
+                                               include_extras=[],
+                                               precheck_config=self.precheck_config)
         if self.result:
             logging.info("{{GPIO-DEFINES CHECK PASSED}} The user verilog/rtl/user_defines.v is valid.")
         else:
             logging.warning("{{GPIO-DEFINES CHECK FAILED}} The user verilog/rtl/user_defines.v is not valid.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(user_defines=file_hash(self.precheck_config['input_directory'] / 'verilog/rtl/user_defines.v'),
+                    assets={path.name: golden_file_hash(path) for path in sorted((CHECKS_ROOT / 'gpio_defines_check/verilog_assets').glob('*.v'))})
+
+    def cache_artifacts(self):
+        return ['outputs/reports/gpio_defines.report']
+
+
+def be_check_inputs(check):
+    """Inputs of the LVS & OEB checks: the user GDS, the project files referenced by the LVS configuration & the check scripts"""
+    gds_path = check.design_directory / f"gds/{check.design_name}.gds"
+    files = get_be_check_inputs(check.design_directory, check.config_file)
+    return dict(gds=check.precheck_config['run_info']['gds_hash'],
+                files={str(path.relative_to(check.design_directory)): digest for path, digest in file_hashes(path for path in files if path != gds_path).items()},
+                scripts={str(path.relative_to(CHECKS_ROOT)): golden_file_hash(path) for path in sorted((CHECKS_ROOT / 'be_checks').rglob('*')) if path.is_file()})
+
 
 class Lvs(CheckManager):
     __ref__ = 'lvs'
     __surname__ = 'LVS'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.lvs_check.lvs'
+    __cost__ = 2400
+    # Note: LVS and OEB share the same work directory (<output_directory>/tmp), which is removed by a successful run
+    __depends_on__ = ['oeb']
+    __cpus__ = 2
+    __memory__ = 8
+    __memory_per_gds__ = 10
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
@@ -167,7 +300,7 @@ class Lvs(CheckManager):
         self.pdk = precheck_config['pdk_path'].name
 
     def run(self):
-        self.result = run_lvs(self.design_directory, self.output_directory, self.design_name, self.config_file, self.pdk_root, self.pdk)
+        self.result = self.implementation.run_lvs(self.design_directory, self.output_directory, self.design_name, self.config_file, self.pdk_root, self.pdk)
 
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The design, {self.design_name}, has no LVS violations.")
@@ -175,11 +308,23 @@ class Lvs(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The design, {self.design_name}, has LVS violations.")
         return self.result
 
+    def cache_inputs(self):
+        return be_check_inputs(self)
+
+    def cache_artifacts(self):
+        return ['logs/LVS_check.log', 'logs/ext.log', 'logs/nowell.ext.log', 'logs/soft.log', 'logs/lvs.log', 'logs/cvc.log',
+                'outputs/reports/soft.report', 'outputs/reports/lvs.report', 'outputs/reports/cvc.report', 'outputs/reports/hier.csv']
+
 class Oeb(CheckManager):
     __ref__ = 'oeb'
     __surname__ = 'OEB'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'mini']
+    __implementation__ = 'checks.oeb_check.oeb'
+    __cpus__ = 2
+    __memory__ = 8
+    __cost__ = 1200
+    __memory_per_gds__ = 10
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
@@ -198,7 +343,7 @@ class Oeb(CheckManager):
         self.pdk = precheck_config['pdk_path'].name
 
     def run(self):
-        self.result = run_oeb(self.design_directory, self.output_directory, self.design_name, self.config_file, self.pdk_root, self.pdk)
+        self.result = self.implementation.run_oeb(self.design_directory, self.output_directory, self.design_name, self.config_file, self.pdk_root, self.pdk)
 
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The design, {self.design_name}, has no OEB violations.")
@@ -206,18 +351,36 @@ class Oeb(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The design, {self.design_name}, has OEB violations.")
         return self.result
 
+    def cache_inputs(self):
+        return be_check_inputs(self)
+
+    def cache_artifacts(self):
+        return ['logs/OEB_check.log', 'logs/cvc.oeb.log', 'outputs/reports/cvc.oeb.report']
+
 
 class KlayoutDRC(CheckManager):
     __ref__ = None
     __surname__ = None
     __supported_pdks__ = None
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.drc_checks.klayout.klayout_gds_drc_check'
+    __cpus__ = 4
+    __memory__ = 4
+    __cost__ = 300
+    __memory_per_gds__ = 8
+    __klayout_deck__ = True
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
-        self.gds_input_file_path = self.precheck_config['input_directory'] / f"gds/{project_config['user_module']}.gds"
         self.drc_script_path = ""
         self.klayout_cmd_extra_args = []
+        # note: largest distance (microns) the rules of the deck look at, None if the deck can not run on tiles of the layout
+        self.drc_halo = None
+
+    @property
+    def tiled(self):
+        """Whether the deck runs on tiles of the layout (PRECHECK_DRC_TILES), in KLayout processes of its own"""
+        return self.drc_halo is not None and self.implementation.tile_count() > 1
 
     def run(self):
         if not self.gds_input_file_path.exists():
@@ -225,28 +388,52 @@ class KlayoutDRC(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} {self.gds_input_file_path.name}, GDS file was not found.")
             return self.result
 
-        self.result = klayout_gds_drc_check.klayout_gds_drc_check(self.__ref__,
-                                                                  self.drc_script_path,
-                                                                  self.gds_input_file_path,
-                                                                  self.precheck_config['output_directory'],
-                                                                  self.klayout_cmd_extra_args)
+        klayout_session = self.precheck_config.get('klayout_session')
+        self.result = klayout_session.run(self) if klayout_session else None
+        if self.result is None:
+            self.result = self.implementation.klayout_gds_drc_check(self.__ref__,
+                                                                    self.drc_script_path,
+                                                                    self.gds_input_file_path,
+                                                                    self.precheck_config['output_directory'],
+                                                                    self.klayout_cmd_extra_args,
+                                                                    halo=self.drc_halo,
+                                                                    gds_index_path=self.gds_index_path(),
+                                                                    gds_source_path=self.gds_source_path,
+                                                                    tile_memory=self.memory_estimate())
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The GDS file, {self.gds_input_file_path.name}, has no DRC violations.")
         else:
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The GDS file, {self.gds_input_file_path.name}, has DRC violations.")
         return self.result
 
+    def release(self):
+        if self.precheck_config.get('klayout_session'):
+            self.precheck_config['klayout_session'].release(self)
+
+    def cache_inputs(self):
+        output_directory = str(self.precheck_config['output_directory'])
+        return dict(gds=self.precheck_config['run_info']['gds_hash'],
+                    script=golden_file_hash(self.drc_script_path),
+                    args=[str(arg).replace(output_directory, '$OUTPUT_DIRECTORY') for arg in self.klayout_cmd_extra_args])
+
+    def cache_artifacts(self):
+        return [f"logs/{self.__ref__}_check.log", f"logs/{self.__ref__}_check.total", f"outputs/reports/{self.__ref__}_check.xml"]
+
 
 class KlayoutBEOL(KlayoutDRC):
     __ref__ = 'klayout_beol'
     __surname__ = 'Klayout BEOL'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __cost__ = 1200
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
         self.drc_script_path = Path(__file__).parent.parent / f"checks/tech-files/{precheck_config['pdk_path'].stem}_mr.drc"
         self.klayout_cmd_extra_args = ['-rd', 'beol=true']
+        # note: the gf180mcu decks measure edges up to 1mm long (e.g. the top metal rules), they always run untiled
+        if 'sky130' in precheck_config['pdk_path'].stem:
+            self.drc_halo = 20
         if 'gf180mcuC' in precheck_config['pdk_path'].stem:
             self.klayout_cmd_extra_args += ['-rd', 'metal_top=9K', '-rd', 'mim_option=B', '-rd', 'metal_level=5LM', '-rd', 'conn_drc=true']
         if 'gf180mcuD' in precheck_config['pdk_path'].stem:
@@ -258,11 +445,14 @@ class KlayoutFEOL(KlayoutDRC):
     __surname__ = 'Klayout FEOL'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __cost__ = 1800
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
         self.drc_script_path = Path(__file__).parent.parent / f"checks/tech-files/{precheck_config['pdk_path'].stem}_mr.drc"
         self.klayout_cmd_extra_args = ['-rd', 'feol=true']
+        if 'sky130' in precheck_config['pdk_path'].stem:
+            self.drc_halo = 20
         if 'gf180mcuC' in precheck_config['pdk_path'].stem:
             self.klayout_cmd_extra_args += ['-rd', 'metal_top=9K', '-rd', 'mim_option=B', '-rd', 'metal_level=5LM', '-rd', 'conn_drc=true']
         if 'gf180mcuD' in precheck_config['pdk_path'].stem:
@@ -273,11 +463,12 @@ class SpikeCheck(CheckManager):
     __surname__ = 'Spike Check'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.spike_check.spike'
+    __cost__ = 120
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
         self.script_path = Path(__file__).parent.parent / f"checks/spike_check/gdsArea0"
-        self.gds_input_file_path = self.precheck_config['input_directory'] / f"gds/{project_config['user_module']}.gds"
     
     def run(self):
         if not self.gds_input_file_path.exists():
@@ -285,22 +476,29 @@ class SpikeCheck(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} {self.gds_input_file_path.name}, GDS file was not found.")
             return self.result
 
-        self.result = run_spike_check(self.gds_input_file_path, self.precheck_config['output_directory'], self.script_path)
+        self.result = self.implementation.run_spike_check(self.gds_input_file_path, self.precheck_config['output_directory'], self.script_path)
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The GDS file, {self.gds_input_file_path.name}, has no spike errors.")
         else:
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The GDS file, {self.gds_input_file_path.name}, has spike errors.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(gds=self.precheck_config['run_info']['gds_hash'], script=golden_file_hash(self.script_path))
+
+    def cache_artifacts(self):
+        return ["logs/spike_check.log", "outputs/reports/spike_check.xml"]
+
 class IllegalCellnameCheck(CheckManager):
     __ref__ = 'illegal_cellname_check'
     __surname__ = 'Illegal Cellname Check'
     __supported_pdks__ = ['sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.illegal_cellname_check.illegal_cellname'
+    __cost__ = 60
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
-        self.gds_input_file_path = self.precheck_config['input_directory'] / f"gds/{project_config['user_module']}.gds"
     
     def run(self):
         if not self.gds_input_file_path.exists():
@@ -308,22 +506,26 @@ class IllegalCellnameCheck(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} {self.gds_input_file_path.name}, GDS file was not found.")
             return self.result
 
-        self.result = run_illegal_cellname_check(self.gds_input_file_path)
+        self.result = self.implementation.run_illegal_cellname_check(self.gds_input_file_path, self.gds_index_path(), self.precheck_config['pdk_path'].name)
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The GDS file, {self.gds_input_file_path.name}, has no Illegal Cellnames errors.")
         else:
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The GDS file, {self.gds_input_file_path.name}, has Illegal Cellnames.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(gds=self.precheck_config['run_info']['gds_hash'])
+
 class TopcellCheck(CheckManager):
     __ref__ = 'topcell_check'
     __surname__ = 'Top Cell Check'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.topcell_check.topcell'
+    __cost__ = 30
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
-        self.gds_input_file_path = self.precheck_config['input_directory'] / f"gds/{project_config['user_module']}.gds"
     
     def run(self):
         if not self.gds_input_file_path.exists():
@@ -331,13 +533,16 @@ class TopcellCheck(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} {self.gds_input_file_path.name}, GDS file was not found.")
             return self.result
 
-        self.result = check_top_cells(self.gds_input_file_path)
+        self.result = self.implementation.check_top_cells(self.gds_input_file_path, self.gds_index_path())
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The GDS file, {self.gds_input_file_path.name}, has exactly 1 topcell.")
         else:
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The GDS file, {self.gds_input_file_path.name}, has no topcell or multiple topcells.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(gds=self.precheck_config['run_info']['gds_hash'])
+
 class KlayoutMetalMinimumClearAreaDensity(KlayoutDRC):
     __ref__ = 'klayout_met_min_ca_density'
     __surname__ = 'Klayout Metal Minimum Clear Area Density'
@@ -362,6 +567,8 @@ class KlayoutOffgrid(KlayoutDRC):
         super().__init__(precheck_config, project_config)
         self.drc_script_path = Path(__file__).parent.parent / f"checks/tech-files/{precheck_config['pdk_path'].stem}_mr.drc"
         self.klayout_cmd_extra_args = ['-rd', 'offgrid=true']
+        if 'sky130' in precheck_config['pdk_path'].stem:
+            self.drc_halo = 1
         if 'gf180mcuC' in precheck_config['pdk_path'].stem:
             self.klayout_cmd_extra_args += ['-rd', 'metal_top=9K', '-rd', 'mim_option=B', '-rd', 'metal_level=5LM', '-rd', 'conn_drc=true']
         if 'gf180mcuD' in precheck_config['pdk_path'].stem:
@@ -389,7 +596,10 @@ class KlayoutZeroArea(KlayoutDRC):
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
         self.drc_script_path = Path(__file__).parent.parent / "checks/drc_checks/klayout/zeroarea.rb.drc"
-        self.klayout_cmd_extra_args = ["-rd", f"""cleaned_output={self.precheck_config['output_directory'] / 'outputs' / f"{self.gds_input_file_path.stem}_no_zero_areas.gds"}"""]
+        self.klayout_cmd_extra_args = ["-rd", f"""cleaned_output={self.precheck_config['output_directory'] / 'outputs' / f"{project_config['user_module']}_no_zero_areas.gds"}"""]
+
+    def cache_artifacts(self):
+        return super().cache_artifacts() + [f"outputs/{self.project_config['user_module']}_no_zero_areas.gds"]
 
 
 class License(CheckManager):
@@ -397,19 +607,20 @@ class License(CheckManager):
     __surname__ = 'License'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.license_check.license_check'
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
 
     def run(self):
-        license_check_result = license_check.verify_license_compliance(self.precheck_config['input_directory'])
+        license_check_result = self.implementation.verify_license_compliance(self.precheck_config['input_directory'])
         if license_check_result:
             logging.info("{{MAIN LICENSE CHECK PASSED}} An approved LICENSE was found in project root.")
         else:
             self.result = False
             logging.warning("{{MAIN LICENSE CHECK FAILED}} A prohibited LICENSE was found in project root.")
 
-        submodules_license_check_result = license_check.check_submodules_licenses(self.precheck_config['input_directory'])
+        submodules_license_check_result = self.implementation.check_submodules_licenses(self.precheck_config['input_directory'])
         if submodules_license_check_result:
             logging.info("{{SUBMODULES LICENSE CHECK PASSED}} No prohibited LICENSE file(s) was found in project submodules")
         else:
@@ -418,14 +629,14 @@ class License(CheckManager):
 
         third_party_libraries_path = self.precheck_config['input_directory'] / 'third_party'
         if third_party_libraries_path.exists():
-            third_party_libs_license_check_result = license_check.check_third_party_libs_licenses(third_party_libraries_path)
+            third_party_libs_license_check_result = self.implementation.check_third_party_libs_licenses(third_party_libraries_path)
             if third_party_libs_license_check_result:
                 logging.info("{{THIRD PARTY LIBRARIES LICENSE CHECK PASSED}} No prohibited LICENSE file(s) was found in project 'third_party' directory")
             else:
                 self.result = False
                 logging.warning("{{THIRD PARTY LIBRARIES LICENSE CHECK FAILED}} A prohibited LICENSE file(s) was found in project 'third_party' directory")
 
-        spdx_non_compliant_list = license_check.check_dir_spdx_compliance([], self.precheck_config['input_directory'], license_check_result)
+        spdx_non_compliant_list = self.implementation.check_dir_spdx_compliance([], self.precheck_config['input_directory'], license_check_result)
         if not spdx_non_compliant_list:
             logging.info("{{SPDX COMPLIANCE CHECK PASSED}} Project is compliant with the SPDX Standard")
         else:
@@ -444,16 +655,39 @@ class License(CheckManager):
                 sys.exit(253)
         return self.result
 
+    def cache_inputs(self):
+        # note: the files checked for SPDX compliance are identified by their size & modification time, license files by their content
+        license_check = self.implementation
+        files = {}
+        for root, dirs, names in os.walk(self.precheck_config['input_directory']):
+            dirs[:] = sorted(x for x in dirs if x not in ['.git', 'precheck_results'])
+            for path in [Path(root) / name for name in sorted(names)]:
+                relative_path = str(path.relative_to(self.precheck_config['input_directory']))
+                if path.name == license_check.LICENSE_FILENAME:
+                    files[relative_path] = file_hash(path)
+                elif not any(x in path.parent.parts for x in license_check.IGNORED_DIRS) and path.name not in license_check.IGNORED_FILES and path.suffix not in license_check.IGNORED_EXTS:
+                    stat = path.lstat()
+                    files[relative_path] = [stat.st_size, stat.st_mtime_ns]
+        return files
+
+    def cache_artifacts(self):
+        return ['logs/spdx_compliance_report.log']
+
 
 class MagicDRC(CheckManager):
     __ref__ = 'magic_drc'
     __surname__ = 'Magic DRC'
     __supported_pdks__ = ['sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.drc_checks.magic.magic_gds_drc_check'
+    __memory__ = 8
+    __cost__ = 3600
+    __memory_per_gds__ = 10
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
-        self.gds_input_file_path = self.precheck_config['input_directory'] / f"gds/{self.project_config['user_module']}.gds"
+        # note: the Magic DRC violations are reported without failing the precheck, the check always returns True
+        self.drc_clean = None
 
     def run(self):
         if not self.gds_input_file_path.exists():
@@ -461,7 +695,7 @@ class MagicDRC(CheckManager):
             logging.warning(f"{{{{MAGIC DRC CHECK FAILED}}}} The GDS file, {self.gds_input_file_path.name}, was not found.")
             return self.result
 
-        result = magic_gds_drc_check.magic_gds_drc_check(self.gds_input_file_path,
+        result = self.drc_clean = self.implementation.magic_gds_drc_check(self.gds_input_file_path,
                                                          self.project_config['user_module'],
                                                          self.precheck_config['pdk_path'],
                                                          self.precheck_config['output_directory'])
@@ -471,37 +705,54 @@ class MagicDRC(CheckManager):
             logging.warning(f"{{{{MAGIC DRC CHECK FAILED}}}} The GDS file, {self.gds_input_file_path.name}, has DRC violations.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(gds=self.precheck_config['run_info']['gds_hash'],
+                    script=golden_file_hash(CHECKS_ROOT / 'drc_checks/magic/magic_drc_check.tcl'))
+
+    def cache_result(self, result):
+        # note: only a DRC clean result is recorded, a GDS with Magic DRC violations runs the check again
+        return None if self.drc_clean is False else result
+
+    def cache_artifacts(self):
+        reports = [f"outputs/reports/magic_drc_check.{extension}" for extension in ['drc.report', 'rdb', 'tcl', 'tr', 'xml']]
+        return ["logs/magic_drc_check.log", "logs/magic_drc_check.total", f"outputs/{self.project_config['user_module']}.magic.drc.mag"] + reports
+
 
 class Makefile(CheckManager):
     __ref__ = 'makefile'
     __surname__ = 'Makefile'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.makefile_check'
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
 
     def run(self):
-        self.result = makefile_check.main(input_directory=self.precheck_config['input_directory'])
+        self.result = self.implementation.main(input_directory=self.precheck_config['input_directory'])
         if self.result:
             logging.info("{{MAKEFILE CHECK PASSED}} Makefile valid.")
         else:
             logging.warning("{{MAKEFILE CHECK FAILED}} Makefile file is not valid.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(makefile=file_hash(self.precheck_config['input_directory'] / 'Makefile'))
+
 
 class Manifest(CheckManager):
     __ref__ = 'manifest'
     __surname__ = 'Manifest'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.manifest_check'
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
 
     def run(self):
         caravel_root = self.precheck_config['caravel_root']
-        self.result = manifest_check.main(input_directory=caravel_root, output_directory=self.precheck_config['output_directory'], manifest_source='master')
+        self.result = self.implementation.main(input_directory=caravel_root, output_directory=self.precheck_config['output_directory'], manifest_source='master')
         if self.result:
             logging.info("{{MANIFEST CHECKS PASSED}} Manifest Checks Passed. Caravel version matches.")
         else:
@@ -514,48 +765,67 @@ class XOR(CheckManager):
     __surname__ = 'XOR'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD', 'sky130A', 'sky130B']
     __supported_type__ = ['analog', 'digital', 'openframe', 'mini']
+    __implementation__ = 'checks.xor_check.xor_check'
+    __cpus__ = 4
+    __memory__ = 4
+    __cost__ = 1800
+    __memory_per_gds__ = 4
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
-
-    def run(self):
         # TODO(nofal): This should be a single file across the entire precheck
-
+        self.magicrc_file_path = self.precheck_config['pdk_path'] / f"libs.tech/magic/{self.precheck_config['pdk_path'].name}.magicrc"
         if 'gf180mcu' in self.precheck_config['pdk_path'].stem:
-            magicrc_file_path = self.precheck_config['pdk_path'] / f"libs.tech/magic/{self.precheck_config['pdk_path'].name}.magicrc"
-            gds_golden_wrapper_file_path = Path(__file__).parent.parent / "_default_content/gds/user_project_wrapper_empty_gf180mcu.gds"
+            self.gds_golden_wrapper_file_path = Path(__file__).parent.parent / "_default_content/gds/user_project_wrapper_empty_gf180mcu.gds"
         elif self.project_config['type'] == "mini":
-            magicrc_file_path = self.precheck_config['pdk_path'] / f"libs.tech/magic/{self.precheck_config['pdk_path'].name}.magicrc"
-            gds_golden_wrapper_file_path = Path(__file__).parent.parent / "_default_content/gds/user_project_wrapper_mini4_empty.gds"
+            self.gds_golden_wrapper_file_path = Path(__file__).parent.parent / "_default_content/gds/user_project_wrapper_mini4_empty.gds"
         else:
-            magicrc_file_path = self.precheck_config['pdk_path'] / f"libs.tech/magic/{self.precheck_config['pdk_path'].name}.magicrc"
-            gds_golden_wrapper_file_path = self.precheck_config['caravel_root'] / f"gds/{self.project_config['golden_wrapper']}.gds"
-
-        self.result = xor_check.gds_xor_check(self.precheck_config['input_directory'],
-                                              self.precheck_config['output_directory'],
-                                              magicrc_file_path,
-                                              gds_golden_wrapper_file_path,
-                                              self.project_config,
-                                              self.precheck_config)
+            self.gds_golden_wrapper_file_path = self.precheck_config['caravel_root'] / f"gds/{self.project_config['golden_wrapper']}.gds"
+
+    def run(self):
+        self.result = self.implementation.gds_xor_check(self.precheck_config['input_directory'],
+                                                        self.precheck_config['output_directory'],
+                                                        self.magicrc_file_path,
+                                                        self.gds_golden_wrapper_file_path,
+                                                        self.project_config,
+                                                        self.precheck_config,
+                                                        self.gds_input_file_path,
+                                                        self.gds_index_path(),
+                                                        stop_on_first=self.precheck_config['fail_fast'],
+                                                        shard_memory=self.memory_estimate())
         if self.result:
             logging.info("{{XOR CHECK PASSED}} The GDS file has no XOR violations.")
         else:
             logging.warning("{{XOR CHECK FAILED}} The GDS file has non-conforming geometries.")
         return self.result
 
+    def cache_inputs(self):
+        xor_check_directory = CHECKS_ROOT / 'xor_check'
+        return dict(gds=self.precheck_config['run_info']['gds_hash'],
+                    golden_wrapper=golden_file_hash(self.gds_golden_wrapper_file_path),
+                    engine=self.implementation.XOR_ENGINE,
+                    scripts={script.name: golden_file_hash(script) for script in sorted(xor_check_directory.glob('*.tcl')) + sorted(xor_check_directory.glob('*.rb*'))})
+
+    def cache_artifacts(self):
+        artifacts = ["logs/xor_check.log", "logs/xor_check.total", f"outputs/{self.project_config['user_module']}.xor.gds", "outputs/reports/xor_check.json"]
+        if self.implementation.XOR_ENGINE == 'magic':
+            artifacts += [f"outputs/{self.project_config['user_module']}_erased.gds", f"outputs/{self.project_config['golden_wrapper']}_erased.gds"]
+        return artifacts
+
 
 class PDNMulti(CheckManager):
     __ref__ = 'pdnmulti'
     __surname__ = 'PDNMulti'
     __supported_pdks__ = ['gf180mcuC', 'gf180mcuD']
     __supported_type__ = ['digital']
+    __implementation__ = 'checks.pdn_check.pdn'
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
         self.config_file = self.precheck_config['input_directory'] / f"openlane/{self.project_config['user_module']}/config.json"
 
     def run(self):
-        self.result = run_pdn(self.config_file)
+        self.result = self.implementation.run_pdn(self.config_file)
 
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The design, {self.project_config['user_module']}, has no PDN PITCH violations.")
@@ -563,19 +833,23 @@ class PDNMulti(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The design, {self.project_config['user_module']}, has PDN PITCH violations.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(config=file_hash(self.config_file))
+
 
 class MetalCheck(CheckManager):
     __ref__ = 'metalcheck'
     __surname__ = 'MetalCheck'
     __supported_pdks__ = ['sky130A', 'sky130B']
     __supported_type__ = ['mini']
+    __implementation__ = 'checks.metal_check.metal_check'
+    __cost__ = 10
 
     def __init__(self, precheck_config, project_config):
         super().__init__(precheck_config, project_config)
-        self.gds_input_file_path = self.precheck_config['input_directory'] / f"gds/{self.project_config['user_module']}.gds"
 
     def run(self):
-        self.result = run_metal_check(self.gds_input_file_path)
+        self.result = self.implementation.run_metal_check(self.gds_input_file_path, self.gds_index_path(), self.project_config['type'])
 
         if self.result:
             logging.info(f"{{{{{self.__surname__} CHECK PASSED}}}} The design, {self.project_config['user_module']}, has no Metal 5 or Via 4.")
@@ -583,6 +857,9 @@ class MetalCheck(CheckManager):
             logging.warning(f"{{{{{self.__surname__} CHECK FAILED}}}} The design, {self.project_config['user_module']}, has Metal 5 or Via 4.")
         return self.result
 
+    def cache_inputs(self):
+        return dict(gds=self.precheck_config['run_info']['gds_hash'])
+
 # Note: list of checks for an public (open source) project
 open_source_checks = OrderedDict([
     (License.__ref__, License),
@@ -0,0 +1,189 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from checks.utils.file_cache import CACHE_SHARES, FileCache
+
+# Note: bump to invalidate all existing cache entries when the layout of an entry or the check results change
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIRECTORY = Path(os.environ.get('PRECHECK_CACHE', Path.home() / '.cache/mpw_precheck'))
+DEFAULT_CACHE_SIZE = 50  # GiB
+FINGERPRINTS_REPORT = 'outputs/reports/fingerprints.json'
+PRECHECK_ROOT = Path(__file__).parent.parent
+
+
+@functools.lru_cache(maxsize=None)
+def implementation_digest(module):
+    """Digest of the code of a check implementation module (see CheckManager.__implementation__): the module, the other
+    Python files of its package unless it is a top level module of checks/, and the helpers of checks/utils"""
+    module_path = PRECHECK_ROOT / f"{module.replace('.', '/')}.py"
+    files = [module_path] if module_path.parent == PRECHECK_ROOT / 'checks' else sorted(module_path.parent.rglob('*.py'))
+    digest = hashlib.sha1()
+    for path in files + sorted((PRECHECK_ROOT / 'checks/utils').glob('*.py')):
+        digest.update(str(path.relative_to(PRECHECK_ROOT)).encode('utf-8'))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def fingerprint(check):
+    """Digest of everything the check result depends on: the inputs declared by the check (`cache_inputs()`), the code
+    of the check, the PDK commits and the tool versions. None if the check does not declare its inputs or they can not be read."""
+    try:
+        inputs = check.cache_inputs()
+        if inputs is None:
+            return None
+        code = implementation_digest(check.__implementation__) if check.__implementation__ else None
+    except OSError:
+        return None
+    description = dict(check=check.__ref__,
+                       code=code,
+                       pdk=check.precheck_config['pdk_path'].name,
+                       type=check.project_config['type'],
+                       run_info={key: value for key, value in check.precheck_config['run_info'].items() if key != 'gds_hash'},
+                       inputs=inputs)
+    return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def restore_artifacts(source_directory, output_directory, artifacts):
+    for artifact in artifacts:
+        source = source_directory / artifact
+        target = output_directory / artifact
+        if source.resolve() != target.resolve():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source, target)
+
+
+class ResultCache(FileCache):
+    """Persistent, content addressed store of check results
+
+    A cache entry is keyed on the fingerprint of the check. An entry holds the check result and the artifacts
+    the check wrote into the output directory (`cache_artifacts()`). Only passing results of complete runs
+    are stored, entries are evicted least recently used first once the cache exceeds its size.
+
+    Arguments:
+        cache_directory: Directory of the precheck cache.
+        size: Size of the precheck cache in GiB, the result cache may use its CACHE_SHARES['results'] share.
+    """
+
+    def __init__(self, cache_directory, size):
+        super().__init__(Path(cache_directory) / f"results_v{CACHE_VERSION}", size * CACHE_SHARES['results'])
+
+    def restore(self, check, key):
+        """Restore the cached result of the check into the output directory, returns None on a cache miss"""
+        if key is None:
+            return None
+        entry = self.cache_directory / key
+        try:
+            with open(entry / 'result.json') as f:
+                cached = json.load(f)
+            restore_artifacts(entry / 'artifacts', check.precheck_config['output_directory'], cached['artifacts'])
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            return None
+        logging.info(f"{{{{CACHE HIT}}}} {check.__surname__} result restored from cache entry {key[:12]} in {self.cache_directory}")
+        logging.info(f"{{{{{check.__surname__} CHECK PASSED}}}} The inputs of the check are identical to a previously passing run.")
+        return cached['result']
+
+    def contains(self, check, key):
+        """Whether the result of the check can be restored from the cache"""
+        return key is not None and (self.cache_directory / key / 'result.json').exists()
+
+    def store(self, check, key, result):
+        if result is not True or key is None:
+            return
+        artifacts = list(check.cache_artifacts())
+        if not all((check.precheck_config['output_directory'] / artifact).exists() for artifact in artifacts):
+            return
+        try:
+            staging = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=self.cache_directory))
+            size = 0
+            for artifact in artifacts:
+                target = staging / 'artifacts' / artifact
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(check.precheck_config['output_directory'] / artifact, target)
+                size += target.stat().st_size
+            with open(staging / 'result.json', 'w') as f:
+                json.dump(dict(check=check.__ref__, result=result, artifacts=artifacts, size=size, created=time.time()), f)
+            try:
+                staging.rename(self.cache_directory / key)
+            except OSError:  # note: an entry for the same key was stored concurrently
+                shutil.rmtree(staging, ignore_errors=True)
+            self.evict()
+        except OSError as e:
+            logging.warning(f"{{{{CACHE}}}} Failed to store the {check.__surname__} result in the cache: {e}")
+
+    def entry_size(self, entry):
+        with open(entry / 'result.json') as f:
+            return json.load(f)['size']
+
+class IncrementalRun:
+    """Verdicts & reports of a previous precheck run, reused for the checks whose fingerprint is unchanged
+
+    Every run records the fingerprint, the result and the artifacts of its checks in FINGERPRINTS_REPORT,
+    passing and failing verdicts of the previous run are both reused.
+
+    Arguments:
+        previous_output_directory: Output directory of the previous run.
+    """
+
+    def __init__(self, previous_output_directory):
+        self.previous_output_directory = Path(previous_output_directory)
+        try:
+            with open(self.previous_output_directory / FINGERPRINTS_REPORT) as f:
+                self.checks = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"{{{{INCREMENTAL}}}} No fingerprints of a previous run were found in {self.previous_output_directory}, all checks are executed: {e}")
+            self.checks = {}
+
+    def contains(self, check, key):
+        """Whether the previous result of the check can be reused"""
+        previous = self.checks.get(check.__ref__)
+        return key is not None and previous is not None and previous['key'] == key and previous['result'] in [True, False]
+
+    def restore(self, check, key):
+        """Restore the previous result of the check into the output directory, returns None if the check has to be executed"""
+        if not self.contains(check, key):
+            return None
+        previous = self.checks[check.__ref__]
+        try:
+            restore_artifacts(self.previous_output_directory, check.precheck_config['output_directory'], previous['artifacts'])
+        except OSError:
+            return None
+        logging.info(f"{{{{INCREMENTAL}}}} {check.__surname__} inputs are unchanged since {self.previous_output_directory}, the previous result is reused")
+        if previous['result']:
+            logging.info(f"{{{{{check.__surname__} CHECK PASSED}}}} The inputs of the check are identical to the previous passing run.")
+        else:
+            logging.warning(f"{{{{{check.__surname__} CHECK FAILED}}}} The inputs of the check are identical to the previous failing run, see {self.previous_output_directory / 'logs/precheck.log'}.")
+        return previous['result']
+
+    @staticmethod
+    def save(output_directory, checks, keys, results):
+        fingerprints = {}
+        for check, key in zip(checks, keys):
+            result = check.cache_result(results.get(check.__surname__))
+            if key is not None and result in [True, False]:
+                artifacts = [artifact for artifact in check.cache_artifacts() if (output_directory / artifact).exists()]
+                fingerprints[check.__ref__] = dict(key=key, result=result, artifacts=artifacts)
+        with open(output_directory / FINGERPRINTS_REPORT, 'w') as f:
+            json.dump(fingerprints, f, indent=2)
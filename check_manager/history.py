@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+# Note: weight of the latest run in the moving average of a measurement
+HISTORY_WEIGHT = 0.5
+
+
+class RunHistory:
+    """Resource usage of the checks measured in previous runs, used to estimate the cost of the next run
+
+    The history holds a moving average of the wall time and the peak RSS of the tools of every check (and of the wall
+    time of every tool of the check, per call), it is updated with
+    the usage records of the scheduler (see checks.utils.process.measure) of complete runs only, results
+    restored from the result cache and cancelled checks are not accounted.
+
+    Arguments:
+        history_path: JSON file the history is persisted in.
+    """
+
+    def __init__(self, history_path):
+        self.history_path = Path(history_path)
+        try:
+            with open(self.history_path) as f:
+                self.checks = json.load(f)
+        except (OSError, ValueError):
+            self.checks = {}
+
+    def wall(self, check):
+        return self.checks.get(check.__ref__, {}).get('wall')
+
+    def peak_rss(self, check):
+        return self.checks.get(check.__ref__, {}).get('tool_peak_rss')
+
+    def tools(self, check):
+        return self.checks.get(check.__ref__, {}).get('tools', {})
+
+    def update(self, checks, usage):
+        for check, record in zip(checks, usage):
+            if record is None or record.get('cached') or record.get('cancelled'):
+                continue
+            measured = self.checks.setdefault(check.__ref__, {})
+            # note: tool_peak_rss replaces the peak_rss of older histories, which included the peak RSS of the precheck process
+            measured.pop('peak_rss', None)
+            for key, value in [('wall', record['wall']), ('tool_peak_rss', record['peak_rss'])]:
+                measured[key] = value if key not in measured else HISTORY_WEIGHT * value + (1 - HISTORY_WEIGHT) * measured[key]
+            walls = {}
+            for tool in record['tools']:
+                walls.setdefault(tool['name'], []).append(tool['wall'])
+            tools = measured.setdefault('tools', {})
+            for name, wall in walls.items():
+                wall = sum(wall) / len(wall)
+                tools[name] = wall if name not in tools else HISTORY_WEIGHT * wall + (1 - HISTORY_WEIGHT) * tools[name]
+
+    def save(self):
+        try:
+            self.history_path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=self.history_path.parent, delete=False) as f:
+                json.dump(self.checks, f, indent=2, sort_keys=True)
+            os.replace(f.name, self.history_path)
+        except OSError as e:
+            logging.warning(f"{{{{HISTORY}}}} Failed to save the run history to {self.history_path}: {e}")
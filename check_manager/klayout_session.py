@@ -0,0 +1,87 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+import threading
+import time
+
+from check_manager.cache import fingerprint
+from checks.utils import process
+
+# Note: run the decks of the KLayout DRC checks in a single KLayout process (PRECHECK_KLAYOUT_SESSION=off runs every
+# deck in a process of its own)
+KLAYOUT_SESSION = os.environ.get('PRECHECK_KLAYOUT_SESSION', 'on') != 'off'
+
+
+class KlayoutSession:
+    """Single KLayout process running the decks of the KLayout DRC checks (FEOL, BEOL, Offgrid, density, ...) on one
+    read of the user GDS
+
+    The first of the checks to run executes, in one session, its deck and the decks of the other checks that are
+    neither done nor restored from the cache or the previous run. The other checks pick their result up once they run.
+    Every check keeps its own log, report & total; the decks the session did not complete run in a process of their own.
+    The usage of the session is split between the checks by the time their deck took, every check accounts its share.
+
+    The checks wait for the session while holding their allocation, a session is only used for sequential runs.
+
+    Arguments:
+        checks: The KLayout DRC checks of the sequence.
+        stores: ResultCache / IncrementalRun the results of the checks may be restored from (None entries are ignored).
+    """
+
+    def __init__(self, checks, stores=()):
+        self.checks = checks
+        self.stores = [store for store in stores if store]
+        self.results = {}
+        self.usage = {}
+        self.done = set()
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def restorable(self, check):
+        if not self.stores:
+            return False
+        key = fingerprint(check)
+        return any(store.contains(check, key) for store in self.stores)
+
+    def run(self, check):
+        """Result of the deck of the check, None if the check has to run its deck in a process of its own"""
+        with self.lock:
+            if check.__ref__ not in self.results and not self.failed:
+                batch = [x for x in self.checks if x is check or (x.__ref__ not in self.done and x.__ref__ not in self.results and not self.restorable(x))]
+                if len(batch) < 2:
+                    return None
+                logging.info(f"{{{{KLAYOUT SESSION}}}} Running the decks of {[x.__surname__ for x in batch]} in a single KLayout process")
+                start = time.monotonic()
+                results, seconds = check.implementation.klayout_drc_session([(x.__ref__, x.drc_script_path, x.klayout_cmd_extra_args) for x in batch],
+                                                                   check.gds_input_file_path,
+                                                                   check.precheck_config['output_directory'])
+                logging.info(f"{{{{KLAYOUT SESSION}}}} {len(results)} of {len(batch)} decks completed in {time.monotonic() - start:.1f}s")
+                self.results.update(results)
+                total = sum(seconds.values())
+                if total > 0:
+                    self.usage.update(process.share_last_tool({x: seconds.get(x, 0) / total for x in results if x != check.__ref__}))
+                # note: a session that did not complete all its decks is not started again, the decks it left run in processes of their own
+                self.failed = len(results) < len(batch)
+            if check.__ref__ in self.usage:
+                process.account(self.usage.pop(check.__ref__))
+            return self.results.pop(check.__ref__, None)
+
+    def release(self, check):
+        with self.lock:
+            self.done.add(check.__ref__)
+            self.results.pop(check.__ref__, None)
+            self.usage.pop(check.__ref__, None)
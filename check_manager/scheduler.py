@@ -0,0 +1,376 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import math
+import os
+import signal
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import precheck_logger
+from check_manager.cache import fingerprint
+from checks.utils import process
+
+
+# Note: (limit, usage, events) files of the memory controller of cgroup v2 & v1
+CGROUP_MEMORY_FILES = [('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current', '/sys/fs/cgroup/memory.events'),
+                       ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes', '/sys/fs/cgroup/memory/memory.oom_control')]
+# Note: CPU bandwidth limit files of cgroup v2 ('<quota> <period>' or 'max <period>') & v1 (quota, -1 if unlimited, and period)
+CGROUP_CPU_V2_FILE = '/sys/fs/cgroup/cpu.max'
+CGROUP_CPU_V1_FILES = ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', '/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+# Note: exit codes of a tool (or of the shell running it) killed by SIGKILL, which is what the OOM killer sends
+OOM_KILL_RETURNCODES = [-signal.SIGKILL, 128 + signal.SIGKILL]
+
+
+def cgroup_cpu_quota():
+    """Number of CPUs the CPU bandwidth limit of the cgroup of the process amounts to, None if it is not limited"""
+    try:
+        with open(CGROUP_CPU_V2_FILE) as f:
+            quota, period = f.read().split()
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(CGROUP_CPU_V1_FILES[0]) as quota_file, open(CGROUP_CPU_V1_FILES[1]) as period_file:
+            quota, period = int(quota_file.read()), int(period_file.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpu_set():
+    """CPUs the process may run on (sched affinity), reduced to the CPU bandwidth limit of the cgroup"""
+    try:
+        cpu_set = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cpu_set = list(range(os.cpu_count()))
+    quota = cgroup_cpu_quota()
+    return cpu_set[:max(1, math.ceil(quota))] if quota else cpu_set
+
+
+def available_cpus():
+    return len(available_cpu_set())
+
+
+def partition_cpus(parts):
+    """Split the available CPUs into `parts` contiguous CPU sets of (nearly) the same size, CPUs are shared if there are fewer than parts"""
+    cpu_set = available_cpu_set()
+    if parts >= len(cpu_set):
+        return [[cpu_set[index % len(cpu_set)]] for index in range(parts)]
+    bounds = [round(index * len(cpu_set) / parts) for index in range(parts + 1)]
+    return [cpu_set[bounds[index]:bounds[index + 1]] for index in range(parts)]
+
+
+def format_cpus(cpus):
+    """Compact form of a CPU set, e.g. '0-3,8'"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f"{first}-{last}" if last > first else f"{first}" for first, last in ranges)
+
+
+class CpuAllocator:
+    """Hands out CPUs of a CPU set to the checks, the least used CPUs first
+
+    The scheduler only runs checks whose `__cpus__` fit into its CPU budget, so the allocated CPUs are normally
+    exclusive; a budget larger than the CPU set makes checks share the least used CPUs.
+    """
+
+    def __init__(self, cpu_set):
+        self.cpu_set = list(cpu_set)
+        self.users = {cpu: 0 for cpu in self.cpu_set}
+
+    def free(self):
+        return [cpu for cpu in self.cpu_set if self.users[cpu] == 0]
+
+    def allocate(self, count):
+        cpus = sorted(sorted(self.cpu_set, key=lambda cpu: self.users[cpu])[:max(1, min(count, len(self.cpu_set)))])
+        for cpu in cpus:
+            self.users[cpu] += 1
+        return cpus
+
+    def release(self, cpus):
+        for cpu in cpus:
+            self.users[cpu] -= 1
+
+
+def cgroup_available_memory():
+    """Memory in GiB left before reaching the memory limit of the cgroup of the process, None if it is not limited"""
+    for limit_path, usage_path, _ in CGROUP_MEMORY_FILES:
+        try:
+            with open(limit_path) as limit_file, open(usage_path) as usage_file:
+                limit = limit_file.read().strip()
+                usage = int(usage_file.read().strip())
+        except (OSError, ValueError):
+            continue
+        # note: cgroup v1 reports an unlimited cgroup with a huge limit
+        if limit == 'max' or int(limit) >= 2 ** 60:
+            return None
+        return max(0, int(limit) - usage) / 1024 ** 3
+    return None
+
+
+def available_memory():
+    """Available memory in GiB, the available host memory (/proc/meminfo) capped by the cgroup memory limit"""
+    try:
+        with open('/proc/meminfo') as f:
+            host_memory = next(int(line.split()[1]) / 1024 ** 2 for line in f if line.startswith('MemAvailable:'))
+    except (OSError, StopIteration):
+        host_memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 3
+    cgroup_memory = cgroup_available_memory()
+    return host_memory if cgroup_memory is None else min(host_memory, cgroup_memory)
+
+
+def oom_kills():
+    """Number of processes of the cgroup killed by the OOM killer so far, 0 if it is not reported"""
+    for _, _, events_path in CGROUP_MEMORY_FILES:
+        try:
+            with open(events_path) as f:
+                for line in f:
+                    if line.startswith('oom_kill '):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            continue
+    return 0
+
+
+class CheckScheduler:
+    """Runs the precheck sequence as a dependency graph of checks
+
+    Independent checks are executed concurrently as long as the sum of their declared CPUs (`__cpus__`) and
+    memory estimates (see CheckManager.memory_estimate) fits into the budget, and the memory estimate of
+    the next check fits into the memory available at that time. A check is allocated its declared CPUs and its
+    memory estimate, the last check to start gets the CPUs and memory the checks in flight leave (checks running
+    several tools at once size them to it, see checks.utils.process.concurrent_tools). A check waits for the
+    checks listed in its `__depends_on__` that are part of the sequence. The log output of every check is released in
+    sequence order, so it is identical to a sequential run regardless of completion order. A check whose
+    tools were killed by the OOM killer is executed again once, alone.
+
+    In fail fast mode the checks are ordered by their cost (measured in previous runs, else estimated by
+    `__cost__`) and the first failing check stops the run: pending checks are skipped and the tools of
+    the checks in flight are terminated. Skipped and cancelled checks have a None result.
+
+    Arguments:
+        checks: Ordered list of CheckManager instances.
+        jobs: Maximum number of checks running at the same time.
+        cpus: CPU budget, defaults to the CPUs available to the process.
+        memory: Memory budget in GiB, defaults to the available host memory.
+        cache: ResultCache used to skip checks whose inputs did not change, None disables caching.
+        previous: IncrementalRun whose results are reused for the checks whose inputs did not change, None executes all checks.
+        fail_fast: Stop the run once a check failed.
+        history: RunHistory providing the measured cost & memory of the checks, None to only use the estimates.
+
+    Attributes:
+        usage: Resource usage (see checks.utils.process.measure) of every check, in sequence order.
+        fingerprints: Fingerprint of the inputs of every check taken before it ran (see check_manager.cache.fingerprint).
+    """
+
+    def __init__(self, checks, jobs=1, cpus=None, memory=None, cache=None, fail_fast=False, history=None, previous=None):
+        self.checks = self.order_by_cost(checks, history) if fail_fast else checks
+        self.cache = cache
+        self.previous = previous
+        self.fail_fast = fail_fast
+        self.token = process.CancelToken()
+        self.jobs = max(1, jobs)
+        self.cpus = cpus if cpus else available_cpus()
+        self.memory = memory if memory else available_memory()
+        self.allocator = CpuAllocator(available_cpu_set()[:self.cpus])
+        self.history = history
+        self.estimates = [check.memory_estimate(history) for check in self.checks]
+        self.exclusive = set()
+        # note: checks in flight, and checks that ran while another check was in flight (the OOM kills of the cgroup can not be attributed to them)
+        self.in_flight = set()
+        self.overlapped = set()
+        self.flight_lock = threading.Lock()
+        refs = [check.__ref__ for check in self.checks]
+        self.dependencies = [[refs.index(ref) for ref in check.__depends_on__ if ref in refs] for check in self.checks]
+        self.usage = [None] * len(self.checks)
+        self.fingerprints = [None] * len(self.checks)
+
+    @staticmethod
+    def order_by_cost(checks, history=None):
+        """Order the checks cheapest first, a check is never placed before the checks it depends on"""
+        def cost(check):
+            measured = history.wall(check) if history else None
+            return measured if measured is not None else check.__cost__
+
+        ordered = []
+
+        def place(check):
+            if check in ordered:
+                return
+            for dependency in [x for x in checks if x.__ref__ in check.__depends_on__]:
+                place(dependency)
+            ordered.append(check)
+
+        for check in sorted(checks, key=cost):
+            place(check)
+        return ordered
+
+    def run(self):
+        if self.fail_fast:
+            logging.info(f"{{{{FAIL FAST}}}} Checks ordered by cost, the run stops at the first failing check")
+        quota = cgroup_cpu_quota()
+        logging.info(f"{{{{CPU ALLOCATION}}}} Checks run on CPUs {format_cpus(self.allocator.cpu_set)} (affinity: {format_cpus(os.sched_getaffinity(0))}, cgroup quota: {f'{quota:g} CPUs' if quota else 'unlimited'})")
+        if self.jobs == 1:
+            results = []
+            for index, check in enumerate(self.checks):
+                results.append(None if self.token.cancelled else self._run_check(index, check, self.allocator.cpu_set, self.memory))
+                if self.fail_fast and results[-1] is False:
+                    self.token.cancel()
+        else:
+            logging.info(f"{{{{SCHEDULER}}}} Running up to {self.jobs} checks concurrently within {self.cpus} CPUs and {self.memory:.1f} GiB of memory")
+            with precheck_logger.ordered_output() as output:
+                results = self._run_concurrently(output)
+        return {check.__surname__: result for check, result in zip(self.checks, results)}
+
+    def _run_check(self, index, check, cpus, memory):
+        logging.info(f"{{{{STEP UPDATE}}}} Executing Check {index + 1} of {len(self.checks)}: {check.__surname__}")
+        logging.info(f"{{{{CPU ALLOCATION}}}} {check.__surname__}: {len(cpus)} CPU(s) {format_cpus(cpus)}")
+        oom_kills_before = oom_kills()
+        with self.flight_lock:
+            self.overlapped.discard(index)
+            if self.in_flight:
+                self.overlapped.update(self.in_flight | {index})
+            self.in_flight.add(index)
+        expected = self.history.tools(check) if self.history else None
+        with process.measure(check.__surname__, expected) as self.usage[index], process.cancellable(self.token), process.allocated(cpus, memory):
+            self.usage[index]['cpus'] = format_cpus(cpus)
+            try:
+                key = self.fingerprints[index] = fingerprint(check)
+                result = self._restore(check, key)
+                if result is None:
+                    result = check.run()
+                    if self.cache:
+                        self.cache.store(check, key, check.cache_result(result))
+                else:
+                    self.usage[index]['cached'] = True
+            except process.CheckCancelled:
+                result = None
+            finally:
+                check.release()
+                with self.flight_lock:
+                    self.in_flight.discard(index)
+                    alone = index not in self.overlapped
+            # note: a check failing after the run was cancelled most likely failed because its tools were terminated
+            if self.token.cancelled and result is False:
+                result = None
+            self.usage[index]['result'] = result
+            if result is None:
+                self.usage[index]['cancelled'] = True
+                logging.warning(f"{{{{FAIL FAST}}}} {check.__surname__} was cancelled")
+            elif result is False and ((alone and oom_kills() > oom_kills_before) or
+                                      any(tool.get('returncode') in OOM_KILL_RETURNCODES and not tool.get('hung') for tool in self.usage[index]['tools'])):
+                self.usage[index]['oom_killed'] = True
+                logging.warning(f"{{{{OOM}}}} The tools of {check.__surname__} were killed, most likely by the OOM killer (estimated memory: {self.estimates[index]:.1f} GiB)")
+        return result
+
+    def _restore(self, check, key):
+        for store in [self.previous, self.cache]:
+            result = store.restore(check, key) if store else None
+            if result is not None:
+                return result
+        return None
+
+    def _execute(self, output, index, check, cpus, memory):
+        output.bind(index)
+        try:
+            return self._run_check(index, check, cpus, memory)
+        finally:
+            output.unbind()
+
+    def _allocate(self, index, pending):
+        """CPUs of a check admitted to run: its declared CPUs, all free CPUs if no other check is left to start, all CPUs if it runs alone"""
+        if index in self.exclusive:
+            count = len(self.allocator.cpu_set)
+        elif any(x != index for x in pending):
+            count = self.checks[index].__cpus__
+        else:
+            count = max(self.checks[index].__cpus__, len(self.allocator.free()))
+        return self.allocator.allocate(count)
+
+    def _memory(self, index, pending, running):
+        """GiB of memory of a check admitted to run: its estimate, the memory the checks in flight leave if no other check is left to start"""
+        if index in self.exclusive:
+            return self.memory
+        if any(x != index for x in pending):
+            return self.estimates[index]
+        return max(self.estimates[index], self.memory - sum(self.estimates[x] for x in running.values()))
+
+    def _fits(self, index, running):
+        if not running:
+            return True
+        if len(running) >= self.jobs or index in self.exclusive or self.exclusive.intersection(running.values()):
+            return False
+        cpus = sum(self.checks[x].__cpus__ for x in running.values())
+        memory = sum(self.estimates[x] for x in running.values())
+        if cpus + self.checks[index].__cpus__ > self.cpus or memory + self.estimates[index] > self.memory:
+            return False
+        # note: the checks in flight may not have reached their peak memory yet, the estimate has to fit into what is left now as well
+        return self.estimates[index] <= available_memory()
+
+    def _run_concurrently(self, output):
+        pending = list(range(len(self.checks)))
+        running = {}
+        finished = {}
+        allocations = {}
+        head = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                for index in list(pending):
+                    if not all(dependency in finished for dependency in self.dependencies[index]):
+                        continue
+                    if not self._fits(index, running):
+                        if index in self.exclusive:
+                            # note: no other check is admitted, the checks in flight drain and the exclusive check starts next
+                            break
+                        continue
+                    if index not in output.slots:
+                        output.open(index, live=index == head)
+                    allocations[index] = self._allocate(index, pending)
+                    memory = self._memory(index, pending, running)
+                    running[executor.submit(self._execute, output, index, self.checks[index], allocations[index], memory)] = index
+                    pending.remove(index)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    self.allocator.release(allocations.pop(index))
+                    if index not in self.exclusive and future.exception() is None and self.usage[index].get('oom_killed'):
+                        # note: re-run the check alone, it is admitted once the checks in flight finished
+                        self.exclusive.add(index)
+                        pending.insert(0, index)
+                        continue
+                    finished[index] = future
+                    if self.fail_fast and not self.token.cancelled and future.exception() is None and future.result() is False:
+                        self.token.cancel()
+                        for index in pending:
+                            output.open(index)
+                            finished[index] = Future()
+                            finished[index].set_result(None)
+                        pending = []
+
+                while head in finished:
+                    output.close(head)
+                    head += 1
+                    if head in output.slots:
+                        output.release(head)
+                    # re-raise failures (incl. sys.exit) of a check once its output has been released
+                    finished[head - 1].result()
+        return [finished[index].result() for index in range(len(self.checks))]
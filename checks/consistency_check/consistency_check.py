@@ -14,6 +14,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import functools
 import logging
 import os
 import sys
@@ -25,12 +26,14 @@ try:
     from checks.consistency_check.netlist_checker import NetlistChecker, NetlistChecks
     from checks.consistency_check.parsers.layout_parser import LayoutParser
     from checks.consistency_check.parsers.netlist_parser import get_netlist_parser, VerilogParser
+    from checks.utils.gds import GdsError
 except ImportError:
     from parsers import netlist_parser
     from parsers import layout_parser
     from netlist_checker import NetlistChecker, NetlistChecks
     from parsers.layout_parser import LayoutParser
     from parsers.netlist_parser import get_netlist_parser, VerilogParser
+    from utils.gds import GdsError
 
 # pdk specific
 LIBS = ["hd", "hdll", "hs", "lp", "ls", "ms", "hvl"]
@@ -47,12 +50,29 @@ USER_BANNED_POWER = MGMT_POWER + [net + "_core" for net in MGMT_POWER]
 USER_POWER_PINS = ["vccd1", "vccd2", "vdda1", "vdda2", "vssa1", "vssa2", "vssd1", "vssd2"]
 
 
+@functools.lru_cache(maxsize=8)
+def _parse_golden_netlist(netlist, top_module, netlist_type, include_files, mtimes):
+    return get_netlist_parser(netlist, top_module, netlist_type, include_files=list(include_files), preprocess_define=PREPROCESS_DEFINES)
+
+
+def get_golden_netlist_parser(netlist, top_module, netlist_type, include_files):
+    """Parser of a read-only golden netlist (top netlist, golden wrapper netlist), kept for the later runs of the process
+
+    The netlist is parsed again only if it or one of its include files was modified.
+    """
+    mtimes = tuple(Path(path).stat().st_mtime_ns for path in [netlist] + include_files)
+    return _parse_golden_netlist(netlist, top_module, netlist_type, tuple(include_files), mtimes)
+
+
 def main(*args, **kwargs):
     input_directory = kwargs["input_directory"]
     output_directory = kwargs["output_directory"]
     project_config = kwargs["project_config"]
     golden_wrapper_netlist = kwargs["golden_wrapper_netlist"]
     defines_file_path = kwargs["defines_file_path"]
+    gds_index_path = kwargs.get("gds_index_path")
+    # note: the user GDS may be given as its staged copy, the GDS index is keyed on the GDS the checks read
+    user_wrapper_gds = kwargs.get("gds_input_file_path") or input_directory / f"gds/{project_config['user_module']}.gds"
     include_files = [str(defines_file_path)]
 
     for path in [input_directory, project_config['user_netlist'], project_config['top_netlist'], golden_wrapper_netlist, defines_file_path]:
@@ -81,18 +101,17 @@ def main(*args, **kwargs):
 
     # Parse netlists (spice/verilog)
     try:
-        top_netlist_parser = get_netlist_parser(project_config['top_netlist'], project_config['top_module'], project_config['netlist_type'], include_files=include_files, preprocess_define=PREPROCESS_DEFINES)
+        top_netlist_parser = get_golden_netlist_parser(project_config['top_netlist'], project_config['top_module'], project_config['netlist_type'], include_files)
         user_netlist_parser = get_netlist_parser(project_config['user_netlist'], project_config['user_module'], project_config['netlist_type'], include_files=include_files, preprocess_define=PREPROCESS_DEFINES)
-        golden_wrapper_parser = VerilogParser(golden_wrapper_netlist, project_config['user_module'], include_files=include_files, preprocess_define=PREPROCESS_DEFINES)
+        golden_wrapper_parser = get_golden_netlist_parser(golden_wrapper_netlist, project_config['user_module'], 'verilog', include_files)
     except netlist_parser.DataError as e:
         logging.fatal(f"{{{{PARSING NETLISTS FAILED}}}} The provided {project_config['netlist_type']} netlists fail parsing because: {str(e)}")
         return False
 
     # Parse layout
-    user_wrapper_gds = input_directory / f"gds/{project_config['user_module']}.gds"
     try:
-        user_layout_parser = LayoutParser(user_wrapper_gds, project_config['user_module'])
-    except (layout_parser.DataError, RuntimeError) as e:
+        user_layout_parser = LayoutParser(user_wrapper_gds, project_config['user_module'], gds_index_path)
+    except (layout_parser.DataError, GdsError, OSError) as e:
         logging.fatal(f"{{{{PARSING LAYOUT FAILED}}}} The {project_config['user_module']} layout fails parsing because: {str(e)}")
         return False
 
@@ -13,7 +13,10 @@
 # limitations under the License.
 # SPDX-License-Identifier: Apache-2.0
 
-import klayout.db as pya
+try:
+    from checks.utils.gds import structure_index
+except ImportError:
+    from utils.gds import structure_index
 
 
 class DataError(Exception):
@@ -26,42 +29,38 @@ class LayoutParser:
     Arguments:
         layout_path: Path to layout file.
         top_module: Layout Top module name.
+        index_path: File the structure index of layout_path is persisted in (optional).
 
     Attributes:
-        layout: Klayout layout object.
+        index: Structure index (GdsIndex) of the layout, the geometry is not loaded.
         top_module: Top module name.
         cell_names: list of top module cell names.
-        cells: List of top cell subcell objects.
     """
 
-    def __init__(self, layout_path, top_module):
+    def __init__(self, layout_path, top_module, index_path=None):
         """Create LayoutParser instance"""
-        self.layout = None
+        self.index = structure_index(layout_path, index_path)
         self.top_module = top_module
         self.cell_names = []
-        self.cells = []
 
-        self.layout = pya.Layout()
-        self.layout.read(str(layout_path))
-        top_cell = self.layout.top_cell()
-
-        if top_cell.name != top_module:
+        top_cells = self.index.top_cells()
+        if len(top_cells) > 1:
+            raise DataError(f"Layout {layout_path} contains multiple top cells: {top_cells}.")
+        if top_cells != [top_module]:
             raise DataError(f"Top module: {top_module} is not found in {layout_path}.")
 
-        for node in top_cell.each_child_cell():
-            cell = self.layout.cell(node)
-            self.cell_names.append(cell.name)
-            self.cells.append(cell)
+        for cell_name in self.index.children(top_module):
+            self.cell_names.append(cell_name)
 
-            is_empty = cell.is_empty()
+            is_empty = self.index.is_empty(cell_name)
             if is_empty:
-                raise DataError(f"Layout {layout_path} contains empty cell: {cell.name}.")
+                raise DataError(f"Layout {layout_path} contains empty cell: {cell_name}.")
 
             # Make sure that all subcells are part of the file 
             # TODO: flatten layout to catch all ghost cells
-            is_ghost = cell.is_ghost_cell()
+            is_ghost = cell_name not in self.index.cells
             if is_ghost:
-                raise DataError(f"Layout {layout_path} contains a ghost cell: {cell.name}.")
+                raise DataError(f"Layout {layout_path} contains a ghost cell: {cell_name}.")
 
     def get_children(self):
         """Get List of top module child cells names """
@@ -69,17 +68,7 @@ class LayoutParser:
 
     def get_grandchildren(self, cell_name):
         """Get List of child cells names for the given cell"""
-        try:
-            indx = self.cell_names.index(cell_name)
-        except ValueError:
+        if cell_name not in self.cell_names:
             return []
 
-        grandchildren = []
-        cell = self.cells[indx]
-        subcells = cell.each_child_cell()
-
-        for cell in subcells:
-            cell_name = self.layout.cell(cell).name
-            grandchildren.append(cell_name)
-
-        return grandchildren
+        return self.index.children(cell_name)
@@ -21,9 +21,9 @@ from pathlib import Path
 from strsimpy.sorensen_dice import SorensenDice
 
 try:
-    from checks.utils.utils import is_binary_file, file_hash, is_not_binary_file
+    from checks.utils.utils import is_binary_file, file_hashes, is_not_binary_file
 except ImportError:
-    from utils.utils import is_binary_file, file_hash, is_not_binary_file
+    from utils.utils import is_binary_file, file_hashes, is_not_binary_file
 
 EXCLUDES = []
 VIEWS = ['gds']
@@ -62,6 +62,8 @@ def has_default_content(input_directory, default_content_path):
     result = True
     for view in VIEWS:
         try:
+            # note: the binary files are hashed once, in parallel, instead of once per default/target pair
+            binary_files_hashes = file_hashes(Path(x) for x in get_updated_view(input_directory, view) + get_default_view(default_content_path, view) if is_binary_file(x))
             for target_file in get_updated_view(input_directory, view):
                 target_file = Path(target_file)
                 for default_file in get_default_view(default_content_path, view):
@@ -75,7 +77,7 @@ def has_default_content(input_directory, default_content_path):
                                 logging.warning(f"The provided {target_file.name} is too similar to the default file {default_file.name}")
                                 result = False
                         elif is_binary_file(default_file) and is_binary_file(target_file):
-                            if file_hash(default_file) == file_hash(target_file):
+                            if binary_files_hashes[target_file] is not None and binary_files_hashes[default_file] == binary_files_hashes[target_file]:
                                 logging.warning(f"The provided {target_file.name} is identical to the default file {default_file.name}")
                                 result = False
         except FileNotFoundError as not_found_error:
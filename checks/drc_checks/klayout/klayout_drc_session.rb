@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+# usage: klayout -b -r klayout_drc_session.rb -rd plan=<plan.json>
+#
+# Runs several DRC decks in a single KLayout process: the layout is read once and every deck gets it as $input
+# (DRC source() accepts a RBA::Layout as well as a file name). Each deck runs with the -rd variables of its check,
+# the variables set for the previous deck and not for this one are reset first ("false" for switches, nil otherwise).
+#
+# The plan (written by klayout_gds_drc_check.klayout_drc_session) holds the input GDS and the decks:
+#   {"input": "<gds>", "decks": [{"name": "<check>", "script": "<deck>", "variables": {"<name>": "<value>", ...}}, ...]}
+#
+# The plan of a tile (see klayout_drc_tiles) also holds the top cell and the box [l, b, r, t] (database units, null
+# edges are unbounded) the top cell is clipped to before the decks run. The clipped cell takes the name of the top cell.
+#
+# Every deck is framed by '--- Running deck <name> ---' and '--- Finished deck <name>: status <status> ---' lines, the
+# status is the exit status the deck would have had in a process of its own. Decks without a 'Finished' line did not
+# complete and are run again in their own process: a deck raising an error in the session is such a deck, the error may
+# come from the session itself (e.g. a deck not taking a layout as $input) rather than from the user GDS.
+
+require 'json'
+
+STDOUT.sync = true
+
+# note: decks ending with 'exit $errs' would end the whole session, their exit status is kept for the deck instead
+class DeckExit < StandardError
+  attr_reader :status
+
+  def initialize(status)
+    super("deck exited with status #{status}")
+    @status = status
+  end
+end
+
+DRC::DRCEngine.class_eval do
+  def exit(status = true)
+    raise DeckExit.new(status == true ? 0 : (status == false ? 1 : status.to_i))
+  end
+end
+
+def set_variable(name, value)
+  raise "invalid variable name #{name}" unless name =~ /\A[A-Za-z_]\w*\z/
+  eval("$#{name} = value")
+end
+
+plan = JSON.parse(File.read($plan))
+start = Time.now
+layout = RBA::Layout.new
+layout.read(plan['input'])
+puts "Read #{plan['input']} in #{format('%.1f', Time.now - start)}s"
+
+if plan['clip']
+  top = layout.cell(plan['top_cell'])
+  raise "#{plan['input']} has no #{plan['top_cell']} cell" unless top
+  bounds = [-(1 << 30), -(1 << 30), 1 << 30, 1 << 30]
+  box = RBA::Box.new(*plan['clip'].each_with_index.map { |x, i| x.nil? ? bounds[i] : x })
+  clipped = layout.clip(top.cell_index, box)
+  # note: the cells only used by the top cell are removed with it, the decks see a single top cell
+  layout.prune_cell(top.cell_index, -1)
+  layout.cell(clipped).name = plan['top_cell']
+  puts "Clipped #{plan['top_cell']} to #{box}"
+end
+
+previous = {}
+plan['decks'].each do |deck|
+  previous.each do |name, value|
+    next if deck['variables'].key?(name)
+    set_variable(name, %w[true false 0 1].include?(value.to_s.downcase) ? 'false' : nil)
+  end
+  deck['variables'].each { |name, value| set_variable(name, value) }
+  previous = deck['variables']
+  $input = layout
+
+  puts "--- Running deck #{deck['name']} ---"
+  start = Time.now
+  status = 0
+  begin
+    RBA::Macro.new(deck['script']).run
+  rescue DeckExit => e
+    status = e.status
+  rescue StandardError, ScriptError => e
+    # note: exceptions raised within a deck may reach us wrapped by KLayout, the status is recovered from the message
+    if e.message =~ /deck exited with status (\d+)/
+      status = Regexp.last_match(1).to_i
+    else
+      # note: no 'Finished' line, the deck runs again in a process of its own
+      puts "ERROR: #{deck['script']} failed in the session: #{e.message}"
+      next
+    end
+  end
+  puts "--- Finished deck #{deck['name']}: status #{status} in #{format('%.1f', Time.now - start)}s ---"
+end
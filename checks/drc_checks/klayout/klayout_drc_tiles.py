@@ -0,0 +1,424 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import copy
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from checks.drc_checks.klayout.klayout_gds_drc_check import DECK_MARKER, KLAYOUT_DRC_SESSION_SCRIPT, count_drc_violations, klayout_drc_args
+from checks.utils import process
+from checks.utils.gds import GdsError, database_unit, structure_index
+from checks.utils.progress import HANG_TIMEOUT, KLayoutSessionProgress
+
+# Note: directory on a shared filesystem the tiles are queued in (PRECHECK_DRC_QUEUE), the workers of other hosts
+# (python3 -m checks.drc_checks.klayout.klayout_drc_tiles --worker <queue>) run the tiles they claim from it
+QUEUE = os.environ.get('PRECHECK_DRC_QUEUE')
+# Note: seconds between two looks at the queue
+QUEUE_POLL_INTERVAL = 2
+# Note: coordinates (microns) of the markers reported by KLayout, e.g. 'edge-pair: (0.1,0.2;0.3,0.4)|(0.5,0.6;0.7,0.8)'
+POINT = re.compile(r'(-?\d+(?:\.\d*)?(?:e[-+]?\d+)?),(-?\d+(?:\.\d*)?(?:e[-+]?\d+)?)')
+
+
+def tile_grid(bbox, count, halo):
+    """Split bbox [l, b, r, t] into a grid of about count square tiles
+
+    Returns a dict(core, clip) per tile: the core boxes partition the plane, the clip boxes are the core boxes enlarged by
+    the halo. None coordinates are unbounded, the outer tiles extend to the end of the layout.
+    """
+    left, bottom, right, top = bbox
+    width, height = max(right - left, 1), max(top - bottom, 1)
+    columns = max(1, min(count, round(math.sqrt(count * width / height))))
+    rows = max(1, count // columns)
+    xs = [None] + [left + width * i // columns for i in range(1, columns)] + [None]
+    ys = [None] + [bottom + height * i // rows for i in range(1, rows)] + [None]
+    tiles = []
+    for row in range(rows):
+        for column in range(columns):
+            core = [xs[column], ys[row], xs[column + 1], ys[row + 1]]
+            clip = [None if x is None else x + sign * halo for x, sign in zip(core, [-1, -1, 1, 1])]
+            tiles.append(dict(name=f"tile_{len(tiles)}", core=core, clip=clip))
+    return tiles
+
+
+def deck_status(log_file_path):
+    """Exit status of the deck of a tile, None if the deck did not complete"""
+    try:
+        with open(log_file_path, errors='replace') as tile_log:
+            for line in tile_log:
+                match = DECK_MARKER.match(line.rstrip())
+                if match and match.group(3) is not None:
+                    return int(match.group(3))
+    except OSError:
+        pass
+    return None
+
+
+def run_tile(task):
+    """Run the deck of a tile in a KLayout process of its own, returns its exit status (None if the deck did not complete)"""
+    run_tile_cmd = ['klayout', '-b', '-r', KLAYOUT_DRC_SESSION_SCRIPT, '-rd', f"plan={task['plan']}"]
+    with open(task['log'], 'w') as tile_log:
+        process.run(run_tile_cmd, stderr=tile_log, stdout=tile_log, progress=KLayoutSessionProgress(1))
+    return deck_status(task['log'])
+
+
+class TileQueue:
+    """Tiles of a check queued on a shared filesystem, claimed by the workers of any host sharing it
+
+    A tile is queued as tasks/<tile>.json, a worker claims it by renaming it to claimed/<tile>.json and records its exit
+    status in done/<tile>.json once it ran.
+
+    Arguments:
+        directory: Directory of the queued check, within the queue directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @classmethod
+    def create(cls, queue_directory, name):
+        queue = cls(tempfile.mkdtemp(prefix=f"{name}_", dir=queue_directory))
+        for subdirectory in ['tasks', 'claimed', 'done']:
+            (queue.directory / subdirectory).mkdir()
+        return queue
+
+    @staticmethod
+    def write(path, content):
+        fd, staging = tempfile.mkstemp(prefix='.', dir=path.parent)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f)
+        os.replace(staging, path)
+
+    def submit(self, task):
+        self.write(self.directory / 'tasks' / f"{task['name']}.json", task)
+
+    def claim(self):
+        """Next queued tile, None once all tiles were claimed"""
+        for path in sorted((self.directory / 'tasks').glob('*.json')):
+            claimed = self.directory / 'claimed' / path.name
+            try:
+                # note: the rename is atomic, a single worker claims a tile
+                path.rename(claimed)
+                with open(claimed) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def complete(self, task, status):
+        self.write(self.directory / 'done' / f"{task['name']}.json", dict(status=status, host=socket.gethostname()))
+
+    def status(self, task):
+        """dict(status, host) of a tile that ran, None while it is queued or running"""
+        try:
+            with open(self.directory / 'done' / f"{task['name']}.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def work(queue_directory, once=False):
+    """Run the tiles queued in queue_directory by any precheck, until there are none left if once"""
+    while True:
+        ran = False
+        for directory in sorted(Path(queue_directory).iterdir()):
+            # note: the precheck that queued the tiles removes its queue once it is done, gave up or was cancelled
+            if not directory.is_dir():
+                continue
+            queue = TileQueue(directory)
+            try:
+                task = queue.claim()
+            except OSError:
+                continue
+            if task:
+                logging.info(f"{{{{DRC TILES}}}} Running {task['name']} of {directory.name}")
+                try:
+                    status = run_tile(task)
+                except OSError as e:
+                    logging.error(f"{{{{DRC TILES}}}} Failed to run {task['name']} of {directory.name}: {e}")
+                    status = None
+                try:
+                    queue.complete(task, status)
+                except OSError as e:
+                    logging.warning(f"{{{{DRC TILES}}}} The status of {task['name']} was dropped, the queue {directory.name} was removed: {e}")
+                ran = True
+        if once and not ran:
+            return
+        if not ran:
+            time.sleep(QUEUE_POLL_INTERVAL)
+
+
+def parse_trans(text):
+    """Function applying a KLayout transformation string (e.g. 'r90 *1 10.5,20', 'm45 0,0') to a point"""
+    angle, mirror, magnification, dx, dy = 0.0, False, 1.0, 0.0, 0.0
+    for token in text.split():
+        if token[0] in 'rm' and token[1:].replace('.', '', 1).isdigit():
+            mirror = token[0] == 'm'
+            # note: 'm<a>' mirrors at the axis at angle a, i.e. mirrors at the x axis then rotates by 2a
+            angle = math.radians(float(token[1:]) * (2 if mirror else 1))
+        elif token.startswith('*'):
+            magnification = float(token[1:])
+        elif ',' in token:
+            dx, dy = (float(x) for x in token.split(','))
+    cos, sin = math.cos(angle) * magnification, math.sin(angle) * magnification
+
+    def apply(x, y):
+        y = -y if mirror else y
+        return x * cos - y * sin + dx, x * sin + y * cos + dy
+    return apply
+
+
+def placements(root):
+    """Transformations from the cells of a report to its top cell: {cell: [transformation, ...]}, the top cell has the
+    identity, the cells of the report without references have none"""
+    parents = {}
+    top_cell = root.findtext('top-cell')
+    for cell in root.iterfind('cells/cell'):
+        references = parents.setdefault(cell.findtext('name'), [])
+        for reference in cell.iterfind('references/ref'):
+            # note: the parent of a reference may name a variant of the cell, e.g. 'user_project_wrapper:1'
+            references.append((reference.findtext('parent', '').split(':')[0], parse_trans(reference.findtext('trans', ''))))
+
+    resolved = {top_cell: [lambda x, y: (x, y)]}
+
+    def resolve(name, depth=0):
+        if name not in resolved:
+            resolved[name] = []
+            if depth < 64:
+                for parent, trans in parents.get(name, []):
+                    resolved[name] += [lambda x, y, outer=outer, trans=trans: outer(*trans(x, y)) for outer in resolve(parent, depth + 1)]
+        return resolved[name]
+
+    return {name: resolve(name) for name in list(parents) + [top_cell]}
+
+
+def original_cell_name(name, source_cells):
+    """Name of the cell of the user GDS a cell of a tile was clipped from (e.g. 'cell$CLIP_VAR' -> 'cell')"""
+    while name not in source_cells and '$' in name:
+        name = name.rsplit('$', 1)[0]
+    return name
+
+
+def owns(core, point):
+    """Whether a point lies within the core box of a tile (left & bottom edges included, None edges are unbounded)"""
+    left, bottom, right, top = core
+    x, y = point
+    return (left is None or x >= left) and (bottom is None or y >= bottom) and (right is None or x < right) and (top is None or y < top)
+
+
+def merge_reports(tiles, report_file_path, source_cells):
+    """Merge the reports of the tiles of a deck into one report, returns the number of items dropped
+
+    A marker is kept by the tile whose core holds the center of its bounding box (in one of the placements of its cell),
+    the markers a tile reports within its halo are either found again by the tile owning them or artifacts of the clip.
+    Markers of the same category, cell & geometry reported by several tiles are kept once.
+    """
+    merged = None
+    categories, cells, items, seen = {}, {}, [], set()
+    dropped = 0
+    for tile in tiles:
+        root = ET.parse(tile['report']).getroot()
+        if merged is None:
+            merged = copy.deepcopy(root)
+        transforms = placements(root)
+        for category in root.iterfind('categories/category'):
+            categories.setdefault(category.findtext('name'), category)
+        for cell in root.iterfind('cells/cell'):
+            name = original_cell_name(cell.findtext('name'), source_cells)
+            if name not in cells:
+                cell.find('name').text = name
+                cells[name] = cell
+        for item in root.iterfind('items/item'):
+            cell_name = item.findtext('cell', '')
+            values = tuple(value.text or '' for value in item.iterfind('values/value'))
+            points = [(float(x), float(y)) for value in values for x, y in POINT.findall(value)]
+            if points:
+                center = ((min(x for x, _ in points) + max(x for x, _ in points)) / 2, (min(y for _, y in points) + max(y for _, y in points)) / 2)
+                # note: a cell the report has no references of is taken as placed at the origin of the top cell
+                if not any(owns(tile['core_um'], trans(*center)) for trans in transforms.get(cell_name) or [lambda x, y: (x, y)]):
+                    dropped += 1
+                    continue
+            name = original_cell_name(cell_name, source_cells)
+            key = (item.findtext('category'), name, values)
+            if key in seen:
+                dropped += 1
+                continue
+            seen.add(key)
+            if item.find('cell') is not None:
+                item.find('cell').text = name
+            items.append(item)
+
+    for tag, elements in [('categories', categories.values()), ('cells', cells.values()), ('items', items)]:
+        element = merged.find(tag)
+        if element is None:
+            element = ET.SubElement(merged, tag)
+        element.clear()
+        element.extend(elements)
+    ET.ElementTree(merged).write(report_file_path, encoding='utf-8', xml_declaration=True)
+    return dropped
+
+
+def klayout_tiled_drc_check(check_name, drc_script_path, gds_input_file_path, output_directory, klayout_cmd_extra_args, halo, tiles, gds_index_path=None,
+                            gds_source_path=None, tile_memory=None):
+    """Run a deck on tiles of the layout in KLayout processes of their own and merge their reports
+
+    The top cell is split into a grid of tiles, each tile clips the layout to its core enlarged by the halo (microns, the
+    largest distance the rules of the deck look at) and runs the deck. The tiles run on the CPUs allocated to the check,
+    and on the workers of other hosts when a queue directory is set (see TileQueue). The reports of the tiles are merged
+    into the report of the check, which gets its log & total as if the deck ran untiled.
+
+    Every tile reads the whole layout: the tiles running at once are limited to what the memory allocated to the check
+    holds, tile_memory GiB each. Queued tiles read gds_source_path (the GDS on the shared filesystem) instead of the
+    copy staged to this host.
+
+    Returns the result of the check, None if the layout can not be tiled or a tile did not complete (the deck has to run untiled).
+    """
+    top_cell = gds_input_file_path.stem
+    try:
+        bbox = structure_index(gds_input_file_path, gds_index_path).cells.get(top_cell, {}).get('bbox')
+        dbu = database_unit(gds_input_file_path)
+    except (OSError, GdsError) as e:
+        logging.warning(f"{{{{DRC TILES}}}} {check_name} runs untiled, failed to read the extent of {gds_input_file_path.name}: {e}")
+        return None
+    if bbox is None:
+        logging.warning(f"{{{{DRC TILES}}}} {check_name} runs untiled, {top_cell} has no shapes of its own to tile")
+        return None
+
+    logs_directory = output_directory / 'logs'
+    tiles_directory = output_directory / 'outputs/reports/tiles' / check_name
+    shutil.rmtree(tiles_directory, ignore_errors=True)
+    tiles_directory.mkdir(parents=True)
+    (logs_directory / 'tiles').mkdir(exist_ok=True)
+    grid = tile_grid(bbox, tiles, round(halo / dbu))
+    cpus = len(process.allocated_cpus())
+    workers = process.concurrent_tools(len(grid), tile_memory)
+    # note: the copy staged to node-local storage can not be read by the workers of other hosts
+    tile_input_path = gds_source_path if QUEUE and gds_source_path else gds_input_file_path
+    tasks = []
+    for tile in grid:
+        report_file_path = tiles_directory / f"{tile['name']}.xml"
+        args = klayout_drc_args(check_name, tile_input_path, output_directory, klayout_cmd_extra_args)
+        variables = dict(value.split('=', 1) for option, value in zip(args[::2], args[1::2]) if option == '-rd')
+        variables.update(report=str(report_file_path), thr=str(max(1, cpus // workers)), threads=str(max(1, cpus // workers)))
+        plan = dict(input=str(tile_input_path), top_cell=top_cell, clip=tile['clip'],
+                    decks=[dict(name=f"{check_name}_{tile['name']}", script=str(drc_script_path), variables=variables)])
+        plan_file_path = tiles_directory / f"{tile['name']}.json"
+        with open(plan_file_path, 'w') as f:
+            json.dump(plan, f, indent=2)
+        tasks.append(dict(name=tile['name'], plan=str(plan_file_path), log=str(logs_directory / 'tiles' / f"{check_name}_{tile['name']}.log"),
+                          report=str(report_file_path), core_um=[None if x is None else x * dbu for x in tile['core']]))
+
+    logging.info(f"{{{{DRC TILES}}}} {check_name}: {len(tasks)} tiles with a {halo}um halo, {workers} at a time{f' & on the workers of {QUEUE}' if QUEUE else ''}")
+    start = time.monotonic()
+    statuses = run_tiles(tasks, workers)
+    log_file_path = logs_directory / f'{check_name}_check.log'
+    with open(log_file_path, 'w') as check_log:
+        for task in tasks:
+            check_log.write(f"{task['name']} {task['core_um']}: status {statuses[task['name']]}, see {task['log']}\n")
+    incomplete = [name for name, status in statuses.items() if status is None]
+    if incomplete:
+        logging.warning(f"{{{{DRC TILES}}}} {check_name} runs untiled, tiles {incomplete} did not complete, see {log_file_path}")
+        return None
+    failed = [name for name, status in statuses.items() if status != 0]
+    if failed:
+        logging.error(f"ERROR {check_name} FAILED, stat={[statuses[name] for name in failed]} on tiles {failed}, see {log_file_path}")
+        return False
+
+    report_file_path = output_directory / 'outputs/reports' / f'{check_name}_check.xml'
+    try:
+        dropped = merge_reports(tasks, report_file_path, set(structure_index(gds_input_file_path, gds_index_path).cells))
+    except (OSError, ET.ParseError) as e:
+        logging.warning(f"{{{{DRC TILES}}}} {check_name} runs untiled, failed to merge the reports of its tiles: {e}")
+        return None
+    logging.info(f"{{{{DRC TILES}}}} {check_name}: {len(tasks)} tiles ran in {time.monotonic() - start:.1f}s, {dropped} duplicate or halo markers dropped")
+    return count_drc_violations(check_name, report_file_path, logs_directory / f'{check_name}_check.total')
+
+
+def last_activity(queue, task):
+    """Time the tile was last seen making progress: the last write to its log, else the time it was claimed"""
+    for path in [Path(task['log']), queue.directory / 'claimed' / f"{task['name']}.json"]:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            continue
+    return time.time()
+
+
+def run_tiles(tasks, workers):
+    """Run the tiles, locally or through the queue, returns {tile: exit status}"""
+    queue = None
+    if QUEUE:
+        try:
+            queue = TileQueue.create(QUEUE, Path(tasks[0]['plan']).parent.name)
+        except OSError as e:
+            logging.warning(f"{{{{DRC TILES}}}} The tiles run locally, failed to create a queue in {QUEUE}: {e}")
+    if queue is None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip([task['name'] for task in tasks], executor.map(process.bound(run_tile), tasks)))
+
+    try:
+        for task in tasks:
+            queue.submit(task)
+
+        def local_worker():
+            while True:
+                task = queue.claim()
+                if task is None:
+                    return
+                queue.complete(task, run_tile(task))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda _: process.bound(local_worker)(), range(workers)))
+        # note: wait for the tiles claimed by the workers of other hosts, a tile whose log stopped growing for HANG_TIMEOUT
+        # seconds (e.g. its worker died) failed
+        token = process.current_token()
+        statuses = {}
+        while len(statuses) < len(tasks):
+            if token.cancelled:
+                raise process.CheckCancelled('klayout')
+            for task in tasks:
+                done = queue.status(task)
+                if done:
+                    statuses[task['name']] = done['status']
+                elif task['name'] not in statuses and time.time() - last_activity(queue, task) > HANG_TIMEOUT:
+                    logging.warning(f"{{{{DRC TILES}}}} {task['name']} made no progress for {HANG_TIMEOUT:.0f}s, see {task['log']}")
+                    statuses[task['name']] = None
+            if len(statuses) < len(tasks):
+                time.sleep(QUEUE_POLL_INTERVAL)
+        return {task['name']: statuses[task['name']] for task in tasks}
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s | %(levelname)-7s | %(message)s", datefmt='%d-%b-%Y %H:%M:%S')
+    parser = argparse.ArgumentParser(description='Runs the KLayout DRC tiles queued by prechecks on other hosts.')
+    parser.add_argument('--worker', required=True, help='Queue directory (PRECHECK_DRC_QUEUE of the prechecks) on the shared filesystem')
+    parser.add_argument('--once', action='store_true', default=False, help='Exit once the queue is empty')
+    args = parser.parse_args()
+    work(args.worker, args.once)
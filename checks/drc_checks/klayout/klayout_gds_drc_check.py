@@ -1,32 +1,32 @@
 import argparse
+import json
 import logging
-import subprocess
 import os
+import re
+import sys
 from pathlib import Path
 
-def klayout_gds_drc_check(check_name, drc_script_path, gds_input_file_path, output_directory, klayout_cmd_extra_args=[]):
-    logging.info("in CUSTOM klayout_gds_drc_check")
-    report_file_path = output_directory / 'outputs/reports' / f'{check_name}_check.xml'
-    logs_directory = output_directory / 'logs'
-    total_file_path = logs_directory / f'{check_name}_check.total'
-    run_drc_check_cmd = ['klayout', '-b', '-r', drc_script_path,
-                         '-rd', f"input={gds_input_file_path}",
-                         '-rd', f"topcell={gds_input_file_path.stem}",
-                         '-rd', f"report={report_file_path}",
-                         '-rd', f"thr={os.cpu_count()}"]
-    run_drc_check_cmd.extend(klayout_cmd_extra_args)
+try:
+    from checks.utils import process
+    from checks.utils.progress import KLayoutProgress, KLayoutSessionProgress
+except ImportError:
+    # note: run as a script, the checks directory is not on the module search path
+    sys.path.append(str(Path(__file__).resolve().parents[2]))
+    from utils import process
+    from utils.progress import KLayoutProgress, KLayoutSessionProgress
 
-    log_file_path = logs_directory / f'{check_name}_check.log'
-    cmd = ' '.join(str(x) for x in run_drc_check_cmd) + ' >& ' + str(log_file_path)
-    with open(log_file_path, 'w') as klayout_drc_log:
-        logging.info(f"run: {cmd}") # helpful reference, print long-cmd once & messages below remain concise
-        p = subprocess.run(run_drc_check_cmd, stderr=klayout_drc_log, stdout=klayout_drc_log)
-        # Check exit-status of all subprocesses
-        stat = p.returncode
-        if stat != 0:
-            logging.error(f"ERROR {check_name} FAILED, stat={stat}, see {log_file_path}")
-            return False
+# Note: driver running several decks on a single read of the layout in one KLayout process
+KLAYOUT_DRC_SESSION_SCRIPT = Path(__file__).parent / 'klayout_drc_session.rb'
+KLAYOUT_DRC_SESSION_NAME = 'klayout_drc_session'
+# Note: number of tiles the tileable decks are split into (PRECHECK_DRC_TILES): 'off' runs them untiled, 'auto' splits
+# them into one tile per CPU allocated to the check (see klayout_drc_tiles)
+DRC_TILES = os.environ.get('PRECHECK_DRC_TILES', 'off')
+# Note: lines framing the output of every deck of a session, e.g. '--- Finished deck klayout_beol: status 0 in 1.0s ---'
+DECK_MARKER = re.compile(r'^--- (Running|Finished) deck (\S+?):?(?: status (-?\d+)(?: in ([\d.]+)s)?.*)? ---$')
 
+
+def count_drc_violations(check_name, report_file_path, total_file_path):
+    """Count the violations of a KLayout XML report into total_file_path, True if there are none"""
     try:
         with open(report_file_path) as klayout_xml_report:
             size = os.fstat(klayout_xml_report.fileno()).st_size
@@ -52,6 +52,142 @@ def klayout_gds_drc_check(check_name, drc_script_path, gds_input_file_path, outp
     return False
 
 
+def tile_setting(tiles=DRC_TILES):
+    """Validated PRECHECK_DRC_TILES: 'off', 'auto' or a number of tiles (0 and 1 run untiled), raises ValueError otherwise"""
+    tiles = str(tiles).strip().lower()
+    if tiles in ['off', 'auto']:
+        return tiles
+    if not tiles.isdigit():
+        raise ValueError(f"PRECHECK_DRC_TILES must be 'off', 'auto' or a number of tiles, not '{tiles}'")
+    return int(tiles)
+
+
+def tile_count(tiles=DRC_TILES):
+    """Number of tiles a tileable deck is split into, 1 to run it untiled"""
+    tiles = tile_setting(tiles)
+    if tiles == 'off':
+        return 1
+    if tiles == 'auto':
+        return len(process.allocated_cpus())
+    return max(1, tiles)
+
+
+def klayout_drc_args(check_name, gds_input_file_path, output_directory, klayout_cmd_extra_args=[]):
+    """The -rd variables of a deck run for a check"""
+    report_file_path = output_directory / 'outputs/reports' / f'{check_name}_check.xml'
+    return ['-rd', f"input={gds_input_file_path}",
+            '-rd', f"topcell={gds_input_file_path.stem}",
+            '-rd', f"report={report_file_path}",
+            '-rd', f"thr={len(process.allocated_cpus())}",
+            # note: some of the decks (e.g. pin_label_purposes_overlapping_drawing) read $threads
+            '-rd', f"threads={len(process.allocated_cpus())}"] + list(klayout_cmd_extra_args)
+
+
+def klayout_gds_drc_check(check_name, drc_script_path, gds_input_file_path, output_directory, klayout_cmd_extra_args=[], halo=None, gds_index_path=None,
+                          gds_source_path=None, tile_memory=None):
+    logging.info("in CUSTOM klayout_gds_drc_check")
+    # note: decks with a halo (the largest distance their rules look at, in microns) may run on tiles of the layout
+    tiles = tile_count() if halo is not None else 1
+    if tiles > 1:
+        from checks.drc_checks.klayout.klayout_drc_tiles import klayout_tiled_drc_check
+        result = klayout_tiled_drc_check(check_name, drc_script_path, gds_input_file_path, output_directory, klayout_cmd_extra_args, halo, tiles, gds_index_path,
+                                         gds_source_path, tile_memory)
+        if result is not None:
+            return result
+    report_file_path = output_directory / 'outputs/reports' / f'{check_name}_check.xml'
+    logs_directory = output_directory / 'logs'
+    total_file_path = logs_directory / f'{check_name}_check.total'
+    run_drc_check_cmd = ['klayout', '-b', '-r', drc_script_path]
+    run_drc_check_cmd.extend(klayout_drc_args(check_name, gds_input_file_path, output_directory, klayout_cmd_extra_args))
+
+    log_file_path = logs_directory / f'{check_name}_check.log'
+    cmd = ' '.join(str(x) for x in run_drc_check_cmd) + ' >& ' + str(log_file_path)
+    with open(log_file_path, 'w') as klayout_drc_log:
+        logging.info(f"run: {cmd}") # helpful reference, print long-cmd once & messages below remain concise
+        p = process.run(run_drc_check_cmd, stderr=klayout_drc_log, stdout=klayout_drc_log, progress=KLayoutProgress(drc_script_path))
+        # Check exit-status of all subprocesses
+        stat = p.returncode
+        if stat != 0:
+            logging.error(f"ERROR {check_name} FAILED, stat={stat}, see {log_file_path}")
+            return False
+
+    return count_drc_violations(check_name, report_file_path, total_file_path)
+
+
+def split_session_log(log_file_path, logs_directory):
+    """Write the output of every deck of a KLayout session into the log of its check, returns {check_name: (exit status, seconds)}
+    of the decks the session completed"""
+    statuses = {}
+    deck_log = None
+    try:
+        with open(log_file_path, errors='replace') as session_log:
+            for line in session_log:
+                match = DECK_MARKER.match(line.rstrip())
+                if match and match.group(1) == 'Running':
+                    if deck_log:
+                        deck_log.close()
+                    deck_log = open(logs_directory / f'{match.group(2)}_check.log', 'w')
+                if deck_log:
+                    deck_log.write(line)
+                if match and match.group(1) == 'Finished' and match.group(3) is not None:
+                    statuses[match.group(2)] = int(match.group(3)), float(match.group(4) or 0)
+                    deck_log.close()
+                    deck_log = None
+    finally:
+        if deck_log:
+            deck_log.close()
+    return statuses
+
+
+def klayout_drc_session(decks, gds_input_file_path, output_directory):
+    """Run the decks of several KLayout DRC checks in a single KLayout process, reading the GDS once
+
+    Every check still gets its own log, report & total, as if its deck ran in a process of its own (see klayout_gds_drc_check).
+
+    Arguments:
+        decks: List of (check_name, drc_script_path, klayout_cmd_extra_args).
+        gds_input_file_path: GDS the decks are run on.
+        output_directory: Output directory of the precheck.
+
+    Returns {check_name: result} of the decks the session completed, the other decks have to run in a process of their own,
+    and {check_name: seconds} the decks took in the session.
+    """
+    logs_directory = output_directory / 'logs'
+    plan_file_path = logs_directory / f'{KLAYOUT_DRC_SESSION_NAME}.json'
+    log_file_path = logs_directory / f'{KLAYOUT_DRC_SESSION_NAME}.log'
+    plan = dict(input=str(gds_input_file_path), decks=[])
+    for check_name, drc_script_path, klayout_cmd_extra_args in decks:
+        args = klayout_drc_args(check_name, gds_input_file_path, output_directory, klayout_cmd_extra_args)
+        variables = dict(value.split('=', 1) for option, value in zip(args[::2], args[1::2]) if option == '-rd')
+        plan['decks'].append(dict(name=check_name, script=str(drc_script_path), variables=variables))
+    with open(plan_file_path, 'w') as f:
+        json.dump(plan, f, indent=2)
+
+    run_session_cmd = ['klayout', '-b', '-r', KLAYOUT_DRC_SESSION_SCRIPT, '-rd', f"plan={plan_file_path}"]
+    cmd = ' '.join(str(x) for x in run_session_cmd) + ' >& ' + str(log_file_path)
+    with open(log_file_path, 'w') as session_log:
+        logging.info(f"run: {cmd}")
+        p = process.run(run_session_cmd, stderr=session_log, stdout=session_log, progress=KLayoutSessionProgress(len(decks)))
+
+    statuses = split_session_log(log_file_path, logs_directory)
+    incomplete = [check_name for check_name, _, _ in decks if check_name not in statuses]
+    if p.returncode != 0:
+        logging.warning(f"{{{{KLAYOUT SESSION}}}} The KLayout session failed, stat={p.returncode}, see {log_file_path}: {incomplete} run in their own KLayout process")
+    elif incomplete:
+        logging.warning(f"{{{{KLAYOUT SESSION}}}} The decks of {incomplete} raised an error in the KLayout session, see {log_file_path}: they run in their own KLayout process")
+
+    results = {}
+    for check_name, (status, _) in statuses.items():
+        if status != 0:
+            logging.error(f"ERROR {check_name} FAILED, stat={status}, see {logs_directory / f'{check_name}_check.log'}")
+            results[check_name] = False
+        else:
+            results[check_name] = count_drc_violations(check_name,
+                                                       output_directory / 'outputs/reports' / f'{check_name}_check.xml',
+                                                       logs_directory / f'{check_name}_check.total')
+    return results, {check_name: seconds for check_name, (_, seconds) in statuses.items()}
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format=f"%(asctime)s | %(levelname)-7s | %(message)s", datefmt='%d-%b-%Y %H:%M:%S')
     parser = argparse.ArgumentParser(description='Runs magic and klayout drc checks on a given GDS.')
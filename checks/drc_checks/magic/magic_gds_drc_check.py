@@ -1,22 +1,28 @@
 import argparse
-import gzip
+import functools
 import logging
 import os
-import re
-import subprocess
+import sys
 from pathlib import Path
 
 try:
     from checks.drc_checks.magic.converters import magic_drc_to_rdb, magic_drc_to_tcl, magic_drc_to_tr_drc, tr2klayout
+    from checks.utils import process
+    from checks.utils.gds import GdsError, cell_names
+    from checks.utils.progress import MagicProgress
 except ImportError:
     from converters import magic_drc_to_rdb, magic_drc_to_tcl, magic_drc_to_tr_drc, tr2klayout
+    # note: run as a script, the checks directory is not on the module search path
+    sys.path.append(str(Path(__file__).resolve().parents[2]))
+    from utils import process
+    from utils.gds import GdsError, cell_names
+    from utils.progress import MagicProgress
 
 
-def check_if_binary_has(word, filename):
-    f = gzip.open(filename, 'r', errors='ignore') if 'gz' in str(filename) else open(filename, errors='ignore')
-    content = f.read()
-    f.close()
-    return int(bool(re.search(word, content)))
+@functools.lru_cache(maxsize=None)
+def get_installed_sram_modules(pdk_path):
+    """Names of the SRAM macros installed in the PDK, listed once per process"""
+    return frozenset(installed_sram.stem for installed_sram in Path(pdk_path / 'libs.ref/sky130_sram_macros/maglef').glob('*.mag'))
 
 
 def is_valid_magic_drc_report(drc_content):
@@ -56,14 +62,12 @@ def magic_gds_drc_check(gds_ut_path, design_name, pdk_path, output_directory):
 
     design_magic_drc_file_path = reports_directory / f"magic_drc_check.drc.report"
 
-    installed_sram_modules_names = []
-    sram_maglef_files_generator = Path(pdk_path / 'libs.ref/sky130_sram_macros/maglef').glob('*.mag')
-    for installed_sram in sram_maglef_files_generator:
-        installed_sram_modules_names.append(installed_sram.stem)
-    sram_modules_in_gds = []
-    for sram in installed_sram_modules_names:
-        if check_if_binary_has(sram, gds_ut_path):
-            sram_modules_in_gds.append(sram)  # only the name of the module
+    try:
+        gds_cell_names = cell_names(gds_ut_path)
+    except (OSError, GdsError) as e:
+        logging.error(f"The GDS is not valid/corrupt: {e}")
+        return False
+    sram_modules_in_gds = sorted(get_installed_sram_modules(Path(pdk_path)) & gds_cell_names)
 
     pdk_name = str(Path(pdk_path).stem)
     rcfile_name = pdk_name + '.magicrc'
@@ -72,8 +76,8 @@ def magic_gds_drc_check(gds_ut_path, design_name, pdk_path, output_directory):
     design_magic_drc_mag_file_path = outputs_directory / f"{design_name}.magic.drc.mag"
     esd_fet = 'sky130_fd_io__signal_5_sym_hv_local_5term'
     # cli arguments for a tcl script has to be a string
-    has_sram_as_str = str(check_if_binary_has('sram', gds_ut_path))
-    has_esd_fet_as_str = str(check_if_binary_has('sky130_fd_io__signal_5_sym_hv_local_5term', gds_ut_path))
+    has_sram_as_str = str(int(any('sram' in name for name in gds_cell_names)))
+    has_esd_fet_as_str = str(int(esd_fet in gds_cell_names))
     # TODO(ahmad.nofal@efabless.com): This should be a command line argument
     os.environ['MAGTYPE'] = 'mag'
     os.environ['PDK_ROOT'] = str(Path(pdk_path).parent)
@@ -83,12 +87,12 @@ def magic_gds_drc_check(gds_ut_path, design_name, pdk_path, output_directory):
 
     magic_drc_log_file_path = logs_directory / 'magic_drc_check.log'
     with open(magic_drc_log_file_path, 'w') as magic_drc_log:
-        process = subprocess.run(run_magic_drc_check_cmd, stderr=magic_drc_log, stdout=magic_drc_log)
+        magic_drc_process = process.run(run_magic_drc_check_cmd, stderr=magic_drc_log, stdout=magic_drc_log, progress=MagicProgress())
     if not design_magic_drc_file_path.exists():
         logging.error(f"No {design_magic_drc_file_path} file produced by the drc check")
         return False
 
-    drc_violations_count = process.returncode
+    drc_violations_count = magic_drc_process.returncode
     if drc_violations_count != 0:
         drc_violations_count = (drc_violations_count + 3) / 4  # TODO(ahmad.nofal@efabless.com): Check validity
     magic_drc_total_file_path = logs_directory / 'magic_drc_check.total'
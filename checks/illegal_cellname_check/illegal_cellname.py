@@ -1,48 +1,82 @@
 import argparse
-import pya
 import logging
+import sys
+from collections import deque
 from pathlib import Path
 
-def run_illegal_cellname_check(gds_input_file_path):
-    # Load the OASIS file
-    layout = pya.Layout()
-    #layout.read("caravel_24063bad.oas")
-    layout.read(gds_input_file_path)
-    # Specify the character to search for
-    search_chars = ["#", "/"] # Replace with your desired character
-    # Function to recursively search subcells
-    def search_subcells(cell, search_char, depth=0):
-        match_found = False
-        for instance in cell.each_inst():
-            subcell = instance.cell
-            for search_char in search_chars:
-                if search_char in subcell.name:
-                    logging.error(f"{' ' * depth}Found '{search_char}' in subcell: {subcell.name}")
-                    match_found = True
-            # Recursively search in the subcells
-            if not search_subcells(subcell, search_char, depth + 1):
-                match_found = True
-        
-        return not match_found
-
-
-    # Start the search from the top cell
-    top_cell = layout.top_cell()
-    return search_subcells(top_cell, search_chars)
+try:
+    from checks.utils.gds import GdsError, structure_index
+except ImportError:
+    # note: run as a script, the checks directory is not on the module search path
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+    from utils.gds import GdsError, structure_index
+
+# Note: characters not allowed in the cell names, per PDK (DEFAULT_ILLEGAL_CHARACTERS for the others)
+DEFAULT_ILLEGAL_CHARACTERS = ["#", "/"]
+ILLEGAL_CHARACTERS = {'sky130A': DEFAULT_ILLEGAL_CHARACTERS,
+                      'sky130B': DEFAULT_ILLEGAL_CHARACTERS}
+
+
+def find_illegal_cellnames(index, illegal_characters):
+    """Cells below the top cells whose name holds an illegal character, with one instantiation path of each
+
+    Each distinct cell is visited once (breadth first, without recursion), whatever the number of its placements.
+    Returns [(cell name, illegal characters found, instantiation path)].
+    """
+    paths = {}
+    queue = deque()
+    for top_cell in index.top_cells():
+        paths[top_cell] = None
+        queue.append(top_cell)
+    illegal_cellnames = []
+    while queue:
+        cell = queue.popleft()
+        for subcell in index.children(cell):
+            if subcell in paths:
+                continue
+            paths[subcell] = cell
+            queue.append(subcell)
+            found = [character for character in illegal_characters if character in subcell]
+            if found:
+                illegal_cellnames.append((subcell, found, instantiation_path(paths, subcell)))
+    return illegal_cellnames
+
+
+def instantiation_path(paths, cell):
+    path = [cell]
+    while paths[path[-1]] is not None:
+        path.append(paths[path[-1]])
+    return ' -> '.join(reversed(path))
+
+
+def run_illegal_cellname_check(gds_input_file_path, index_path=None, pdk=None):
+    # Index the GDS file (unless it was indexed before)
+    try:
+        index = structure_index(gds_input_file_path, index_path)
+    except (OSError, GdsError) as e:
+        logging.error(f"Failed to read the GDS layout: {e}")
+        return False
+
+    illegal_characters = ILLEGAL_CHARACTERS.get(pdk, DEFAULT_ILLEGAL_CHARACTERS)
+    illegal_cellnames = find_illegal_cellnames(index, illegal_characters)
+    for cell, found, path in illegal_cellnames:
+        logging.error(f"Found {found} in subcell: {cell} (instantiated as {path})")
+    return not illegal_cellnames
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format=f"%(asctime)s | %(levelname)-7s | %(message)s", datefmt='%d-%b-%Y %H:%M:%S')
     parser = argparse.ArgumentParser(description='Runs Illegal cellname check.')
     parser.add_argument('--gds_input_file_path', '-g', required=True, help='GDS File to apply illegal cellname check on')
+    parser.add_argument('--pdk', '-p', required=False, help=f"PDK the illegal characters are defined by: {' '.join(ILLEGAL_CHARACTERS.keys())}, default={''.join(DEFAULT_ILLEGAL_CHARACTERS)}")
     args = parser.parse_args()
 
     gds_input_file_path = Path(args.gds_input_file_path)
 
 
     if gds_input_file_path.exists() and gds_input_file_path.suffix == ".gds":
-        if run_illegal_cellname_check(gds_input_file_path):
+        if run_illegal_cellname_check(gds_input_file_path, pdk=args.pdk):
             logging.info("Illegal cellname check passed")
         else:
             logging.error("Illegal cellname check failed")
     else:
-        logging.error(f"{gds_input_file_path} is not valid")
\ No newline at end of file
+        logging.error(f"{gds_input_file_path} is not valid")
@@ -21,9 +21,9 @@ from pathlib import Path
 import requests
 
 try:
-    from checks.utils.utils import file_hash
+    from checks.utils.utils import file_hashes
 except ImportError:
-    from utils.utils import file_hash
+    from utils.utils import file_hashes
 
 
 def check_manifest(input_directory, manifest_check_log, manifest_git_url):
@@ -31,24 +31,25 @@ def check_manifest(input_directory, manifest_check_log, manifest_git_url):
     mismatches = []
     if input_directory.exists():
         hashes = requests.get(manifest_git_url).text
-        hashes_filepaths_pairs = csv.reader(hashes.split('\n'), delimiter=' ', skipinitialspace=True)
+        hashes_filepaths_pairs = []
+        for row in csv.reader(hashes.split('\n'), delimiter=' ', skipinitialspace=True):
+            if len(row):
+                hash_of_file, file_path = row
+                hashes_filepaths_pairs.append((hash_of_file, input_directory / file_path))
+        file_paths_hashes = file_hashes(file_path for _, file_path in hashes_filepaths_pairs)
         with open(manifest_check_log, 'w') as f:
-            for row in hashes_filepaths_pairs:
-                if len(row):
-                    hash_of_file, file_path = row
-                    file_path = input_directory / file_path
-                    try:
-                        if hash_of_file != file_hash(file_path):
-                            f.write(f"{file_path}: FAILED\n")
-                            mismatches.append(str(file_path))
-                            result = False
-                        else:
-                            f.write(f"{file_path}: OK\n")
-                    except FileNotFoundError:
-                        logging.error(f"Manifest file {file_path.name} was not found in path: {file_path}")
-                        f.write(f"{file_path}: NOT FOUND\n")
-                        mismatches.append(str(file_path))
-                        result = False
+            for hash_of_file, file_path in hashes_filepaths_pairs:
+                if file_paths_hashes[file_path] is None:
+                    logging.error(f"Manifest file {file_path.name} was not found in path: {file_path}")
+                    f.write(f"{file_path}: NOT FOUND\n")
+                    mismatches.append(str(file_path))
+                    result = False
+                elif hash_of_file != file_paths_hashes[file_path]:
+                    f.write(f"{file_path}: FAILED\n")
+                    mismatches.append(str(file_path))
+                    result = False
+                else:
+                    f.write(f"{file_path}: OK\n")
     else:
         logging.warning(f"Manifest path ({input_directory}) was not found")
         result = False
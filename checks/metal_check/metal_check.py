@@ -1,26 +1,46 @@
 import argparse
-import pya
 import logging
+import sys
 from pathlib import Path
 
-def run_metal_check(gds_file_path):
-    layout = pya.Layout()
-    layout.read(gds_file_path)
-    for layer in layout.layer_indices():
-        layer_info = layout.get_info(layer)
-        if layer_info is not None:
-            if f"{layer_info.layer}/{layer_info.datatype}" in "71/44" or f"{layer_info.layer}/{layer_info.datatype}" in "72/20":
-                return False
-            
-    return True
+try:
+    from checks.utils.gds import GdsError, available_index, find_shapes_on_layers
+except ImportError:
+    # note: run as a script, the checks directory is not on the module search path
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+    from utils.gds import GdsError, available_index, find_shapes_on_layers
+
+# Note: (layer, datatype) pairs a design may not hold shapes on, per project type (met5 & via4 for mini projects)
+FORBIDDEN_LAYERS = {'mini': [(72, 20), (71, 44)]}
+
+def run_metal_check(gds_file_path, index_path=None, project_type='mini'):
+    forbidden_layers = FORBIDDEN_LAYERS.get(project_type, [])
+    if not forbidden_layers:
+        return True
+    try:
+        # note: the structure index lists every cell holding shapes on a layer, if no check built it the GDS is scanned up to the first forbidden shape
+        index = available_index(gds_file_path, index_path)
+        if index is not None:
+            layers = index.layers()
+            found = [(layer, layers[layer]) for layer in forbidden_layers if layer in layers]
+        else:
+            shape = find_shapes_on_layers(gds_file_path, forbidden_layers)
+            found = [(shape[:2], [shape[2]])] if shape else []
+    except (OSError, GdsError) as e:
+        logging.error(f"Failed to read the GDS layout: {e}")
+        return False
+    for (layer, datatype), cells in found:
+        logging.error(f"Found shapes on the forbidden layer {layer}/{datatype} in cell(s): {' '.join(cells)}")
+    return not found
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format=f"%(asctime)s | %(levelname)-7s | %(message)s", datefmt='%d-%b-%Y %H:%M:%S')
     parser = argparse.ArgumentParser(description='check if metal5 in design.')
     parser.add_argument('--gds_file', '-g', required=True, help='GDS file to check')
+    parser.add_argument('--project_type', '-t', required=False, default='mini', help=f"Project type the forbidden layers are defined by: {' '.join(FORBIDDEN_LAYERS.keys())}, default=mini")
     args = parser.parse_args()
     gds_file = Path(args.gds_file)
-    result = run_metal_check(gds_file)
+    result = run_metal_check(gds_file, project_type=args.project_type)
 
     if result:
         logging.info("metal layers check Passed!")
@@ -1,8 +1,9 @@
 import argparse
 import logging
-import subprocess
 from pathlib import Path
 
+from checks.utils import process
+
 def run_spike_check(gds_input_file_path, output_directory, script_path):
     report_file_path = output_directory / 'outputs/reports' / f'spike_check.xml'
     logs_directory = output_directory / 'logs'
@@ -11,7 +12,7 @@ def run_spike_check(gds_input_file_path, output_directory, script_path):
     cmd = ' '.join(str(x) for x in run_spike_cmd) + ' >& ' + str(log_file_path)
     with open(log_file_path, 'w') as spike_log:
         logging.info(f"run: {cmd}") # helpful reference, print long-cmd once & messages below remain concise
-        p = subprocess.run(run_spike_cmd, stderr=spike_log, stdout=spike_log)
+        p = process.run(run_spike_cmd, stderr=spike_log, stdout=spike_log)
         # Check exit-status of all subprocesses
         stat = p.returncode
         if stat != 0:
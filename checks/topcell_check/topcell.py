@@ -1,25 +1,35 @@
 import argparse
-import pya
 import logging
+import sys
 from pathlib import Path
 
-def check_top_cells(gds_file):
-    # Load the GDS file
-    layout = pya.Layout()
-    layout.read(gds_file)
+try:
+    from checks.utils.gds import GdsError, structure_index
+except ImportError:
+    # note: run as a script, the checks directory is not on the module search path
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+    from utils.gds import GdsError, structure_index
+
+def check_top_cells(gds_file, index_path=None):
+    # Index the GDS file (unless it was indexed before)
+    try:
+        index = structure_index(gds_file, index_path)
+    except (OSError, GdsError) as e:
+        print(f"Error: Failed to read the GDS layout: {e}")
+        return False
 
     # Get the top cells
-    top_cells = [cell for cell in layout.top_cells()]
+    top_cells = index.top_cells()
 
     # Check the number of top cells
     if len(top_cells) == 0:
         print("Error: No top cell found in the GDS layout.")
         return False
     elif len(top_cells) > 1:
-        print(f"Error: Multiple top cells found in the GDS layout: {[cell.name for cell in top_cells]}")
+        print(f"Error: Multiple top cells found in the GDS layout: {top_cells}")
         return False
     else:
-        print(f"Success: Single top cell '{top_cells[0].name}' found in the GDS layout.")
+        print(f"Success: Single top cell '{top_cells[0]}' found in the GDS layout.")
         return True
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import queue
+import re
+import threading
+import zlib
+from pathlib import Path
+
+try:
+    from checks.utils.file_cache import CACHE_SHARES, FileCache
+except ImportError:
+    from utils.file_cache import CACHE_SHARES, FileCache
+
+# Note: size of the reads & writes of the decompression, large enough for zlib to release the GIL for most of the work
+CHUNK_SIZE = 16 * 1024 ** 2
+# Note: bump to invalidate all existing entries of the decompressed file cache
+DECOMPRESSED_CACHE_VERSION = 1
+# Note: parts of a split archive, e.g. gds/user_project_wrapper.gds.gz.00.split
+SPLIT_PART = re.compile(r'^(?P<archive>.+\.gz)\.(?P<index>\d+)\.split$')
+
+
+def find_archives(project_path):
+    """Compressed files of a project, as the caravel 'uncompress' target finds them (at most one directory deep)
+
+    Returns a dict mapping every decompressed file to the archive parts it is decompressed from, in order.
+    """
+    archives = {}
+    for directory in [project_path] + sorted(x for x in project_path.iterdir() if x.is_dir() and not x.is_symlink()):
+        split_parts = {}
+        for path in sorted(directory.iterdir()):
+            match = SPLIT_PART.match(path.name)
+            if match and path.is_file():
+                split_parts.setdefault(directory / match.group('archive'), []).append((int(match.group('index')), path))
+            elif path.suffix == '.gz' and not path.name.endswith('.tar.gz') and path.is_file():
+                archives[path.with_suffix('')] = [path]
+        for archive, parts in split_parts.items():
+            archives[archive.with_suffix('')] = [path for _, path in sorted(parts)]
+    return archives
+
+
+def archive_hash(parts):
+    """sha1 of the compressed content of an archive (the concatenation of its parts)"""
+    sha1 = hashlib.sha1()
+    for part in parts:
+        with open(part, 'rb', buffering=0) as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                sha1.update(data)
+    return sha1.hexdigest()
+
+
+def decompress(parts, target):
+    """Decompress the gzip stream made of the concatenated parts into target, returns the size of the output
+
+    The stream may hold several gzip members. Reading & decompressing overlap with the writes, which run in a
+    thread of their own.
+    """
+    chunks = queue.Queue(maxsize=4)
+    errors = []
+
+    def write():
+        try:
+            with open(target, 'wb', buffering=0) as f:
+                for chunk in iter(chunks.get, None):
+                    f.write(chunk)
+        except OSError as e:
+            errors.append(e)
+            # note: keep consuming, the decompression stops at its next read
+            while chunks.get() is not None:
+                pass
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    size = 0
+    decompressor = zlib.decompressobj(wbits=31)
+    member = False
+    try:
+        for part in parts:
+            with open(part, 'rb', buffering=0) as f:
+                while not errors:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    while data:
+                        member = True
+                        chunk = decompressor.decompress(data, CHUNK_SIZE)
+                        size += len(chunk)
+                        chunks.put(chunk)
+                        data = decompressor.unconsumed_tail
+                        if decompressor.eof:
+                            # note: a new gzip member may start right after the end of the previous one
+                            data = decompressor.unused_data
+                            decompressor = zlib.decompressobj(wbits=31)
+                            member = False
+        if member:
+            raise zlib.error(f"{parts[-1]} is truncated")
+    finally:
+        chunks.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+    return size
+
+
+class DecompressedCache(FileCache):
+    """Persistent store of decompressed files, content addressed by the hash of the compressed file
+
+    Entries are evicted least recently used first once the cache exceeds its size.
+
+    Arguments:
+        cache_directory: Directory of the precheck cache.
+        size: Size of the precheck cache in GiB, the decompressed file cache may use its CACHE_SHARES['decompressed'] share.
+    """
+
+    def __init__(self, cache_directory, size):
+        super().__init__(Path(cache_directory) / f"decompressed_v{DECOMPRESSED_CACHE_VERSION}", size * CACHE_SHARES['decompressed'])
@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# Note: bump to invalidate all existing entries of the golden file cache
+GOLDEN_CACHE_VERSION = 1
+# Note: bump to invalidate all existing entries of the GDS index cache
+INDEX_CACHE_VERSION = 1
+# Note: share of the precheck cache size (--cache_size) each of its caches may use, together they stay within that size
+CACHE_SHARES = dict(results=0.4, decompressed=0.4, golden=0.14, gds_index=0.05, hashes=0.01)
+
+
+class FileCache:
+    """Persistent store of files, content addressed by a key derived from what the file was produced from
+
+    Entries are evicted least recently used first once the cache exceeds its size.
+
+    Arguments:
+        directory: Directory the entries are stored in.
+        size: Maximum size of the cache in GiB.
+    """
+
+    def __init__(self, directory, size):
+        self.cache_directory = Path(directory)
+        self.size = int(size * 1024 ** 3)
+        self.cache_directory.mkdir(parents=True, exist_ok=True)
+
+    def restore(self, key, target):
+        """Copy the file of the entry into target, returns its size or None on a cache miss"""
+        entry = self.cache_directory / key
+        try:
+            shutil.copyfile(entry, target)
+            os.utime(entry)
+        except OSError:
+            return None
+        return Path(target).stat().st_size
+
+    def store(self, key, path):
+        fd, staging = tempfile.mkstemp(prefix=f".{key}.", dir=self.cache_directory)
+        os.close(fd)
+        try:
+            shutil.copyfile(path, staging)
+            os.replace(staging, self.cache_directory / key)
+        finally:
+            Path(staging).unlink(missing_ok=True)
+        self.evict()
+
+    def entry_size(self, entry):
+        """Size of an entry in bytes, None if it is not a complete entry"""
+        return entry.stat().st_size
+
+    def evict(self):
+        entries = []
+        for entry in self.cache_directory.iterdir():
+            try:
+                if not entry.name.startswith('.'):
+                    size = self.entry_size(entry)
+                    if size is not None:
+                        entries.append((entry.stat().st_mtime, size, entry))
+            except (OSError, ValueError, KeyError):
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.size:
+                break
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+            total -= size
+
+class GoldenCache(FileCache):
+    """Files derived from golden assets only (e.g. the golden wrapper with the user area erased by the XOR check), they
+    are identical for every project using the same assets
+
+    Arguments:
+        cache_directory: Directory of the precheck cache.
+        size: Size of the precheck cache in GiB, the golden file cache may use its CACHE_SHARES['golden'] share.
+    """
+
+    def __init__(self, cache_directory, size):
+        super().__init__(Path(cache_directory) / f"golden_v{GOLDEN_CACHE_VERSION}", size * CACHE_SHARES['golden'])
+
+
+class GdsIndexCache(FileCache):
+    """Structure indexes of the user GDSes (see checks.utils.gds.structure_index), keyed on the GDS of the project as
+    submitted, reused by the later runs of the same project
+
+    Arguments:
+        cache_directory: Directory of the precheck cache.
+        size: Size of the precheck cache in GiB, the GDS index cache may use its CACHE_SHARES['gds_index'] share.
+    """
+
+    def __init__(self, cache_directory, size):
+        super().__init__(Path(cache_directory) / f"gds_index_v{INDEX_CACHE_VERSION}", size * CACHE_SHARES['gds_index'])
+
+    def entry(self, source):
+        """File the index of a GDS is persisted in, source is the identity of the GDS (see checks.utils.gds.index_source)"""
+        key = hashlib.sha1(json.dumps(source, sort_keys=True).encode('utf-8')).hexdigest()
+        path = self.cache_directory / f"{key}.json"
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
@@ -0,0 +1,431 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Note: size of the reads of a compressed file, the reader only holds one chunk (and the record split across two chunks) in memory
+CHUNK_SIZE = 16 * 1024 ** 2
+
+# Note: bump to invalidate the persisted structure indexes (e.g. when their content changes)
+INDEX_VERSION = 1
+
+# Note: GDSII record types (the second to last byte of the 4 bytes record header)
+UNITS = 0x03
+ENDLIB = 0x04
+BGNSTR = 0x05
+STRNAME = 0x06
+ENDSTR = 0x07
+BOUNDARY = 0x08
+PATH = 0x09
+SREF = 0x0A
+AREF = 0x0B
+TEXT = 0x0C
+LAYER = 0x0D
+DATATYPE = 0x0E
+XY = 0x10
+ENDEL = 0x11
+SNAME = 0x12
+COLROW = 0x13
+NODE = 0x15
+TEXTTYPE = 0x16
+NODETYPE = 0x1A
+BOX = 0x2D
+BOXTYPE = 0x2E
+# Note: elements holding a shape, the type of their layer is given by DATATYPE, TEXTTYPE, NODETYPE or BOXTYPE
+SHAPES = {BOUNDARY, PATH, TEXT, NODE, BOX}
+INDEXED_RECORDS = {STRNAME, ENDSTR, BOUNDARY, PATH, SREF, AREF, TEXT, LAYER, DATATYPE, XY, ENDEL, SNAME, COLROW, NODE, TEXTTYPE, NODETYPE, BOX, BOXTYPE}
+
+
+class GdsError(Exception):
+    pass
+
+
+def open_gds(path):
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if compressed else open(path, 'rb', buffering=0)
+
+
+def read_records(path, record_types):
+    """Stream the records of a GDSII file, yields (record type, data) of the records of the given types
+
+    An uncompressed file is memory mapped, the records are parsed in place and only the data of the records yielded is
+    copied. A compressed file is decompressed in CHUNK_SIZE chunks. Whatever the size of the file, the memory used
+    stays bounded.
+    """
+    with open_gds(path) as f:
+        if isinstance(f, gzip.GzipFile):
+            yield from _read_chunks(path, f, record_types)
+        else:
+            yield from _read_mapped(path, f, record_types)
+
+
+def _parse_records(path, buffer, offset, position, record_types):
+    """Yield the records of the buffer from offset, returns the offset of the first incomplete record or None after
+    the ENDLIB record (position is the position of the buffer in the file)"""
+    end = len(buffer)
+    while offset + 4 <= end:
+        length = buffer[offset] << 8 | buffer[offset + 1]
+        if length < 4:
+            raise GdsError(f"{path} is not a valid GDSII file: record of length {length} at byte {position + offset}")
+        if offset + length > end:
+            break
+        record_type = buffer[offset + 2]
+        if record_type in record_types:
+            yield record_type, buffer[offset + 4:offset + length]
+        if record_type == ENDLIB:
+            # note: the file may be padded with zeros after the end of the library
+            return None
+        offset += length
+    return offset
+
+
+def _read_mapped(path, f, record_types):
+    if os.fstat(f.fileno()).st_size:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if hasattr(data, 'madvise'):
+                data.madvise(mmap.MADV_SEQUENTIAL)
+            if (yield from _parse_records(path, data, 0, 0, record_types)) is None:
+                return
+    raise GdsError(f"{path} is not a valid GDSII file: it ends before its ENDLIB record")
+
+
+def _read_chunks(path, f, record_types):
+    buffer = b''
+    offset = 0
+    position = 0
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        position += offset
+        buffer = buffer[offset:] + chunk
+        offset = yield from _parse_records(path, buffer, 0, position, record_types)
+        if offset is None:
+            return
+    raise GdsError(f"{path} is not a valid GDSII file: it ends before its ENDLIB record")
+
+
+def merge_libraries(paths, target):
+    """Write the cells of several GDSII libraries into one library, the header (and the units) of the first one
+
+    The libraries must share their units and must not define cells of the same name.
+    """
+    with open(target, 'wb') as out:
+        for position, path in enumerate(paths):
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                cells = end = None
+                offset = 0
+                while offset + 4 <= len(data):
+                    length = data[offset] << 8 | data[offset + 1]
+                    if length < 4:
+                        raise GdsError(f"{path} is not a valid GDSII file: record of length {length} at byte {offset}")
+                    if data[offset + 2] == BGNSTR and cells is None:
+                        cells = offset
+                    elif data[offset + 2] == ENDLIB:
+                        end = offset
+                        break
+                    offset += length
+                if end is None:
+                    raise GdsError(f"{path} is not a valid GDSII file: it ends before its ENDLIB record")
+                view = memoryview(data)
+                try:
+                    out.write(view[0 if position == 0 else end if cells is None else cells:end])
+                finally:
+                    view.release()
+        out.write(struct.pack('>HBB', 4, ENDLIB, 0))
+
+
+def decode_string(data):
+    return data.rstrip(b'\0').decode('ascii', errors='replace')
+
+
+def read_cell_names(path):
+    """Names of all cells defined (STRNAME) or referenced (SNAME) in a GDSII file, read in one pass"""
+    return frozenset(decode_string(data) for _, data in read_records(path, {STRNAME, SNAME}))
+
+
+def cell_names(path):
+    """read_cell_names of a file, computed once per process until the file changes (see release_indexes)"""
+    key = tuple(index_source(path).values())
+    with _memory_lock:
+        names = _cell_names.get(key)
+        if names is not None:
+            _cell_names.move_to_end(key)
+            return names
+    names = read_cell_names(path)
+    with _memory_lock:
+        _remember(_cell_names, key, names)
+    return names
+
+
+def decode_real8(data):
+    """GDSII 8 byte real: sign bit, excess-64 base 16 exponent & 56 bit mantissa"""
+    value = int.from_bytes(data[1:8], 'big') / 2 ** 56 * 16.0 ** ((data[0] & 0x7f) - 64)
+    return -value if data[0] & 0x80 else value
+
+
+def database_unit(path):
+    """Size of the database unit of a GDSII file in microns"""
+    for _, data in read_records(path, {UNITS}):
+        return decode_real8(data[8:16]) * 1e6
+    raise GdsError(f"{path} is not a valid GDSII file: it has no UNITS record")
+
+
+def decode_int16(data):
+    return struct.unpack_from('>h', data)[0]
+
+
+class GdsIndex:
+    """Structure of a GDSII file without its geometry: the cells, their references to other cells, the layers they use,
+    their number of shapes and the bounding box of their own shapes
+
+    Arguments:
+        cells: {cell name: dict(children={child name: instances}, layers={'layer/datatype': shapes}, shapes=n, bbox=[x0, y0, x1, y1] or None)}
+            of the cells defined in the file, in the order of the file.
+        source: dict(path, size, mtime_ns) of the indexed file.
+    """
+
+    def __init__(self, cells, source=None):
+        self.cells = cells
+        self.source = source
+
+    @classmethod
+    def build(cls, path):
+        """Index a GDSII file in one streaming pass"""
+        cells = {}
+        cell = element = None
+        for record_type, data in read_records(path, INDEXED_RECORDS):
+            if record_type == STRNAME:
+                cell = cells.setdefault(decode_string(data), dict(children={}, layers={}, shapes=0, bbox=None))
+            elif record_type == ENDSTR:
+                cell = None
+            elif cell is None:
+                continue
+            elif record_type in SHAPES:
+                element = dict(type=record_type, layer=None, datatype=0, xy=None)
+            elif record_type in (SREF, AREF):
+                element = dict(type=record_type, name=None, instances=1)
+            elif element is None:
+                continue
+            elif record_type == LAYER:
+                element['layer'] = decode_int16(data)
+            elif record_type in (DATATYPE, TEXTTYPE, NODETYPE, BOXTYPE):
+                element['datatype'] = decode_int16(data)
+            elif record_type == XY:
+                element['xy'] = data
+            elif record_type == SNAME:
+                element['name'] = decode_string(data)
+            elif record_type == COLROW:
+                columns, rows = struct.unpack_from('>hh', data)
+                element['instances'] = columns * rows
+            elif record_type == ENDEL:
+                if element['type'] in SHAPES:
+                    add_shape(cell, element)
+                elif element['name'] is not None:
+                    cell['children'][element['name']] = cell['children'].get(element['name'], 0) + element['instances']
+                element = None
+        return cls(cells)
+
+    @classmethod
+    def load(cls, index_path, source):
+        """Index persisted in index_path, None if it is missing or was built from another version of the file"""
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != INDEX_VERSION or index.get('source') != source:
+            return None
+        return cls(index['cells'], source)
+
+    def save(self, index_path):
+        index_path = Path(index_path)
+        fd, staging = tempfile.mkstemp(prefix=f".{index_path.name}.", dir=index_path.parent)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(version=INDEX_VERSION, source=self.source, cells=self.cells), f)
+            os.replace(staging, index_path)
+        finally:
+            Path(staging).unlink(missing_ok=True)
+
+    def top_cells(self):
+        """Cells defined in the file that no other cell references"""
+        referenced = {child for cell in self.cells.values() for child in cell['children']}
+        return [name for name in self.cells if name not in referenced]
+
+    def children(self, name):
+        """Cells referenced by a cell (once each)"""
+        return list(self.cells[name]['children']) if name in self.cells else []
+
+    def ghost_cells(self):
+        """Cells referenced but not defined in the file"""
+        return sorted({child for cell in self.cells.values() for child in cell['children'] if child not in self.cells})
+
+    def is_empty(self, name):
+        cell = self.cells.get(name)
+        return cell is None or (not cell['shapes'] and not cell['children'])
+
+    def layers(self):
+        """{(layer, datatype): cells holding shapes on it}"""
+        layers = {}
+        for name, cell in self.cells.items():
+            for layer in cell['layers']:
+                layers.setdefault(tuple(int(x) for x in layer.split('/')), []).append(name)
+        return layers
+
+
+def add_shape(cell, element):
+    layer = f"{element['layer']}/{element['datatype']}"
+    cell['layers'][layer] = cell['layers'].get(layer, 0) + 1
+    cell['shapes'] += 1
+    if element['xy']:
+        points = struct.unpack(f">{len(element['xy']) // 4}i", element['xy'])
+        xs, ys = points[0::2], points[1::2]
+        bbox = [min(xs), min(ys), max(xs), max(ys)]
+        if cell['bbox']:
+            bbox = [min(bbox[0], cell['bbox'][0]), min(bbox[1], cell['bbox'][1]), max(bbox[2], cell['bbox'][2]), max(bbox[3], cell['bbox'][3])]
+        cell['bbox'] = bbox
+
+
+def find_shapes_on_layers(path, layers):
+    """First shape of a GDSII file on one of the (layer, datatype) pairs, as (layer, datatype, cell)
+
+    The file is streamed and the scan stops at the first hit, None if no shape is on any of the layers.
+    """
+    layers = set(layers)
+    cell = None
+    layer = datatype = None
+    for record_type, data in read_records(path, SHAPES | {STRNAME, LAYER, DATATYPE, TEXTTYPE, NODETYPE, BOXTYPE, ENDEL}):
+        if record_type == STRNAME:
+            cell = decode_string(data)
+        elif record_type in SHAPES:
+            layer, datatype = None, 0
+        elif record_type == LAYER:
+            layer = decode_int16(data)
+        elif record_type in (DATATYPE, TEXTTYPE, NODETYPE, BOXTYPE):
+            datatype = decode_int16(data)
+        elif record_type == ENDEL:
+            if layer is not None and (layer, datatype) in layers:
+                return layer, datatype, cell
+            layer = None
+    return None
+
+
+# Note: GDS indexes & cell names kept in memory, least recently used out first: the batch & daemon workers run the
+# projects one after another in the same process (the entries of a project are released once its run is over)
+MEMORY_INDEXES = 4
+
+_indexes = OrderedDict()
+_cell_names = OrderedDict()
+_copies = {}
+_memory_lock = threading.Lock()
+_index_locks = {}
+_index_locks_lock = threading.Lock()
+
+
+def _remember(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > MEMORY_INDEXES:
+        cache.popitem(last=False)
+
+
+def register_copy(copy_path, source_path):
+    """Index a copy of a GDSII file (e.g. staged to node-local storage) as its source: the readers of the copy and of
+    the source share the same indexes, in memory and persisted"""
+    copy, source = index_source(copy_path), index_source(source_path)
+    if (copy['size'], copy['mtime_ns']) == (source['size'], source['mtime_ns']):
+        with _memory_lock:
+            _copies[copy['path']] = source
+
+
+def release_indexes(gds_path):
+    """Forget the indexes & cell names of a GDSII file and of its copies, e.g. once the run of its project is over"""
+    path = os.path.realpath(gds_path)
+    with _memory_lock:
+        for copy, source in list(_copies.items()):
+            if path in (copy, source['path']):
+                del _copies[copy]
+        for cache in [_indexes, _cell_names]:
+            for key in [key for key in cache if key[0] == path]:
+                del cache[key]
+
+
+def index_source(gds_path):
+    """Identity of a GDSII file the indexes are keyed on: its path, size & modification time (those of its source for a
+    registered copy, see register_copy)"""
+    stat = os.stat(gds_path)
+    path = os.path.realpath(gds_path)
+    with _memory_lock:
+        source = _copies.get(path)
+    if source is not None and (source['size'], source['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return dict(source)
+    return dict(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+
+def available_index(gds_path, index_path=None):
+    """GdsIndex of a GDSII file if it was already built by this process or persisted in index_path, None otherwise"""
+    source = index_source(gds_path)
+    with _memory_lock:
+        index = _indexes.get(tuple(source.values()))
+    if index is None and index_path:
+        index = GdsIndex.load(index_path, source)
+    return index
+
+
+def structure_index(gds_path, index_path=None):
+    """GdsIndex of a GDSII file, built once per process until the file changes (the indexes of the MEMORY_INDEXES
+    files used last are kept in memory)
+
+    With an index_path, the index is persisted there and loaded back by the later checks & runs as long as the file
+    is unchanged.
+    """
+    source = index_source(gds_path)
+    key = tuple(source.values())
+    with _index_locks_lock:
+        # note: checks asking for the same file wait for the one indexing it
+        lock = _index_locks.setdefault(key, threading.Lock())
+    with lock:
+        with _memory_lock:
+            if key in _indexes:
+                _indexes.move_to_end(key)
+                return _indexes[key]
+        index = GdsIndex.load(index_path, source) if index_path else None
+        if index is None:
+            start = time.monotonic()
+            index = GdsIndex.build(gds_path)
+            index.source = source
+            logging.info(f"{{{{GDS INDEX}}}} Indexed {len(index.cells)} cells of {Path(gds_path).name} in {time.monotonic() - start:.1f}s")
+            if index_path:
+                try:
+                    index.save(index_path)
+                except OSError as e:
+                    logging.warning(f"{{{{GDS INDEX}}}} Failed to save the index of {Path(gds_path).name} to {index_path}: {e}")
+        with _memory_lock:
+            _remember(_indexes, key, index)
+    with _index_locks_lock:
+        _index_locks.pop(key, None)
+    return index
@@ -0,0 +1,178 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from checks.utils.file_cache import CACHE_SHARES, FileCache
+except ImportError:
+    from utils.file_cache import CACHE_SHARES, FileCache
+
+# Note: size of the reads (and of the slices of a mapped file), hashlib releases the GIL while hashing them so that files are hashed in parallel threads
+BUFFER_SIZE = 8 * 1024 ** 2
+# Note: bump to invalidate all existing entries of the hash cache (e.g. when the digest changes)
+HASH_CACHE_VERSION = 1
+
+
+def compute_hash(path):
+    """sha1 of the content of a file, of its decompressed content if it is gzip compressed"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb', buffering=0) as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+        f.seek(0)
+        if compressed:
+            with gzip.GzipFile(fileobj=f) as stream:
+                while True:
+                    data = stream.read(BUFFER_SIZE)
+                    if not data:
+                        break
+                    sha1.update(data)
+        elif os.fstat(f.fileno()).st_size:
+            # note: the mapped file is hashed in place, without copying it into buffers
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if hasattr(data, 'madvise'):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(data)
+                try:
+                    for offset in range(0, len(data), BUFFER_SIZE):
+                        sha1.update(view[offset:offset + BUFFER_SIZE])
+                finally:
+                    view.release()
+    return sha1.hexdigest()
+
+
+class HashCache:
+    """Digests of files keyed on (path, inode, size, mtime_ns), a file is only hashed again once it changed
+
+    The digests are kept in memory for the run and, once a cache directory is set, persisted as one small
+    sidecar entry per file so that later runs (and the other processes of a batch) reuse them. The sidecar entries
+    are evicted least recently used first once they exceed their share of the precheck cache.
+
+    Arguments:
+        cache_directory: Directory of the precheck cache, None to keep the digests in memory only.
+        size: Size of the precheck cache in GiB, the sidecar entries may use its CACHE_SHARES['hashes'] share.
+    """
+
+    def __init__(self, cache_directory=None, size=None):
+        self.directory = None
+        self.store = None
+        self.digests = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        if cache_directory:
+            self.persist(cache_directory, size)
+
+    def persist(self, cache_directory, size):
+        self.store = FileCache(Path(cache_directory) / f"hashes_v{HASH_CACHE_VERSION}", size * CACHE_SHARES['hashes'])
+        self.directory = self.store.cache_directory
+
+    def release(self):
+        """Forget the digests kept in memory and evict the sidecar entries beyond the size of the cache, e.g. once the
+        run of a project is over"""
+        with self.lock:
+            self.digests.clear()
+        if self.store:
+            try:
+                self.store.evict()
+            except OSError:
+                pass
+
+    def get(self, filename):
+        path = os.path.realpath(filename)
+        stat = os.stat(path)
+        key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            # note: threads asking for the same file wait for the one hashing it
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            digest = self.digests.get(key)
+            if digest is None:
+                digest = self._load(key)
+                if digest is None:
+                    digest = compute_hash(path)
+                    self._store(key, digest)
+                self.digests[key] = digest
+        with self.lock:
+            # note: the threads waiting for the file hold the lock, the next ones find the digest
+            self.locks.pop(key, None)
+        return digest
+
+    def _entry(self, key):
+        return self.directory / hashlib.sha1(key[0].encode('utf-8')).hexdigest()
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._entry(key)) as f:
+                entry = json.load(f)
+            os.utime(self._entry(key))
+        except (OSError, ValueError):
+            return None
+        return entry['digest'] if [entry.get('path'), entry.get('inode'), entry.get('size'), entry.get('mtime_ns')] == list(key) else None
+
+    def _store(self, key, digest):
+        if self.directory is None:
+            return
+        path, inode, size, mtime_ns = key
+        # note: the digest is still kept in memory, a read-only or full cache only costs a re-hash in later runs
+        try:
+            fd, staging = tempfile.mkstemp(prefix='.', dir=self.directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(path=path, inode=inode, size=size, mtime_ns=mtime_ns, digest=digest), f)
+            os.replace(staging, self._entry(key))
+        except OSError:
+            Path(staging).unlink(missing_ok=True)
+
+_hash_cache = HashCache()
+
+
+def persist_hashes(cache_directory, size):
+    """Persist the digests in cache_directory (within their share of size GiB), they are reused by the later runs"""
+    _hash_cache.persist(cache_directory, size)
+
+
+def release_hashes():
+    """Forget the digests of the run kept in memory, the batch & daemon workers run many projects in one process"""
+    _hash_cache.release()
+
+
+def file_hash(filename):
+    return _hash_cache.get(filename)
+
+
+def file_hashes(filenames):
+    """Hash many files in parallel threads, returns {filename: digest}, the digest is None if the file does not exist"""
+    filenames = list(filenames)
+
+    def get(filename):
+        try:
+            return _hash_cache.get(filename)
+        except FileNotFoundError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(filenames), len(os.sched_getaffinity(0))))) as executor:
+        return dict(zip(filenames, executor.map(get, filenames)))
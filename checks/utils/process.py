@@ -0,0 +1,339 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import contextlib
+import functools
+import logging
+import os
+import resource
+import select
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+try:
+    from checks.utils.progress import MONITOR_INTERVAL, ToolMonitor
+except ImportError:
+    from utils.progress import MONITOR_INTERVAL, ToolMonitor
+
+SCRIPT_SUFFIXES = ['.drc', '.lydrc', '.rb', '.tcl', '.py']
+# Note: seconds between two checks whether a tool exited when it cannot be waited for through a pidfd, and seconds a
+# terminated hung tool is given before it is killed
+WAIT_INTERVAL = 0.5
+KILL_TIMEOUT = 30
+
+_current = threading.local()
+# note: the tools of a check may run in several threads (see bound), they account their usage to the same record
+_record_lock = threading.Lock()
+
+
+class CheckCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """Cancels the tool processes launched through run() by the checks bound to the token (see cancellable)
+
+    Every tool runs in its own session, cancelling the token terminates the process group of every tool
+    in flight and makes every later run() of the bound checks raise CheckCancelled.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.processes = set()
+        self.children = []
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            for process in self.processes:
+                _terminate(process)
+            children = list(self.children)
+        for child in children:
+            child.cancel()
+
+    def child(self):
+        """Token cancelled along with this one, which may also be cancelled on its own (e.g. to stop the other tools of a
+        check once one of them found the answer)"""
+        child = CancelToken()
+        with self.lock:
+            self.children.append(child)
+            cancelled = self.cancelled
+        if cancelled:
+            child.cancel()
+        return child
+
+
+def _pin(cpus):
+    """Set the CPU affinity of the current thread (not of the whole process), returns the previous one or None"""
+    if not cpus:
+        return None
+    try:
+        previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+    except OSError:
+        return None
+    return previous
+
+
+def _unpin(previous):
+    if previous is not None:
+        try:
+            os.sched_setaffinity(0, previous)
+        except OSError:
+            pass
+
+
+@contextlib.contextmanager
+def allocated(cpus, memory=None):
+    """Bind the check running in the current thread to the CPUs allocated to it, and to the memory (GiB) allocated to
+    it, checks running several tools at once keep them within it
+
+    The thread is pinned to the CPUs: the tools it launches inherit the affinity when they are forked, before they start
+    any thread or process of their own.
+    """
+    previous = getattr(_current, 'cpus', None), getattr(_current, 'memory', None)
+    _current.cpus = list(cpus)
+    _current.memory = memory
+    affinity = _pin(_current.cpus)
+    try:
+        yield _current.cpus
+    finally:
+        _unpin(affinity)
+        _current.cpus, _current.memory = previous
+
+
+def allocated_cpus():
+    """CPUs allocated to the check running in the current thread, all the CPUs the process may run on otherwise"""
+    cpus = getattr(_current, 'cpus', None)
+    return cpus if cpus else sorted(os.sched_getaffinity(0))
+
+
+def allocated_memory():
+    """Memory (GiB) allocated to the check running in the current thread, None if it is not limited"""
+    return getattr(_current, 'memory', None)
+
+
+def concurrent_tools(count, tool_memory):
+    """Number of tools of the check running in the current thread that may run at once, up to count: one per allocated
+    CPU, as many as the allocated memory holds when each tool occupies tool_memory GiB"""
+    count = min(count, len(allocated_cpus()))
+    memory = allocated_memory()
+    if memory is not None and tool_memory:
+        count = min(count, int(memory // tool_memory))
+    return max(1, count)
+
+
+@contextlib.contextmanager
+def cancellable(token):
+    """Bind the check running in the current thread to a CancelToken"""
+    previous = getattr(_current, 'token', None)
+    _current.token = token
+    try:
+        yield token
+    finally:
+        _current.token = previous
+
+
+def bound(function):
+    """Wrap a function run in another thread on behalf of the check running in the current thread (e.g. to run two tools
+    of the check concurrently): the tools it launches are cancelled with the check, pinned to its CPUs and accounted to it"""
+    context = {name: getattr(_current, name) for name in ['token', 'cpus', 'memory', 'record', 'expected'] if hasattr(_current, name)}
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        previous = {name: getattr(_current, name, None) for name in context}
+        for name, value in context.items():
+            setattr(_current, name, value)
+        affinity = _pin(context.get('cpus'))
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _unpin(affinity)
+            for name, value in previous.items():
+                setattr(_current, name, value)
+    return wrapper
+
+
+def current_token():
+    """CancelToken the check running in the current thread is bound to"""
+    token = getattr(_current, 'token', None)
+    return token if token else CancelToken()
+
+
+def _terminate(process, sig=signal.SIGTERM):
+    try:
+        os.killpg(process.pid, sig)
+    except OSError:
+        pass
+
+
+def _tool_name(cmd):
+    """Name of the tool (and the script it runs) launched by cmd, e.g. 'klayout xor.rb.drc'"""
+    tool = Path(str(cmd[0])).name
+    arguments = [str(arg) for arg in cmd[1:] if not str(arg).startswith('-')]
+    if tool in ['bash', 'sh', 'ruby', 'python3'] and arguments:
+        return Path(arguments[0]).name
+    scripts = [Path(str(arg)).name for arg in cmd[1:] if Path(str(arg)).suffix in SCRIPT_SUFFIXES]
+    return f"{tool} {scripts[0]}" if scripts else tool
+
+
+def _usage_record(name):
+    return dict(name=name, wall=0.0, user=0.0, sys=0.0, peak_rss=0)
+
+
+@contextlib.contextmanager
+def measure(name, expected=None):
+    """Measure the wall time, CPU time and peak RSS of a check running in the current thread
+
+    The CPU time is the time spent by the thread plus the time spent by the tools launched through run(),
+    the peak RSS is the largest peak RSS (in KiB) of those tools (0 for checks running no tool). The precheck process
+    is shared by the checks running at the same time and only reports its peak RSS over its lifetime: that peak is
+    recorded apart, as process_peak_rss, and is not attributable to the check.
+    `expected` maps the tools of the check to their wall time in previous runs, it is used for the ETA of the tools.
+    """
+    record = _usage_record(name)
+    record['tools'] = []
+    previous = getattr(_current, 'record', None), getattr(_current, 'expected', None)
+    _current.record = record
+    _current.expected = expected if expected else {}
+    start_wall = time.monotonic()
+    start = resource.getrusage(resource.RUSAGE_THREAD)
+    try:
+        yield record
+    finally:
+        end = resource.getrusage(resource.RUSAGE_THREAD)
+        _current.record, _current.expected = previous
+        record['wall'] += time.monotonic() - start_wall
+        record['user'] += end.ru_utime - start.ru_utime
+        record['sys'] += end.ru_stime - start.ru_stime
+        record['peak_rss'] = max([0] + [tool['peak_rss'] for tool in record['tools']])
+        record['process_peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def share_last_tool(shares):
+    """Give away shares of the usage of the last tool run by the check measured in the current thread, e.g. of a tool
+    that did the work of several checks at once (see check_manager.klayout_session)
+
+    `shares` maps other checks to the fraction of the usage of the tool they get, the rest stays with the current check.
+    Returns {check: usage record of its share}, to be accounted to the check while it is measured (see account).
+    """
+    record = getattr(_current, 'record', None)
+    if record is None or not record['tools']:
+        return {}
+    given = {}
+    with _record_lock:
+        tool = record['tools'][-1]
+        for check, share in shares.items():
+            part = given[check] = _usage_record(tool['name'])
+            part.update(wall=tool['wall'] * share, user=tool['user'] * share, sys=tool['sys'] * share, peak_rss=tool['peak_rss'], shared=True)
+        for key in ['wall', 'user', 'sys']:
+            moved = sum(part[key] for part in given.values())
+            tool[key] -= moved
+            # note: the wall time of the check is added once it is measured, the share given away is taken off beforehand
+            record[key] -= moved
+    return given
+
+
+def account(tool):
+    """Account a usage record (see share_last_tool) to the check measured in the current thread"""
+    record = getattr(_current, 'record', None)
+    if record is None:
+        return
+    with _record_lock:
+        record['tools'].append(tool)
+        for key in ['wall', 'user', 'sys']:
+            record[key] += tool[key]
+
+
+def _wait(process, monitor):
+    """Wait for the child to exit without reaping it, following its progress meanwhile; returns True if it hung"""
+    try:
+        pidfd = os.pidfd_open(process.pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    hung = None
+    try:
+        while os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT | os.WNOHANG) is None:
+            if pidfd is not None:
+                select.select([pidfd], [], [], MONITOR_INTERVAL if monitor else None)
+            else:
+                time.sleep(WAIT_INTERVAL)
+            if monitor is None:
+                continue
+            if hung is None and monitor.poll():
+                hung = time.monotonic()
+                logging.error(f"{{{{HUNG}}}} {monitor.name} neither wrote output nor used CPU time for {monitor.idle():.0f}s, terminating it")
+                _terminate(process)
+            elif hung is not None and time.monotonic() - hung > KILL_TIMEOUT:
+                _terminate(process, signal.SIGKILL)
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+    return hung is not None
+
+
+def run(cmd, stdout=None, stderr=None, env=None, cwd=None, progress=None):
+    """subprocess.run replacement that accounts the resources used by the child process tree
+
+    The child is reaped through wait4, its rusage (which includes all descendants it waited for) is
+    added to the check measured in the current thread. The child inherits the affinity of the thread, i.e. the
+    CPUs allocated to the check (see allocated). Raises CheckCancelled if the CancelToken the
+    current thread is bound to was cancelled before or while the child ran.
+
+    While a child writing to a log file runs, its output is followed (see checks.utils.progress.ToolMonitor):
+    `progress` parses it into {{STEP UPDATE}} lines and a child that stopped making progress is terminated.
+    """
+    token = getattr(_current, 'token', None) or CancelToken()
+    start_wall = time.monotonic()
+    with token.lock:
+        if token.cancelled:
+            raise CheckCancelled(_tool_name(cmd))
+        process = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, env=env, cwd=cwd, start_new_session=True)
+        token.processes.add(process)
+    log_path = getattr(stdout, 'name', None)
+    monitor = None
+    if isinstance(log_path, str):
+        monitor = ToolMonitor(_tool_name(cmd), log_path, process.pid, progress, getattr(_current, 'expected', {}).get(_tool_name(cmd)))
+    try:
+        # note: wait without reaping first, the process group must not be signalled once its pid may be reused
+        hung = _wait(process, monitor)
+        with token.lock:
+            token.processes.discard(process)
+        _, status, rusage = os.wait4(process.pid, 0)
+    except BaseException:
+        with token.lock:
+            token.processes.discard(process)
+            _terminate(process, signal.SIGKILL)
+        process.wait()
+        raise
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    record = getattr(_current, 'record', None)
+    if record is not None:
+        tool = _usage_record(_tool_name(cmd))
+        tool.update(wall=time.monotonic() - start_wall, user=rusage.ru_utime, sys=rusage.ru_stime, peak_rss=rusage.ru_maxrss, returncode=process.returncode)
+        if hung:
+            tool['hung'] = True
+        with _record_lock:
+            record['tools'].append(tool)
+            record['user'] += rusage.ru_utime
+            record['sys'] += rusage.ru_stime
+    if token.cancelled:
+        raise CheckCancelled(_tool_name(cmd))
+    return subprocess.CompletedProcess(process.args, process.returncode)
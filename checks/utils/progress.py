@@ -0,0 +1,210 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+# Note: seconds between two looks at the output & CPU time of a tool, and between two progress updates of a tool
+MONITOR_INTERVAL = 10
+PROGRESS_INTERVAL = 60
+# Note: seconds without output nor CPU time after which a tool is considered hung and terminated (PRECHECK_HANG_TIMEOUT)
+HANG_TIMEOUT = float(os.environ.get('PRECHECK_HANG_TIMEOUT', 900))
+
+
+class ToolProgress:
+    """Progress of a tool parsed from its output: steps done, total steps (None if unknown) & current stage
+
+    The default parser counts the lines written by the tool.
+    """
+    unit = 'lines'
+
+    def __init__(self):
+        self.done = 0
+        self.total = None
+        self.stage = None
+
+    def feed(self, line):
+        self.done += 1
+
+
+class KLayoutProgress(ToolProgress):
+    """Progress of a KLayout DRC deck run in verbose mode, measured by the deck line of the operation being executed"""
+    unit = 'deck lines'
+
+    def __init__(self, script_path):
+        super().__init__()
+        self.script_name = Path(script_path).name
+        try:
+            with open(script_path, errors='ignore') as f:
+                self.total = sum(1 for _ in f)
+        except OSError:
+            self.total = None
+        # note: e.g. '"width" in: sky130A_mr.drc:1234'
+        self.operation = re.compile(r'^"([^"]+)" in: (.+):(\d+)\s*$')
+
+    def feed(self, line):
+        match = self.operation.match(line)
+        if match and Path(match.group(2)).name == self.script_name:
+            self.done = max(self.done, int(match.group(3)))
+            self.stage = f'"{match.group(1)}"'
+
+
+class KLayoutXorProgress(ToolProgress):
+    """Progress of the XOR deck, measured by the layers compared so far"""
+    unit = 'layers'
+
+    def feed(self, line):
+        match = re.search(r'--- Running XOR for (\S+) ---', line)
+        if match:
+            self.done += 1
+            self.stage = match.group(1)
+
+
+class KLayoutSessionProgress(ToolProgress):
+    """Progress of a KLayout session running several DRC decks, measured by the decks finished so far"""
+    unit = 'decks'
+
+    def __init__(self, decks):
+        super().__init__()
+        self.total = decks
+
+    def feed(self, line):
+        match = re.match(r'--- (Running|Finished) deck (\S+)', line)
+        if match:
+            self.done += match.group(1) == 'Finished'
+            self.stage = match.group(2)
+
+
+class MagicProgress(ToolProgress):
+    """Progress of Magic: the cells read from the GDS, then the stage announced by the script"""
+    unit = 'cells read'
+
+    def feed(self, line):
+        if line.startswith('Reading "'):
+            self.done += 1
+            self.stage = 'reading the GDS'
+        elif line.startswith('[INFO]: Loading'):
+            self.stage = 'DRC check'
+
+
+class BeCheckProgress(ToolProgress):
+    """Progress of the LVS & OEB scripts, measured by the stages they announced (e.g. 'Running extract...')"""
+    unit = 'stages'
+
+    def feed(self, line):
+        match = re.match(r'^Running (.+?)\.\.\.', line)
+        if match:
+            self.done += 1
+            self.stage = match.group(1)
+
+
+def session_cpu_time(session_id):
+    """CPU time (seconds) of the processes of a session, including their reaped children"""
+    ticks = 0
+    for stat_path in Path('/proc').glob('[0-9]*/stat'):
+        try:
+            fields = stat_path.read_text().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[3]) == session_id:
+            ticks += sum(int(x) for x in fields[11:15])
+    return ticks / os.sysconf('SC_CLK_TCK')
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s" if seconds >= 60 else f"{seconds}s"
+
+
+class ToolMonitor:
+    """Follows a tool while it runs: parses the output it appends to its log file, logs a {{STEP UPDATE}} line with
+    rate & ETA every PROGRESS_INTERVAL seconds and detects a tool that neither wrote output nor used CPU time for
+    HANG_TIMEOUT seconds
+
+    Arguments:
+        name: Name of the tool.
+        log_path: Log file the tool writes to.
+        session_id: Session of the tool (the tools run in their own session).
+        progress: ToolProgress parsing the output of the tool.
+        expected: Wall time (seconds) of the tool measured in previous runs, used for the ETA when the total is unknown.
+    """
+
+    def __init__(self, name, log_path, session_id, progress=None, expected=None):
+        self.name = name
+        self.log_path = log_path
+        self.session_id = session_id
+        self.progress = progress if progress else ToolProgress()
+        self.expected = expected
+        self.start = self.last_poll = self.last_update = self.last_activity = time.monotonic()
+        self.offset = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        self.partial = ''
+        self.cpu_time = 0
+
+    def poll(self):
+        """Look at the tool if MONITOR_INTERVAL elapsed, returns True once the tool is considered hung"""
+        now = time.monotonic()
+        if now - self.last_poll < MONITOR_INTERVAL:
+            return False
+        self.last_poll = now
+        cpu_time = session_cpu_time(self.session_id)
+        if self._read_output() or cpu_time > self.cpu_time:
+            self.last_activity = now
+        self.cpu_time = max(self.cpu_time, cpu_time)
+        if now - self.last_update >= PROGRESS_INTERVAL:
+            self.last_update = now
+            logging.info(f"{{{{STEP UPDATE}}}} {self.name}: {self.describe(now - self.start)}")
+        return now - self.last_activity >= HANG_TIMEOUT
+
+    def idle(self):
+        """Seconds since the tool last wrote output or used CPU time"""
+        return time.monotonic() - self.last_activity
+
+    def _read_output(self):
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return False
+        self.offset += len(data)
+        lines = (self.partial + data.decode('utf-8', errors='replace')).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.progress.feed(line)
+        return bool(data)
+
+    def describe(self, elapsed):
+        progress = self.progress
+        description = f"{format_duration(elapsed)} elapsed"
+        eta = None
+        if progress.total and progress.done:
+            description += f", {progress.done} of {progress.total} {progress.unit} ({100 * progress.done / progress.total:.0f}%)"
+            eta = (progress.total - progress.done) * elapsed / progress.done
+        elif progress.done:
+            description += f", {progress.done} {progress.unit}"
+        if progress.done:
+            description += f" at {progress.done * 60 / elapsed:.1f} {progress.unit}/min"
+        if progress.stage:
+            description += f", {progress.stage}"
+        if eta is None and self.expected:
+            eta = self.expected - elapsed
+        if eta is not None:
+            description += f", ETA {format_duration(eta)}" if eta > 0 else f", running {format_duration(-eta)} longer than the previous runs"
+        return description
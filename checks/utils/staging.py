@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    from checks.utils.gds import register_copy
+except ImportError:
+    from utils.gds import register_copy
+
+# Note: where the user GDS is staged (PRECHECK_STAGING): unset, it is staged to /dev/shm only when it lives on a network
+# filesystem; set to a directory, it is always staged there; set to 'off', it is never staged
+STAGING = os.environ.get('PRECHECK_STAGING')
+DEFAULT_STAGING_DIRECTORY = '/dev/shm'
+# Note: filesystems every check would otherwise read the GDS from over the network (or through a VM boundary)
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ceph', 'lustre', 'gpfs', 'glusterfs', 'beegfs', '9p',
+                       'virtiofs', 'fakeowner', 'fuse.sshfs', 'fuse.gcsfuse', 'fuse.grpcfuse', 'fuse.s3fs'}
+# Note: free space left on the staging filesystem once the GDS is staged, as a multiple of the GDS size (the checks
+# write their own outputs & the tools their temporary files, e.g. in /dev/shm)
+SPACE_MARGIN = 1
+
+
+def filesystem_type(path):
+    """Type of the filesystem path is on (e.g. 'ext4', 'nfs4'), None if it is unknown"""
+    path = os.path.realpath(path)
+    mount_point, filesystem = '', None
+    try:
+        with open('/proc/self/mounts') as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return None
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        # note: spaces & tabs of the mount points are octal escaped, e.g. '\040'
+        point = fields[1].encode('latin-1').decode('unicode_escape')
+        if (path == point or path.startswith(point.rstrip('/') + '/')) and len(point) >= len(mount_point):
+            mount_point, filesystem = point, fields[2]
+    return filesystem
+
+
+def read_ahead(path):
+    """Ask the kernel to read the whole file into the page cache in the background"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class StagedGds:
+    """User GDS read by the checks, staged once to node-local storage (a copy in /dev/shm or PRECHECK_STAGING) when it
+    lives on a network filesystem
+
+    The checks get the staged path from `checkout`, which counts the checks reading it. The staged copy is removed by
+    `release` once the run is over.
+
+    Arguments:
+        source: The GDS of the project.
+        path: The file the checks read, the staged copy or the source itself when it was not staged.
+    """
+
+    def __init__(self, source, path=None):
+        self.source = Path(source)
+        self.path = Path(path) if path else self.source
+        self.readers = []
+        self.lock = threading.Lock()
+
+    @property
+    def staged(self):
+        return self.path != self.source
+
+    @classmethod
+    def stage(cls, source, staging=STAGING):
+        source = Path(source)
+        filesystem = filesystem_type(source)
+        if staging == 'off' or not source.exists() or (not staging and filesystem not in NETWORK_FILESYSTEMS):
+            read_ahead(source)
+            return cls(source)
+        directory = Path(staging or DEFAULT_STAGING_DIRECTORY)
+        size = source.stat().st_size
+        try:
+            statvfs = os.statvfs(directory)
+        except OSError as e:
+            logging.warning(f"{{{{GDS STAGING}}}} {source.name} is read in place, the staging directory {directory} is not usable: {e}")
+            read_ahead(source)
+            return cls(source)
+        if statvfs.f_bavail * statvfs.f_frsize < (1 + SPACE_MARGIN) * size:
+            logging.warning(f"{{{{GDS STAGING}}}} {source.name} is read in place, {directory} has {statvfs.f_bavail * statvfs.f_frsize / 1024 ** 3:.1f} GiB free for a {size / 1024 ** 3:.1f} GiB GDS")
+            read_ahead(source)
+            return cls(source)
+
+        start = time.monotonic()
+        staging_directory = None
+        try:
+            staging_directory = tempfile.mkdtemp(prefix='precheck_', dir=directory)
+            # note: the staged copy keeps the name of the GDS, it is the name the checks report
+            path = Path(staging_directory) / source.name
+            shutil.copyfile(source, path)
+            shutil.copystat(source, path)
+            # note: the indexes of the staged copy are keyed on the source, they are reused by the later runs
+            register_copy(path, source)
+        except OSError as e:
+            if staging_directory:
+                shutil.rmtree(staging_directory, ignore_errors=True)
+            logging.warning(f"{{{{GDS STAGING}}}} {source.name} is read in place, failed to stage it to {directory}: {e}")
+            read_ahead(source)
+            return cls(source)
+        read_ahead(path)
+        elapsed = time.monotonic() - start
+        logging.info(f"{{{{GDS STAGING}}}} Staged {source} ({size / 1024 ** 2:.0f} MiB, {filesystem} filesystem) to {path} in {elapsed:.1f}s "
+                     f"({size / 1024 ** 2 / max(elapsed, 1e-3):.0f} MiB/s)")
+        return cls(source, path)
+
+    def checkout(self, reader):
+        """Path of the GDS for a check (reader), counted in the staging statistics"""
+        with self.lock:
+            if reader not in self.readers:
+                self.readers.append(reader)
+        return self.path
+
+    def release(self):
+        if not self.staged:
+            return
+        logging.info(f"{{{{GDS STAGING}}}} {len(self.readers)} check(s) read the staged {self.path} instead of {self.source}: {self.readers}")
+        shutil.rmtree(self.path.parent, ignore_errors=True)
@@ -13,26 +13,83 @@
 # limitations under the License.
 # SPDX-License-Identifier: Apache-2.0
 
-import gzip
-import hashlib
+import functools
+import glob
 import json
 import logging
 import os
 import re
 import shutil
-import subprocess
 import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    from checks.utils import process
+    from checks.utils.archive import archive_hash, decompress, find_archives
+    from checks.utils.hashing import file_hash, file_hashes, persist_hashes, release_hashes
+    from checks.utils.progress import BeCheckProgress
+except ImportError:
+    from utils import process
+    from utils.archive import archive_hash, decompress, find_archives
+    from utils.hashing import file_hash, file_hashes, persist_hashes, release_hashes
+    from utils.progress import BeCheckProgress
 
-def uncompress_gds(project_path, caravel_root):
-    cmd = f"make -f {caravel_root}/Makefile uncompress;"
-    try:
-        logging.info(f"{{{{EXTRACTING FILES}}}} Extracting compressed files in: {project_path}")
-        subprocess.run(cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, shell=True, cwd=str(project_path))
-    except subprocess.CalledProcessError as error:
-        logging.info(f"{{{{EXTRACTING FILES ERROR}}}} Make 'uncompress' Error: {error}")
-        sys.exit(252)
+
+def uncompress_gds(project_path, cache=None):
+    """Decompress the .gz files & split archives of the project next to them, like the caravel 'uncompress' target
+
+    The archives are decompressed concurrently. With a DecompressedCache, a decompressed file is restored from the
+    cache when the same archive was decompressed before.
+    """
+    archives = find_archives(project_path)
+    if not archives:
+        return
+    logging.info(f"{{{{EXTRACTING FILES}}}} Extracting {len(archives)} compressed file(s) in: {project_path}")
+
+    def extract(target, parts):
+        if target.exists():
+            logging.warning(f"{{{{EXTRACTING FILES}}}} {target} already exists, {parts[0].name} is not extracted")
+            return None
+        key = archive_hash(parts) if cache else None
+        staging = target.with_name(f".{target.name}.partial")
+        try:
+            size = cache.restore(key, staging) if cache else None
+            cached = size is not None
+            if not cached:
+                size = decompress(parts, staging)
+            os.replace(staging, target)
+        finally:
+            staging.unlink(missing_ok=True)
+        if cache and not cached:
+            try:
+                cache.store(key, target)
+            except OSError as e:
+                logging.warning(f"{{{{EXTRACTING FILES}}}} Failed to store {target.name} in the cache: {e}")
+        compressed_size = sum(part.stat().st_size for part in parts)
+        for part in parts:
+            part.unlink()
+        return compressed_size, size, cached
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=min(len(archives), len(os.sched_getaffinity(0)))) as executor:
+        futures = {target: executor.submit(extract, target, parts) for target, parts in archives.items()}
+        extracted = []
+        for target, future in futures.items():
+            try:
+                result = future.result()
+            except (OSError, zlib.error) as error:
+                logging.fatal(f"{{{{EXTRACTING FILES ERROR}}}} Failed to extract {target}: {error}")
+                sys.exit(252)
+            if result:
+                extracted.append(result)
+    wall = max(time.monotonic() - start, 1e-3)
+    compressed_size = sum(x[0] for x in extracted) / 1024 ** 2
+    size = sum(x[1] for x in extracted) / 1024 ** 2
+    logging.info(f"{{{{EXTRACTING FILES}}}} Extracted {len(extracted)} file(s) ({len([x for x in extracted if x[2]])} from the cache): "
+                 f"{compressed_size:.1f} MiB into {size:.1f} MiB in {wall:.1f}s ({size / wall:.1f} MiB/s)")
 
 
 def is_binary_file(filename):
@@ -44,22 +101,10 @@ def is_not_binary_file(filename):
     return not is_binary_file(filename)
 
 
-def file_hash(filename):
-    def is_compressed(filename):
-        with open(filename, 'rb') as f:
-            return f.read(2) == b'\x1f\x8b'
-
-    BSIZE = 65536
-    sha1 = hashlib.sha1()
-    f = gzip.open(filename, 'rb') if is_compressed(filename) else open(filename, 'rb')
-
-    while True:
-        data = f.read(BSIZE)
-        if not data:
-            break
-        sha1.update(data)
-    f.close()
-    return sha1.hexdigest()
+@functools.lru_cache(maxsize=None)
+def golden_file_hash(filename):
+    """file_hash of a read-only asset (golden caravel, default content, check scripts), computed once per process"""
+    return file_hash(filename)
 
 
 def get_project_config(project_path, caravel_root):
@@ -131,6 +176,31 @@ def substitute_env_variables(string, env):
                 return None
     return string
 
+def get_be_check_inputs(design_directory, config_file):
+    """Project files read by the LVS & OEB checks: the LVS configuration files and the files of the project they reference"""
+    be_env = dict(UPRJ_ROOT=str(design_directory))
+    config_files = [Path(config_file)]
+    inputs = []
+    while config_files:
+        config_file = config_files.pop(0)
+        if config_file in inputs or not config_file.is_file():
+            continue
+        inputs.append(config_file)
+        with open(config_file) as f:
+            data = json.load(f)
+        for key, value in data.items():
+            for item in value if type(value) == list else [value]:
+                for word in re.sub(r'\$(\w+)', lambda x: be_env.get(x.group(1), x.group(0)), str(item)).split():
+                    # note: only the files of the project are accounted, the PDK & the tools are part of the run info
+                    for path in sorted(glob.glob(word.split('#')[0])):
+                        path = Path(path)
+                        if key == 'INCLUDE_CONFIGS':
+                            config_files.append(path)
+                        elif path.is_file() and design_directory in path.parents and path not in inputs:
+                            inputs.append(path)
+    return inputs
+
+
 def print_lvs_config(be_env):
     for lvs_key in ['EXTRACT_FLATGLOB', 'EXTRACT_ABSTRACT', 'LVS_FLATTEN', 'LVS_NOFLATTEN', 'LVS_IGNORE', 'LVS_SPICE_FILES', 'LVS_VERILOG_FILES', 'LAYOUT_FILE']:
         if lvs_key in be_env:
@@ -220,7 +290,7 @@ def run_be_check(design_directory, output_directory, design_name, config_file, p
     with open(log_file_path, 'w') as be_log:
         logging.info(f"run: {be_script}")
         logging.info(f"{check} output directory: {output_directory}")
-        p = subprocess.run(be_cmd, stderr=be_log, stdout=be_log, env=be_env)
+        p = process.run(be_cmd, stderr=be_log, stdout=be_log, env=be_env, progress=BeCheckProgress())
         # Check exit-status of all subprocesses
         stat = p.returncode
         if stat == 4:
@@ -14,20 +14,294 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import hashlib
+import json
 import logging
 import os
-import subprocess
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from checks.utils import utils
+from checks.utils import process, utils
+from checks.utils.gds import GdsError, merge_libraries, structure_index
+from checks.utils.progress import KLayoutXorProgress, MagicProgress
 
+# Note: engine erasing the user area before the XOR (PRECHECK_XOR_ENGINE): 'magic' runs the erase_box*.tcl scripts and
+# writes the erased GDSes, 'klayout' clips & erases the same boxes in the XOR deck on the layouts it loads anyway
+XOR_ENGINE = os.environ.get('PRECHECK_XOR_ENGINE', 'magic')
+# Note: GDS layer/datatype of the magic layers erased by the erase_box*.tcl scripts, per PDK
+MAGIC_LAYERS = {'sky130': {'metal4': '71/20', 'metal5': '72/20'},
+                'gf180mcu': {'metal4': '46/0', 'metal5': '81/0'}}
 
-def gds_xor_check(input_directory, output_directory, magicrc_file_path, gds_golden_wrapper_file_path, project_config, precheck_config):
+
+def erased_golden_key(gds_golden_wrapper_file_path, tcl_erase_box_file_path, magicrc_file_path, project_config, precheck_config):
+    """Key of the erased golden wrapper in the golden cache: everything the magic erase stage depends on"""
+    description = dict(golden_wrapper=utils.golden_file_hash(gds_golden_wrapper_file_path),
+                       script=utils.golden_file_hash(tcl_erase_box_file_path),
+                       magicrc=utils.golden_file_hash(magicrc_file_path),
+                       cell_name=project_config['user_module'],
+                       run_info={key: value for key, value in precheck_config.get('run_info', {}).items() if key != 'gds_hash'})
+    return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def plan_shards(index, shards):
+    """Split the layers of the user GDS into at most `shards` shards of similar work, the number of shapes on the layers
+
+    Returns {'layer/datatype': shard}, the layers are assigned heaviest first to the lightest shard.
+    """
+    weights = {}
+    for cell in index.cells.values():
+        for layer, shapes in cell['layers'].items():
+            weights[layer] = weights.get(layer, 0) + shapes
+    loads = [0] * shards
+    plan = {}
+    for layer in sorted(weights, key=lambda x: (-weights[x], x)):
+        shard = loads.index(min(loads))
+        plan[layer] = shard
+        loads[shard] += weights[layer]
+    return plan
+
+
+def read_layer_differences(layers_file_path):
+    """Differences per layer written by xor.rb.drc: [dict(layer, count, bbox=[left, bottom, right, top] or None)]"""
+    differences = []
+    try:
+        with open(layers_file_path) as layers_file:
+            for line in layers_file:
+                fields = line.split()
+                if len(fields) >= 2:
+                    differences.append(dict(layer=fields[0], count=int(fields[1]), bbox=[float(x) for x in fields[2:6]] if len(fields) >= 6 else None))
+    except (OSError, ValueError):
+        pass
+    return differences
+
+
+def parse_erase_script(tcl_erase_box_file_path):
+    """Geometry of an erase_box*.tcl script: the (box, top_only) flattened into xor_target and the (magic layer, box)
+    erased from it
+
+    The boxes are [left, bottom, right, top] in microns. top_only boxes were flattened with -nosubcircuits, only the
+    shapes of the top cell itself are copied from them. The label options (-nolabels, -dotoplabels) do not matter to
+    the XOR, which only compares shapes; a flatten the XOR deck can not reproduce raises a ValueError.
+    """
+    clip_boxes = []
+    erase_boxes = []
+    box = None
+    with open(tcl_erase_box_file_path) as tcl_erase_box_file:
+        for line in tcl_erase_box_file:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 'box':
+                values = fields[2:] if fields[1:2] == ['values'] else fields[1:]
+                box = [to_microns(x) for x in values]
+                box = [min(box[0], box[2]), min(box[1], box[3]), max(box[0], box[2]), max(box[1], box[3])]
+            elif fields[0] == 'flatten' and fields[-1] == 'xor_target' and box:
+                options = set(fields[1:-1])
+                unsupported = options - {'-dobox', '-nolabels', '-dotoplabels', '-nosubcircuits'}
+                if '-dobox' not in options or unsupported:
+                    raise ValueError(f"Unsupported flatten options {sorted(unsupported) or ['without -dobox']} in {tcl_erase_box_file_path}")
+                clip_boxes.append((box, '-nosubcircuits' in options))
+            elif fields[0] == 'erase' and len(fields) == 2 and box:
+                erase_boxes.append((fields[1], box))
+    return clip_boxes, erase_boxes
+
+
+def magic_output_layers(tech_file_path):
+    """GDS layers/datatypes ('layer/datatype') magic writes, the calma layers of the first (default) cifoutput style of
+    its tech file, the layers of every variant of the style"""
+    layers = set()
+    section = None
+    styles = 0
+    with open(tech_file_path, errors='replace') as tech_file:
+        for line in tech_file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if section is None:
+                section = fields[0]
+            elif fields[0] == 'end' and len(fields) == 1:
+                if section == 'cifoutput':
+                    break
+                section = None
+            elif section == 'cifoutput' and fields[0] == 'style':
+                styles += 1
+                if styles > 1:
+                    break
+            elif section == 'cifoutput' and fields[0] == 'calma' and len(fields) >= 3:
+                layers.add(f"{int(fields[1])}/{int(fields[2])}")
+    return sorted(layers)
+
+
+def to_microns(value):
+    if value.endswith('um'):
+        return float(value[:-2])
+    if float(value) != 0:
+        raise ValueError(f"Unsupported box coordinate {value}, expected microns")
+    return 0.0
+
+
+def write_erase_boxes(tcl_erase_box_file_path, pdk_path, erase_boxes_file_path):
+    """Translate an erase_box*.tcl script for the XOR deck: lines of "clip left bottom right top" (or "clip_top" for the
+    boxes only the shapes of the top cell are copied from) and of "erase layer/datatype left bottom right top" (in
+    microns), and the "layer layer/datatype" lines of the layers magic writes (see magic_output_layers), the only
+    layers an XOR of the GDSes erased by magic compares"""
+    layers = next(layers for prefix, layers in MAGIC_LAYERS.items() if pdk_path.name.startswith(prefix))
+    clip_boxes, erase_boxes = parse_erase_script(tcl_erase_box_file_path)
+    tech_file_path = pdk_path / f"libs.tech/magic/{pdk_path.name}.tech"
+    try:
+        output_layers = magic_output_layers(tech_file_path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"{{{{XOR CHECK UPDATE}}}} Failed to read the GDS layers magic writes from {tech_file_path}, all the layers are compared: {e}")
+        output_layers = []
+    with open(erase_boxes_file_path, 'w') as erase_boxes_file:
+        for box, top_only in clip_boxes:
+            erase_boxes_file.write(f"{'clip_top' if top_only else 'clip'} {' '.join(str(x) for x in box)}\n")
+        for layer, box in erase_boxes:
+            erase_boxes_file.write(f"erase {layers[layer]} {' '.join(str(x) for x in box)}\n")
+        for layer in output_layers:
+            erase_boxes_file.write(f"layer {layer}\n")
+
+
+def erase_box_script(pdk_path, project_type):
+    """erase_box*.tcl script erasing the user area of the wrapper of the project type"""
+    parent_directory = Path(__file__).parent
+    if 'gf180mcu' in pdk_path.stem:
+        return parent_directory / 'erase_box_gf180mcu.tcl'
+    elif project_type == "openframe":
+        return parent_directory / 'erase_box_openframe.tcl'
+    elif project_type == "mini":
+        return parent_directory / 'erase_box_mini4.tcl'
+    return parent_directory / 'erase_box.tcl'
+
+
+def run_xor_shards(gds_a_path, gds_b_path, top_cell, erase_boxes_file_path, xor_gds_file_path, logs_directory, plan, shards, cpus, stop_on_first, xor_log, top_cell_b=None):
+    """XOR the two GDSes in one KLayout process per shard of the layers (see plan_shards)
+
+    With an erase_boxes_file_path (see write_erase_boxes), the XOR deck erases the user area of both GDSes itself.
+    top_cell_b is the top cell of the second GDS when it differs from top_cell.
+
+    With stop_on_first, every shard stops at its first layer with differences and the other shards are stopped as soon
+    as a shard found differences. Returns (total differences or None if a shard failed, differences per layer, whether
+    the XOR stopped early).
+    """
+    plan_file_path = logs_directory / 'xor_check.plan'
+    with open(plan_file_path, 'w') as plan_file:
+        plan_file.writelines(f"{layer} {shard}\n" for layer, shard in sorted(plan.items()))
+    check_token = process.current_token()
+    shards_token = check_token.child()
+
+    def run_shard(shard):
+        xor_command = ['klayout', '-b', '-r', Path(__file__).parent / 'xor.rb.drc',
+                       '-rd', 'ext=gds',
+                       '-rd', f'top_cell={top_cell}',
+                       '-rd', f'thr={max(1, cpus // shards)}',
+                       '-rd', f'a={gds_a_path}',
+                       '-rd', f'b={gds_b_path}',
+                       '-rd', f'o={xor_gds_file_path}.{shard}',
+                       '-rd', f'ol={xor_gds_file_path}.{shard}',
+                       '-rd', f'co={"XOR" if shards == 1 else f"XOR_{shard}"}',
+                       '-rd', f'plan={plan_file_path}',
+                       '-rd', f'shard={shard}',
+                       '-rd', f'stop_on_first={"true" if stop_on_first else "false"}',
+                       '-rd', f'xor_total_file_path={logs_directory / f"xor_check.{shard}.total"}',
+                       '-rd', f'xor_layers_file_path={logs_directory / f"xor_check.{shard}.layers"}']
+        if erase_boxes_file_path:
+            xor_command += ['-rd', f'erase_boxes={erase_boxes_file_path}']
+        if top_cell_b:
+            xor_command += ['-rd', f'top_cell_b={top_cell_b}']
+        with process.cancellable(shards_token), open(logs_directory / f"xor_check.{shard}.log", 'w') as shard_log:
+            try:
+                process.run(xor_command, stderr=shard_log, stdout=shard_log, progress=KLayoutXorProgress())
+            except process.CheckCancelled:
+                if check_token.cancelled:
+                    raise
+                # note: stopped, another shard found differences
+                return False
+        if stop_on_first and any(x['count'] for x in read_layer_differences(logs_directory / f"xor_check.{shard}.layers")):
+            shards_token.cancel()
+        return True
+
+    with ThreadPoolExecutor(max_workers=shards) as executor:
+        completed = list(executor.map(process.bound(run_shard), range(shards)))
+
+    total = 0
+    differences = []
+    for shard in range(shards):
+        shard_log_path = logs_directory / f"xor_check.{shard}.log"
+        with open(shard_log_path) as shard_log:
+            shutil.copyfileobj(shard_log, xor_log)
+        differences += read_layer_differences(logs_directory / f"xor_check.{shard}.layers")
+        if completed[shard] and total is not None:
+            try:
+                total += int((logs_directory / f"xor_check.{shard}.total").read_text())
+            except (OSError, ValueError):
+                logging.error(f"XOR CHECK FILE NOT FOUND in {logs_directory / f'xor_check.{shard}.total'}")
+                total = None
+        for path in [shard_log_path, logs_directory / f"xor_check.{shard}.total", logs_directory / f"xor_check.{shard}.layers"]:
+            path.unlink(missing_ok=True)
+    plan_file_path.unlink(missing_ok=True)
+
+    shard_gds_file_paths = [Path(f"{xor_gds_file_path}.{shard}") for shard in range(shards)]
+    try:
+        if shards == 1:
+            os.replace(shard_gds_file_paths[0], xor_gds_file_path)
+        else:
+            merge_libraries([path for shard, path in enumerate(shard_gds_file_paths) if completed[shard]], xor_gds_file_path)
+    except (GdsError, OSError, ValueError) as e:
+        logging.warning(f"{{{{XOR CHECK UPDATE}}}} Failed to write the XOR differences to {xor_gds_file_path}: {e}")
+    for path in shard_gds_file_paths:
+        path.unlink(missing_ok=True)
+    return total, sorted(differences, key=lambda x: x['layer']), stop_on_first and any(x['count'] for x in differences)
+
+
+def magic_erase_box(gds_ut_path, gds_golden_wrapper_file_path, tcl_erase_box_file_path, magicrc_file_path, outputs_directory, logs_directory, project_config, precheck_config, xor_log):
+    """Erase the user area of the user GDS & of the golden wrapper with magic, returns the paths of the erased GDSes"""
+    # TODO: Try to pass the MAGTYPE as a commandline argument
+    os.environ['MAGTYPE'] = 'mag'
+
+    gds_ut_box_erased_path = outputs_directory / f"{project_config['user_module']}_erased.gds"
+    magic_gds_erase_box_ut_cmd = ['magic', '-dnull', '-noconsole', '-rcfile', magicrc_file_path, tcl_erase_box_file_path,
+                                  gds_ut_path, gds_ut_box_erased_path, project_config['user_module']]
+    gds_golden_wrapper_box_erased_file_path = outputs_directory / f"{project_config['golden_wrapper']}_erased.gds"
+    magic_gds_erase_box_golden_wrapper_cmd = ['magic', '-dnull', '-noconsole', '-rcfile', magicrc_file_path,
+                                              tcl_erase_box_file_path, gds_golden_wrapper_file_path,
+                                              gds_golden_wrapper_box_erased_file_path, project_config['user_module']]
+    # note: the erased golden wrapper only depends on golden assets, it is restored from the golden cache when possible
+    golden_cache = precheck_config.get('golden_cache')
+    golden_key = None
+    if golden_cache:
+        try:
+            golden_key = erased_golden_key(gds_golden_wrapper_file_path, tcl_erase_box_file_path, magicrc_file_path, project_config, precheck_config)
+        except OSError:
+            golden_key = None
+    restored = golden_cache.restore(golden_key, gds_golden_wrapper_box_erased_file_path) if golden_key else None
+    if restored is not None:
+        logging.info(f"{{{{XOR CHECK UPDATE}}}} {gds_golden_wrapper_box_erased_file_path.name} restored from the golden cache entry {golden_key[:12]}")
+    # note: both erase stages run concurrently, the golden one logs to a file of its own
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        erase_box_ut = executor.submit(process.bound(process.run), magic_gds_erase_box_ut_cmd, stderr=xor_log, stdout=xor_log, progress=MagicProgress())
+        if restored is None:
+            with open(logs_directory / 'xor_check_golden.log', 'w') as golden_log:
+                golden_process = process.run(magic_gds_erase_box_golden_wrapper_cmd, stderr=golden_log, stdout=golden_log, progress=MagicProgress())
+            if golden_key and golden_process.returncode == 0 and gds_golden_wrapper_box_erased_file_path.exists():
+                try:
+                    golden_cache.store(golden_key, gds_golden_wrapper_box_erased_file_path)
+                except OSError as e:
+                    logging.warning(f"{{{{CACHE}}}} Failed to store {gds_golden_wrapper_box_erased_file_path.name} in the golden cache: {e}")
+        erase_box_ut.result()
+    return gds_ut_box_erased_path, gds_golden_wrapper_box_erased_file_path
+
+
+def gds_xor_check(input_directory, output_directory, magicrc_file_path, gds_golden_wrapper_file_path, project_config, precheck_config, gds_ut_path=None, gds_index_path=None, stop_on_first=False,
+                  shard_memory=None):
     parent_directory = Path(__file__).parent
     logs_directory = output_directory / 'logs'
     outputs_directory = output_directory / 'outputs'
 
-    gds_ut_path = input_directory / 'gds' / f"{project_config['user_module']}.gds"
+    # note: the user GDS may be given as its staged copy
+    gds_ut_path = gds_ut_path if gds_ut_path else input_directory / 'gds' / f"{project_config['user_module']}.gds"
     xor_log_file_path = logs_directory / 'xor_check.log'
 
     if not gds_ut_path.exists():
@@ -37,71 +311,117 @@ def gds_xor_check(input_directory, output_directory, magicrc_file_path, gds_gold
     with open(xor_log_file_path, 'w') as xor_log:
         rb_gds_size_file_path = parent_directory / 'gds_size.rb'
         rb_gds_size_cmd = ['ruby', rb_gds_size_file_path, gds_ut_path, project_config['user_module']]
-        rb_gds_size_process = subprocess.run(rb_gds_size_cmd, stderr=xor_log, stdout=xor_log)
+        rb_gds_size_process = process.run(rb_gds_size_cmd, stderr=xor_log, stdout=xor_log)
         if rb_gds_size_process.returncode != 0:
             logging.error(f"Top cell name {project_config['user_module']} not found.")
             return False
 
-        # TODO: Try to pass the MAGTYPE as a commandline argument
-        os.environ['MAGTYPE'] = 'mag'
-
         # Erase box
-        gds_ut_box_erased_path = outputs_directory / f"{project_config['user_module']}_erased.gds"
-        if 'gf180mcu' in precheck_config['pdk_path'].stem:
-            tcl_erase_box_file_path = parent_directory / 'erase_box_gf180mcu.tcl'
-        elif project_config['type'] == "openframe":
-            tcl_erase_box_file_path = parent_directory / 'erase_box_openframe.tcl'
-        elif project_config['type'] == "mini":
-            tcl_erase_box_file_path = parent_directory / 'erase_box_mini4.tcl'
+        tcl_erase_box_file_path = erase_box_script(precheck_config['pdk_path'], project_config['type'])
+        erase_boxes_file_path = None
+        if XOR_ENGINE == 'klayout':
+            # note: the XOR deck erases the boxes itself, on the layouts it loads for the XOR
+            erase_boxes_file_path = logs_directory / 'xor_check.erase_boxes'
+            write_erase_boxes(tcl_erase_box_file_path, precheck_config['pdk_path'], erase_boxes_file_path)
+            gds_a_path, gds_b_path, top_cell = gds_ut_path, gds_golden_wrapper_file_path, project_config['user_module']
         else:
-            tcl_erase_box_file_path = parent_directory / 'erase_box.tcl'
-        magic_gds_erase_box_ut_cmd = ['magic', '-dnull', '-noconsole', '-rcfile', magicrc_file_path, tcl_erase_box_file_path,
-                                      gds_ut_path, gds_ut_box_erased_path, project_config['user_module']]
-        subprocess.run(magic_gds_erase_box_ut_cmd, stderr=xor_log, stdout=xor_log)
-        gds_golden_wrapper_box_erased_file_path = outputs_directory / f"{project_config['golden_wrapper']}_erased.gds"
-        magic_gds_erase_box_golden_wrapper_cmd = ['magic', '-dnull', '-noconsole', '-rcfile', magicrc_file_path,
-                                                  tcl_erase_box_file_path, gds_golden_wrapper_file_path,
-                                                  gds_golden_wrapper_box_erased_file_path, project_config['user_module']]
-        subprocess.run(magic_gds_erase_box_golden_wrapper_cmd, stderr=xor_log, stdout=xor_log)
+            gds_a_path, gds_b_path = magic_erase_box(gds_ut_path, gds_golden_wrapper_file_path, tcl_erase_box_file_path, magicrc_file_path,
+                                                     outputs_directory, logs_directory, project_config, precheck_config, xor_log)
+            top_cell = 'xor_target'
 
         # Check if the two resulting GDSes have any differences and write them to a file
-        klayout_rb_drc_xor_file_path = parent_directory / 'xor.rb.drc'
         xor_resulting_shapes_gds_file_path = outputs_directory / f"{project_config['user_module']}.xor.gds"
         xor_total_file_path = logs_directory / 'xor_check.total'
-        xor_command = ['klayout', '-b', '-r', klayout_rb_drc_xor_file_path,
-                       '-rd', 'ext=gds',
-                       '-rd', 'top_cell=xor_target',
-                       '-rd', f'thr={os.cpu_count()}',
-                       '-rd', f'a={gds_ut_box_erased_path}',
-                       '-rd', f'b={gds_golden_wrapper_box_erased_file_path}',
-                       '-rd', f'o={xor_resulting_shapes_gds_file_path}',
-                       '-rd', f'ol={xor_resulting_shapes_gds_file_path}',
-                       '-rd', f'xor_total_file_path={xor_total_file_path}']
-        subprocess.run(xor_command, stderr=xor_log, stdout=xor_log)
+        xor_report_file_path = outputs_directory / 'reports/xor_check.json'
+        cpus = len(process.allocated_cpus())
+        # note: every shard loads both layouts, the shards running at once have to fit into the memory allocated to the check
+        shards = process.concurrent_tools(cpus, shard_memory)
+        try:
+            plan = plan_shards(structure_index(gds_ut_path, gds_index_path), shards) if shards > 1 else {}
+        except (GdsError, OSError):
+            plan = {}
+        shards = len(set(plan.values())) or 1
+        if shards > 1:
+            logging.info(f"{{{{XOR CHECK UPDATE}}}} Comparing {len(plan)} layers in {shards} concurrent KLayout processes")
+        total, differences, stopped = run_xor_shards(gds_a_path, gds_b_path, top_cell, erase_boxes_file_path, xor_resulting_shapes_gds_file_path,
+                                                     logs_directory, plan, shards, cpus, stop_on_first, xor_log)
+        if erase_boxes_file_path:
+            erase_boxes_file_path.unlink(missing_ok=True)
 
-    try:
-        with open(xor_total_file_path) as xor_total:
-            xor_violations_count = xor_total.read()
-        logging.info(f"{{{{XOR CHECK UPDATE}}}} Total XOR differences: {xor_violations_count}, for more details view {xor_resulting_shapes_gds_file_path}")
-        if xor_violations_count == '0':
-            return True
-        else:
-            return False
-    except FileNotFoundError:
-        logging.error(f"XOR CHECK FILE NOT FOUND in {xor_total_file_path}")
+    with open(xor_report_file_path, 'w') as xor_report:
+        json.dump(dict(total=total, stopped_on_first=stopped, layers=differences), xor_report, indent=2)
+    if total is None:
         return False
+    with open(xor_total_file_path, 'w') as xor_total:
+        xor_total.write(str(total))
+    for layer in differences:
+        if layer['count']:
+            logging.info(f"{{{{XOR CHECK UPDATE}}}} Layer {layer['layer']}: {layer['count']} XOR differences within {layer['bbox']} (um)")
+    if stopped:
+        logging.info(f"{{{{XOR CHECK UPDATE}}}} Stopped at the first layer with XOR differences, total XOR differences so far: {total}, for more details view {xor_resulting_shapes_gds_file_path}")
+    else:
+        logging.info(f"{{{{XOR CHECK UPDATE}}}} Total XOR differences: {total}, for more details view {xor_resulting_shapes_gds_file_path}")
+    return total == 0
+
+
+def compare_engines(gds_path, top_cell, project_type, pdk_path, magicrc_file_path, output_directory):
+    """Parity of the XOR engines on a GDS (e.g. a golden wrapper): XOR the GDS erased by magic with the same GDS clipped &
+    erased by the XOR deck (PRECHECK_XOR_ENGINE=klayout), returns (total differences or None if an engine failed,
+    differences per layer); the engines agree when there are no differences"""
+    outputs_directory = output_directory / 'outputs'
+    logs_directory = output_directory / 'logs'
+    outputs_directory.mkdir(parents=True, exist_ok=True)
+    logs_directory.mkdir(parents=True, exist_ok=True)
+    tcl_erase_box_file_path = erase_box_script(pdk_path, project_type)
+    gds_erased_path = outputs_directory / f"{gds_path.stem}_erased.gds"
+    erase_boxes_file_path = logs_directory / f"xor_parity_{gds_path.stem}.erase_boxes"
+    os.environ['MAGTYPE'] = 'mag'
+    with open(logs_directory / f"xor_parity_{gds_path.stem}.log", 'w') as parity_log:
+        magic_erase_box_cmd = ['magic', '-dnull', '-noconsole', '-rcfile', magicrc_file_path, tcl_erase_box_file_path, gds_path, gds_erased_path, top_cell]
+        if process.run(magic_erase_box_cmd, stderr=parity_log, stdout=parity_log, progress=MagicProgress()).returncode != 0:
+            logging.error(f"{{{{XOR ENGINES}}}} Magic failed to erase the user area of {gds_path}, see {parity_log.name}")
+            return None, []
+        write_erase_boxes(tcl_erase_box_file_path, pdk_path, erase_boxes_file_path)
+        # note: the erased GDS is flat (xor_target), clipping & erasing it again leaves it unchanged
+        total, differences, _ = run_xor_shards(gds_erased_path, gds_path, 'xor_target', erase_boxes_file_path, outputs_directory / f"{gds_path.stem}.parity.xor.gds",
+                                               logs_directory, {}, 1, len(process.allocated_cpus()), False, parity_log, top_cell_b=top_cell)
+    return total, differences
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG, format=f"%(asctime)s | %(levelname)-7s | %(message)s", datefmt='%d-%b-%Y %H:%M:%S')
     parser = argparse.ArgumentParser(description='Runs a magic xor check on a given GDS.')
-    parser.add_argument('--input_directory', '-i', required=True, help='Design Path')
+    parser.add_argument('--input_directory', '-i', required=False, help='Design Path')
     parser.add_argument('--caravel_root', '-cr', required=True, help="CARAVEL_ROOT Absolute Path to caravel.")
     parser.add_argument('--magicrc_file_path', '-mrc', required=True, help='magicrc file path')
     parser.add_argument('--output_directory', '-o', required=False, default='.', help='Output Directory')
+    parser.add_argument('--compare_engines', action='store_true', default=False,
+                        help='Compare the magic & KLayout erase engines on the golden wrappers instead of running the XOR check of a design')
     args = parser.parse_args()
 
     output_directory = Path(args.output_directory)
+    if args.compare_engines:
+        # note: the magicrc is <pdk_path>/libs.tech/magic/<pdk>.magicrc
+        pdk_path = Path(args.magicrc_file_path).resolve().parent.parent.parent
+        golden_wrappers = [('analog', Path(args.caravel_root) / 'gds/user_analog_project_wrapper_empty.gds', 'user_analog_project_wrapper'),
+                           ('digital', Path(args.caravel_root) / 'gds/user_project_wrapper_empty.gds', 'user_project_wrapper'),
+                           ('openframe', Path(args.caravel_root) / 'gds/openframe_project_wrapper_empty.gds', 'openframe_project_wrapper'),
+                           ('mini', Path(__file__).parent.parent.parent / '_default_content/gds/user_project_wrapper_mini4_empty.gds', 'user_project_wrapper_mini4')]
+        mismatches = 0
+        for project_type, gds_path, top_cell in golden_wrappers:
+            if not gds_path.exists():
+                logging.warning(f"{{{{XOR ENGINES}}}} {gds_path} not found, the {project_type} wrapper is not compared")
+                continue
+            total, differences = compare_engines(gds_path, top_cell, project_type, pdk_path, Path(args.magicrc_file_path), output_directory / project_type)
+            layers = [f"{x['layer']}: {x['count']}" for x in differences if x['count']]
+            if total == 0:
+                logging.info(f"{{{{XOR ENGINES}}}} {gds_path.name}: the magic & KLayout engines agree")
+            else:
+                mismatches += 1
+                logging.error(f"{{{{XOR ENGINES}}}} {gds_path.name}: the engines differ, {total} differences {layers}, see {output_directory / project_type}")
+        sys.exit(1 if mismatches else 0)
+    if not args.input_directory:
+        parser.error('--input_directory is required')
     project_config = utils.get_project_config(Path(args.input_directory), Path(args.caravel_root))
 
     gds_golden_wrapper_file_path = f"{args.caravel_root}/gds/{project_config['golden_wrapper']}.gds"
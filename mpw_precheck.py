@@ -15,6 +15,7 @@
 
 import argparse
 import datetime
+import functools
 import json
 import logging
 import os
@@ -24,13 +25,39 @@ from pathlib import Path
 
 import precheck_logger
 from check_manager import get_check_manager, open_source_checks, private_checks
-from checks.utils.utils import file_hash, get_project_config, uncompress_gds
+from check_manager.cache import DEFAULT_CACHE_DIRECTORY, DEFAULT_CACHE_SIZE, IncrementalRun, ResultCache
+from check_manager.history import RunHistory
+from check_manager.klayout_session import KLAYOUT_SESSION, KlayoutSession
+from check_manager.scheduler import CheckScheduler
+from checks.drc_checks.klayout.klayout_gds_drc_check import tile_setting
+from checks.utils.archive import DecompressedCache
+from checks.utils.file_cache import GdsIndexCache, GoldenCache
+from checks.utils.gds import release_indexes
+from checks.utils.staging import StagedGds
+from checks.utils.utils import file_hash, get_project_config, persist_hashes, release_hashes, uncompress_gds
+
+
+@functools.lru_cache(maxsize=None)
+def get_tools_info():
+    klayout_version = subprocess.check_output(['klayout', '-v'], encoding='utf-8').replace('KLayout', '').lstrip().rstrip()
+    magic_version = subprocess.check_output(['magic', '--version'], encoding='utf-8').rstrip()
+    return klayout_version, magic_version
+
+
+@functools.lru_cache(maxsize=None)
+def get_pdks_info(pdk_path):
+    with open(pdk_path / '.config/nodeinfo.json') as f:
+        pdk_nodeinfo = json.load(f)
+        open_pdks_commit = pdk_nodeinfo['commit']['open_pdks']
+        pdk_commit = pdk_nodeinfo['reference'].get('skywater_pdk', pdk_nodeinfo['reference'].get('gf180mcu_pdk'))
+    return open_pdks_commit, pdk_commit
 
 
 def log_info(precheck_config, project_config):
     gds_info_path = precheck_config['log_path'].parent / 'gds.info'
     pdks_info_path = precheck_config['log_path'].parent / 'pdks.info'
     tools_info_path = precheck_config['log_path'].parent / 'tools.info'
+    run_info = dict(gds_hash=None, klayout_version=None, magic_version=None, open_pdks_commit=None, pdk_commit=None)
 
     logging.info(f"{{{{Project Type Info}}}} {project_config['type']}")
 
@@ -38,36 +65,66 @@ def log_info(precheck_config, project_config):
         user_module_hash = file_hash(f"{precheck_config['input_directory']}/gds/{project_config['user_module']}.gds")
         gds_info.write(f"{project_config['user_module']}.gds: {user_module_hash}")
         logging.info(f"{{{{Project GDS Info}}}} {project_config['user_module']}: {user_module_hash}")
+        run_info['gds_hash'] = user_module_hash
     with open(tools_info_path, 'w') as tools_info:
-        klayout_version = subprocess.check_output(['klayout', '-v'], encoding='utf-8').replace('KLayout', '').lstrip().rstrip()
-        magic_version = subprocess.check_output(['magic', '--version'], encoding='utf-8').rstrip()
+        klayout_version, magic_version = get_tools_info()
         tools_info.write(f"KLayout: {klayout_version}\n")
         tools_info.write(f"Magic: {magic_version}")
         logging.info(f"{{{{Tools Info}}}} KLayout: v{klayout_version} | Magic: v{magic_version}")
+        run_info['klayout_version'] = klayout_version
+        run_info['magic_version'] = magic_version
     with open(pdks_info_path, 'w') as pdks_info:
         try:
-            with open(precheck_config['pdk_path'] / '.config/nodeinfo.json') as f:
-                pdk_nodeinfo = json.load(f)
-                open_pdks_commit = pdk_nodeinfo['commit']['open_pdks']
-                pdk_commit = pdk_nodeinfo['reference'].get('skywater_pdk', pdk_nodeinfo['reference'].get('gf180mcu_pdk'))
+            open_pdks_commit, pdk_commit = get_pdks_info(precheck_config['pdk_path'])
             pdks_info.write(f"Open PDKs {open_pdks_commit}\n")
             pdks_info.write(f"{precheck_config['pdk_path'].name.upper()} PDK {pdk_commit}")
             logging.info(f"{{{{PDKs Info}}}} {precheck_config['pdk_path'].name.upper()}: {pdk_commit} | Open PDKs: {open_pdks_commit}")
+            run_info['open_pdks_commit'] = open_pdks_commit
+            run_info['pdk_commit'] = pdk_commit
         except Exception as e:
             logging.error(f"MPW Precheck failed to retreive {precheck_config['pdk_path'].name.upper()} PDK & Open PDKs commits: {e}")
+    return run_info
+
+
+def log_timing(precheck_config, usage):
+    timing_report_path = precheck_config['output_directory'] / 'outputs/reports/timing.json'
+    with open(timing_report_path, 'w') as timing_report:
+        json.dump(usage, timing_report, indent=2)
+
+    # note: the peak RSS of a check is the peak RSS of its tools, the precheck process itself is reported once
+    logging.info(f"{{{{TIMING}}}} {'Check':<48} {'Wall [s]':>10} {'CPU [s]':>10} {'Peak RSS [MiB]':>15}")
+    for record in [x for x in usage if x is not None]:
+        logging.info(f"{{{{TIMING}}}} {record['name']:<48} {record['wall']:>10.1f} {record['user'] + record['sys']:>10.1f} {record['peak_rss'] / 1024:>15.0f}")
+        for tool in record['tools']:
+            logging.info(f"{{{{TIMING}}}}   {tool['name']:<46} {tool['wall']:>10.1f} {tool['user'] + tool['sys']:>10.1f} {tool['peak_rss'] / 1024:>15.0f}")
+    process_peak_rss = max([0] + [x['process_peak_rss'] for x in usage if x is not None])
+    logging.info(f"{{{{TIMING}}}} Peak RSS of the precheck process (shared by all the checks): {process_peak_rss / 1024:.0f} MiB")
+    logging.info(f"{{{{TIMING}}}} Full timing report: {timing_report_path}")
 
 
 def run_precheck_sequence(precheck_config, project_config):
-    results = {}
     logging.info(f"{{{{START}}}} Precheck Started, the full log '{precheck_config['log_path'].name}' will be located in '{precheck_config['log_path'].parent}'")
-    logging.info(f"{{{{PRECHECK SEQUENCE}}}} Precheck will run the following checks: [{', '.join([get_check_manager(x, precheck_config, project_config).__surname__ for x in precheck_config['sequence']])}]")
-    for check_count, entry in enumerate(precheck_config['sequence'], start=1):
-        check = get_check_manager(entry, precheck_config, project_config)
-        if check:
-            logging.info(f"{{{{STEP UPDATE}}}} Executing Check {check_count} of {len(precheck_config['sequence'])}: {check.__surname__}")
-            results[check.__surname__] = check.run()
+    checks = [get_check_manager(x, precheck_config, project_config) for x in precheck_config['sequence']]
+    logging.info(f"{{{{PRECHECK SEQUENCE}}}} Precheck will run the following checks: [{', '.join([check.__surname__ for check in checks])}]")
+    # note: the tiled decks run in KLayout processes of their own
+    klayout_decks = [check for check in checks if check.__klayout_deck__ and not check.tiled]
+    # note: in fail fast mode the decks keep running in processes of their own, the run may stop before the later decks are needed
+    # note: the checks of a session wait for it holding their own allocation, concurrent runs keep a process per deck
+    if KLAYOUT_SESSION and len(klayout_decks) > 1 and precheck_config['jobs'] == 1 and not precheck_config['fail_fast']:
+        precheck_config['klayout_session'] = KlayoutSession(klayout_decks, [precheck_config['previous'], precheck_config['cache']])
+    scheduler = CheckScheduler(checks, jobs=precheck_config['jobs'], cpus=precheck_config['cpus'], memory=precheck_config['memory'], cache=precheck_config['cache'],
+                               fail_fast=precheck_config['fail_fast'], history=precheck_config['history'], previous=precheck_config['previous'])
+    results = scheduler.run()
+    IncrementalRun.save(precheck_config['output_directory'], scheduler.checks, scheduler.fingerprints, results)
 
     logging.info(f"{{{{FINISH}}}} Executing Finished, the full log '{precheck_config['log_path'].name}' can be found in '{precheck_config['log_path'].parent}'")
+    log_timing(precheck_config, scheduler.usage)
+    if precheck_config['history']:
+        precheck_config['history'].update(scheduler.checks, scheduler.usage)
+        precheck_config['history'].save()
+    skipped_checks = [x for x in results.keys() if results[x] is None]
+    if skipped_checks:
+        logging.warning(f"{{{{FAIL FAST}}}} {len(skipped_checks)} Check(s) Skipped or Cancelled: {skipped_checks}")
     if False not in list(results.values()):
         logging.info("{{SUCCESS}} All Checks Passed !!!")
     else:
@@ -76,7 +133,21 @@ def run_precheck_sequence(precheck_config, project_config):
         sys.exit(2)
 
 
+def get_sequence(private, checks, skip_checks):
+    all_checks = [check.lower() for check in (private_checks.keys() if private else open_source_checks.keys())]
+    input_checks = [check.lower() for check in checks] if checks else all_checks
+    skip_checks = [check.lower() for check in skip_checks] if skip_checks else []
+    input_checks = [check for check in input_checks if check in all_checks]
+    skip_checks = [check for check in skip_checks if check in all_checks]
+    return [check for check in input_checks if check not in skip_checks]
+
+
 def main(*args, **kwargs):
+    try:
+        tile_setting()
+    except ValueError as e:
+        logging.fatal(f"{{{{DRC TILES}}}} {e}")
+        sys.exit(255)
     check_managers = private_checks if kwargs['private'] else open_source_checks
     precheck_config = dict(input_directory=Path(kwargs['input_directory']),
                            output_directory=Path(kwargs['output_directory']),
@@ -86,9 +157,27 @@ def main(*args, **kwargs):
                            sequence=kwargs['sequence'],
                            log_path=Path(kwargs['log_path']),
                            default_content=Path(kwargs['default_content']),
-                           check_managers=check_managers)
+                           check_managers=check_managers,
+                           jobs=kwargs['jobs'],
+                           cpus=kwargs['cpus'],
+                           memory=kwargs['memory'],
+                           fail_fast=kwargs['fail_fast'],
+                           history=None,
+                           cache=None,
+                           golden_cache=None,
+                           index_cache=None,
+                           previous=IncrementalRun(kwargs['incremental']) if kwargs.get('incremental') else None)
 
-    uncompress_gds(precheck_config['input_directory'], precheck_config['caravel_root'])
+    decompressed_cache = None
+    if kwargs['cache']:
+        try:
+            decompressed_cache = DecompressedCache(kwargs['cache_directory'], kwargs['cache_size'])
+            precheck_config['golden_cache'] = GoldenCache(kwargs['cache_directory'], kwargs['cache_size'])
+            precheck_config['index_cache'] = GdsIndexCache(kwargs['cache_directory'], kwargs['cache_size'])
+            persist_hashes(kwargs['cache_directory'], kwargs['cache_size'])
+        except OSError as e:
+            logging.warning(f"{{{{CACHE}}}} The decompressed file, golden file, GDS index & hash caches are disabled, failed to create {kwargs['cache_directory']}: {e}")
+    uncompress_gds(precheck_config['input_directory'], decompressed_cache)
     project_config = get_project_config(precheck_config['input_directory'], precheck_config['caravel_root'])
     gds_file_path = precheck_config['input_directory'] / f"gds/{project_config['user_module']}.gds"
     compressed_gds_file_path = precheck_config['input_directory'] / f"gds/{project_config['user_module']}.gds.gz"
@@ -96,10 +185,26 @@ def main(*args, **kwargs):
         logging.fatal("{{GDS VIOLATION}} Both a compressed and an uncompressed version of the gds exist, ensure only one design file exists.")
         sys.exit(255)
 
-    log_info(precheck_config, project_config)
+    precheck_config['run_info'] = log_info(precheck_config, project_config)
+    # note: the checks & their tools read the GDS from node-local storage when the project lives on a network filesystem
+    precheck_config['staged_gds'] = StagedGds.stage(gds_file_path)
+    precheck_config['history'] = RunHistory(Path(kwargs['cache_directory']) / 'history.json')
+    if kwargs['cache']:
+        try:
+            precheck_config['cache'] = ResultCache(kwargs['cache_directory'], kwargs['cache_size'])
+        except OSError as e:
+            logging.warning(f"{{{{CACHE}}}} The result cache is disabled, failed to create {kwargs['cache_directory']}: {e}")
     # note: update to filter sequence based on supported pdks
-    precheck_config['sequence'] = [check for check in precheck_config['sequence'] if precheck_config['pdk_path'].stem in get_check_manager(check, precheck_config, project_config).__supported_pdks__ and project_config['type'] in get_check_manager(check, precheck_config, project_config).__supported_type__]
-    run_precheck_sequence(precheck_config=precheck_config, project_config=project_config)
+    precheck_config['sequence'] = [check for check in precheck_config['sequence'] if check_managers[check].is_supported(precheck_config['pdk_path'].stem, project_config['type'])]
+    try:
+        run_precheck_sequence(precheck_config=precheck_config, project_config=project_config)
+    finally:
+        precheck_config['staged_gds'].release()
+        # note: the batch & daemon workers run many projects in one process, the indexes & digests of this project are not kept in memory
+        release_indexes(gds_file_path)
+        release_hashes()
+        if precheck_config['index_cache']:
+            precheck_config['index_cache'].evict()
 
 
 if __name__ == '__main__':
@@ -110,6 +215,14 @@ if __name__ == '__main__':
     parser.add_argument('--private', action='store_true', help=f"If provided, precheck skips {open_source_checks.keys() - private_checks.keys()}  checks that qualify the project to be Open Source")
     parser.add_argument('checks', metavar='check', type=str, nargs='*', choices=list(open_source_checks.keys()).append([]), help=f"Checks to be run by the precheck: {' '.join(open_source_checks.keys())}")
     parser.add_argument('--skip_checks', metavar='check', type=str, nargs='*', choices=list(open_source_checks.keys()).append([]), help=f"Checks not to be run by the precheck: {' '.join(open_source_checks.keys())}")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="JOBS, maximum number of checks executed concurrently, default=1 (sequential).")
+    parser.add_argument('--cpus', type=int, required=False, help="CPUS, number of CPUs the concurrently executed checks may occupy, default=all available CPUs.")
+    parser.add_argument('--memory', type=float, required=False, help="MEMORY, GiB of memory the concurrently executed checks may occupy, default=available memory.")
+    parser.add_argument('--fail_fast', '--fail-fast', action='store_true', help="If provided, precheck runs the cheapest checks first and stops at the first failing check.")
+    parser.add_argument('--incremental', metavar='PREVIOUS_OUTPUT_DIRECTORY', required=False, help="PREVIOUS_OUTPUT_DIRECTORY, if provided, the results & reports of the checks whose inputs are unchanged since that run are reused.")
+    parser.add_argument('--no_cache', '--no-cache', action='store_true', help="If provided, precheck neither restores nor stores check results in the result cache.")
+    parser.add_argument('--cache_directory', required=False, default=DEFAULT_CACHE_DIRECTORY, help=f"CACHE_DIRECTORY, location of the result cache, default=$PRECHECK_CACHE or {DEFAULT_CACHE_DIRECTORY}.")
+    parser.add_argument('--cache_size', type=float, required=False, default=DEFAULT_CACHE_SIZE, help=f"CACHE_SIZE, GiB the precheck cache (results, decompressed files, golden files, GDS indexes & file hashes together) may grow to before the least recently used entries are evicted, default={DEFAULT_CACHE_SIZE}.")
     args = parser.parse_args()
 
     # NOTE Separated to allow the option later on for a run tag
@@ -130,12 +243,7 @@ if __name__ == '__main__':
         logging.critical("`GOLDEN_CARAVEL` environment variable is not set. Please set it to point to absolute path to the golden caravel")
         sys.exit(1)
 
-    all_checks = [check.lower() for check in (private_checks.keys() if args.private else open_source_checks.keys())]
-    input_checks = [check.lower() for check in args.checks] if args.checks else all_checks
-    skip_checks = [check.lower() for check in args.skip_checks] if args.skip_checks else []
-    input_checks = [check for check in input_checks if check in all_checks]
-    skip_checks = [check for check in skip_checks if check in all_checks]
-    sequence = [check for check in input_checks if check not in skip_checks]
+    sequence = get_sequence(args.private, args.checks, args.skip_checks)
 
     main(input_directory=args.input_directory,
          output_directory=output_directory,
@@ -144,4 +252,12 @@ if __name__ == '__main__':
          private=args.private,
          sequence=sequence,
          log_path=log_path,
-         default_content='_default_content')
+         default_content='_default_content',
+         jobs=args.jobs,
+         cpus=args.cpus,
+         memory=args.memory,
+         fail_fast=args.fail_fast,
+         incremental=args.incremental,
+         cache=not args.no_cache,
+         cache_directory=args.cache_directory,
+         cache_size=args.cache_size)
@@ -0,0 +1,245 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import csv
+import datetime
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import mpw_precheck
+import precheck_logger
+from check_manager import open_source_checks, private_checks
+from check_manager.cache import DEFAULT_CACHE_DIRECTORY, DEFAULT_CACHE_SIZE
+from check_manager.scheduler import available_cpus, available_memory, format_cpus, partition_cpus
+from checks.utils.utils import golden_file_hash
+
+# Note: modules imported by the checks, imported once before forking the workers
+WARM_MODULES = ['pya', 'pyverilog.vparser.parser', 'PySpice.Spice.Parser', 'checks.consistency_check.consistency_check', 'checks.drc_checks.magic.magic_gds_drc_check']
+# Note: (top module, top netlist, user module, netlist type) of the golden netlists parsed by the consistency check
+GOLDEN_NETLISTS = [('caravel', 'verilog/gl/caravel.v', 'user_project_wrapper', 'verilog'),
+                   ('caravel_openframe', 'verilog/gl/caravel_openframe.v', 'openframe_project_wrapper', 'verilog'),
+                   ('caravan', 'spi/lvs/caravan.spice', 'user_analog_project_wrapper', 'spice')]
+SUMMARY_FIELDS = ['project', 'status', 'exit_code', 'wall', 'failed_checks', 'input_directory', 'output_directory']
+
+
+def warm_shared_state(caravel_root, pdk_path, sequence):
+    """Compute the state shared by all runs once (tool versions, PDK commits, golden asset hashes, parsed golden
+    netlists, imported modules), the forked workers inherit it"""
+    for module in WARM_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logging.warning(f"{{{{BATCH}}}} Failed to import {module}: {e}")
+    try:
+        mpw_precheck.get_tools_info()
+    except Exception as e:
+        logging.warning(f"{{{{BATCH}}}} Failed to retrieve the tool versions: {e}")
+    try:
+        mpw_precheck.get_pdks_info(pdk_path)
+    except Exception as e:
+        logging.warning(f"{{{{BATCH}}}} Failed to retrieve the PDK commits: {e}")
+    golden_assets = sorted(caravel_root.glob('gds/*_empty.gds')) + sorted((Path(__file__).parent / '_default_content/gds').glob('*_empty*.gds'))
+    for golden_asset in golden_assets:
+        golden_file_hash(golden_asset)
+    if 'magic_drc' in sequence and 'checks.drc_checks.magic.magic_gds_drc_check' in sys.modules:
+        sys.modules['checks.drc_checks.magic.magic_gds_drc_check'].get_installed_sram_modules(pdk_path)
+    if 'consistency' in sequence and 'checks.consistency_check.consistency_check' in sys.modules:
+        consistency_check = sys.modules['checks.consistency_check.consistency_check']
+        include_files = [str(caravel_root / 'verilog/rtl/defines.v')]
+        for top_module, top_netlist, user_module, netlist_type in GOLDEN_NETLISTS:
+            try:
+                consistency_check.get_golden_netlist_parser(caravel_root / top_netlist, top_module, netlist_type, include_files)
+                consistency_check.get_golden_netlist_parser(caravel_root / f"verilog/rtl/__{user_module}.v", user_module, 'verilog', include_files)
+            except Exception as e:
+                logging.warning(f"{{{{BATCH}}}} Failed to parse the golden {top_module} netlists: {e}")
+
+
+def run_project(input_directory, output_directory, options):
+    """Run the precheck of a single project in a pool worker and summarize its outcome"""
+    for directory in ['logs', 'outputs/reports']:
+        (output_directory / directory).mkdir(parents=True, exist_ok=True)
+    log_path = output_directory / 'logs/precheck.log'
+    precheck_logger.initialize_root_logger(log_path, stream=None)
+
+    start = time.monotonic()
+    try:
+        mpw_precheck.main(input_directory=input_directory, output_directory=output_directory, log_path=log_path, **options)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+    except Exception as e:
+        logging.exception(f"{{{{BATCH}}}} Precheck of {input_directory} failed: {e}")
+        exit_code = 1
+    wall = time.monotonic() - start
+
+    try:
+        with open(output_directory / 'outputs/reports/timing.json') as f:
+            checks = {record['name']: record.get('result') for record in json.load(f) if record is not None}
+    except (OSError, ValueError):
+        checks = {}
+    status = 'passed' if exit_code == 0 else 'failed' if exit_code == 2 else 'error'
+    return dict(project=input_directory.name,
+                status=status,
+                exit_code=exit_code,
+                wall=round(wall, 1),
+                failed_checks=[name for name, result in checks.items() if result is False],
+                input_directory=str(input_directory),
+                output_directory=str(output_directory),
+                checks=checks)
+
+
+def failed_project(input_directory, output_directory, error):
+    logging.error(f"{{{{BATCH}}}} Precheck worker of {input_directory} failed: {error}")
+    return dict(project=input_directory.name, status='error', exit_code=1, wall=None, failed_checks=[],
+                input_directory=str(input_directory), output_directory=str(output_directory), checks={})
+
+
+def write_summary(summary, output_directory):
+    with open(output_directory / 'summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    with open(output_directory / 'summary.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for project in summary:
+            writer.writerow(dict(project, failed_checks=' '.join(project['failed_checks'])))
+
+
+def pin_worker(cpu_sets):
+    """Pin a worker to a CPU set of its own, the scheduler of the worker then allocates CPUs out of it"""
+    try:
+        os.sched_setaffinity(0, cpu_sets.get_nowait())
+    except (queue.Empty, OSError):
+        pass
+
+
+def create_pool(workers):
+    """Fork a pool of workers, each worker is pinned to its share of the available CPUs"""
+    context = multiprocessing.get_context('fork')
+    partition = partition_cpus(workers)
+    cpu_sets = context.Queue()
+    for cpu_set in partition:
+        cpu_sets.put(cpu_set)
+    logging.info(f"{{{{CPU ALLOCATION}}}} Workers pinned to CPUs {' '.join(format_cpus(cpu_set) for cpu_set in partition)}")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=pin_worker, initargs=(cpu_sets,))
+
+
+def run_batch(input_directories, output_directory, workers, options):
+    warm_shared_state(options['caravel_root'], options['pdk_path'], options['sequence'])
+    output_directories = {}
+    for input_directory in input_directories:
+        # note: projects sharing a directory name get a numbered output directory
+        name = input_directory.name
+        index = 1
+        while name in output_directories.values():
+            index += 1
+            name = f"{input_directory.name}_{index}"
+        output_directories[input_directory] = output_directory / name
+
+    logging.info(f"{{{{BATCH}}}} Running the precheck of {len(input_directories)} project(s) on {workers} worker(s), the results will be located in '{output_directory}'")
+    summary = []
+    remaining = list(input_directories)
+    while remaining:
+        lost = []
+        # note: workers are forked so that they inherit the shared state computed above
+        with create_pool(workers) as executor:
+            futures = {executor.submit(run_project, input_directory, output_directories[input_directory], options): input_directory for input_directory in remaining}
+            for future in as_completed(futures):
+                input_directory = futures[future]
+                try:
+                    project = future.result()
+                except BrokenProcessPool as e:
+                    if workers > 1:
+                        lost.append(input_directory)
+                        continue
+                    project = failed_project(input_directory, output_directories[input_directory], e)
+                except Exception as e:
+                    project = failed_project(input_directory, output_directories[input_directory], e)
+                summary.append(project)
+                log = logging.info if project['status'] == 'passed' else logging.warning
+                log(f"{{{{BATCH}}}} [{len(summary)}/{len(input_directories)}] {project['project']}: {project['status'].upper()} in {project['wall']}s {project['failed_checks'] if project['failed_checks'] else ''}")
+        remaining = lost
+        if remaining:
+            # note: a worker killed by the OOM killer breaks the pool, its projects are re-run with fewer workers & more memory each
+            workers = max(1, workers // 2)
+            options = dict(options, cpus=max(1, available_cpus() // workers), memory=available_memory() / workers)
+            logging.warning(f"{{{{BATCH}}}} A worker was killed, most likely by the OOM killer, re-running {len(remaining)} project(s) on {workers} worker(s)")
+
+    summary.sort(key=lambda x: input_directories.index(Path(x['input_directory'])))
+    write_summary(summary, output_directory)
+    passed = len([project for project in summary if project['status'] == 'passed'])
+    logging.info(f"{{{{BATCH FINISH}}}} {passed} of {len(summary)} project(s) passed, summary: '{output_directory / 'summary.json'}' & '{output_directory / 'summary.csv'}'")
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the mpw precheck tool on many projects.", allow_abbrev=False)
+    parser.add_argument('input_directories', metavar='input_directory', nargs='*', help="Absolute Paths to the projects.")
+    parser.add_argument('-l', '--projects_file', required=False, help="PROJECTS_FILE, file listing the absolute paths to the projects, one per line.")
+    parser.add_argument('-p', '--pdk_path', required=True, help="PDK_PATH, points to the installation path of the pdk (variant specific)")
+    parser.add_argument('-o', '--output_directory', required=False, help="OUTPUT_DIRECTORY, default=./precheck_batch_results/DD_MMM_YYYY___HH_MM_SS, each project is checked into <output_directory>/<project>.")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="WORKERS, number of projects checked concurrently, default=1.")
+    parser.add_argument('--private', action='store_true', help=f"If provided, precheck skips {open_source_checks.keys() - private_checks.keys()}  checks that qualify the project to be Open Source")
+    parser.add_argument('--checks', metavar='check', type=str, nargs='*', choices=list(open_source_checks.keys()).append([]), help=f"Checks to be run by the precheck: {' '.join(open_source_checks.keys())}")
+    parser.add_argument('--skip_checks', metavar='check', type=str, nargs='*', choices=list(open_source_checks.keys()).append([]), help=f"Checks not to be run by the precheck: {' '.join(open_source_checks.keys())}")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="JOBS, maximum number of checks of a project executed concurrently, default=1 (sequential).")
+    parser.add_argument('--fail_fast', '--fail-fast', action='store_true', help="If provided, precheck runs the cheapest checks first and stops at the first failing check of a project.")
+    parser.add_argument('--no_cache', '--no-cache', action='store_true', help="If provided, precheck neither restores nor stores check results in the result cache.")
+    parser.add_argument('--cache_directory', required=False, default=DEFAULT_CACHE_DIRECTORY, help=f"CACHE_DIRECTORY, location of the result cache, default=$PRECHECK_CACHE or {DEFAULT_CACHE_DIRECTORY}.")
+    parser.add_argument('--cache_size', type=float, required=False, default=DEFAULT_CACHE_SIZE, help=f"CACHE_SIZE, GiB the precheck cache (results, decompressed files, golden files, GDS indexes & file hashes together) may grow to before the least recently used entries are evicted, default={DEFAULT_CACHE_SIZE}.")
+    args = parser.parse_args()
+
+    input_directories = [Path(x).resolve() for x in args.input_directories]
+    if args.projects_file:
+        with open(args.projects_file) as f:
+            input_directories += [Path(line.strip()).resolve() for line in f if line.strip() and not line.startswith('#')]
+    input_directories = list(dict.fromkeys(input_directories))
+    if not input_directories:
+        parser.error("No input directories were provided")
+
+    tag = f"{datetime.datetime.utcnow():%d_%b_%Y___%H_%M_%S}".upper()
+    output_directory = Path(args.output_directory if args.output_directory else f"precheck_batch_results/{tag}").resolve()
+    output_directory.mkdir(parents=True, exist_ok=True)
+    precheck_logger.initialize_root_logger(output_directory / 'batch.log')
+
+    if 'GOLDEN_CARAVEL' not in os.environ:
+        logging.critical("`GOLDEN_CARAVEL` environment variable is not set. Please set it to point to absolute path to the golden caravel")
+        sys.exit(1)
+
+    workers = max(1, args.workers)
+    # note: the CPUs & memory of the host are split evenly between the projects checked concurrently
+    options = dict(caravel_root=Path(os.environ['GOLDEN_CARAVEL']),
+                   pdk_path=Path(args.pdk_path),
+                   private=args.private,
+                   sequence=mpw_precheck.get_sequence(args.private, args.checks, args.skip_checks),
+                   default_content=Path(__file__).parent / '_default_content',
+                   jobs=args.jobs,
+                   cpus=max(1, available_cpus() // workers),
+                   memory=available_memory() / workers,
+                   fail_fast=args.fail_fast,
+                   cache=not args.no_cache,
+                   cache_directory=args.cache_directory,
+                   cache_size=args.cache_size)
+    summary = run_batch(input_directories, output_directory, workers, options)
+    sys.exit(0 if all(project['status'] == 'passed' for project in summary) else 2)
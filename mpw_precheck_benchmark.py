@@ -0,0 +1,196 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import mpw_precheck
+import precheck_logger
+from benchmarks.synthetic_design import USER_MODULE, generate_design
+from check_manager import open_source_checks
+from check_manager.scheduler import available_cpus, available_memory
+from mpw_precheck_batch import run_project
+
+# Note: predefined design scales, a scale may also be given as 'cells=<n>,macros=<n>,shapes=<n>'
+SCALES = OrderedDict([('empty', dict(cells=0, macros=0, shapes=0)),
+                      ('small', dict(cells=10000, macros=2, shapes=10000)),
+                      ('medium', dict(cells=100000, macros=8, shapes=100000)),
+                      ('large', dict(cells=500000, macros=16, shapes=500000))])
+
+
+def parse_scale(scale):
+    if scale in SCALES:
+        return scale, SCALES[scale]
+    try:
+        parameters = dict(SCALES['empty'], **{key: int(value) for key, value in (item.split('=') for item in scale.split(','))})
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid scale '{scale}', expected one of {list(SCALES)} or 'cells=<n>,macros=<n>,shapes=<n>'")
+    if parameters.keys() != SCALES['empty'].keys():
+        raise argparse.ArgumentTypeError(f"invalid scale '{scale}', the parameters are {list(SCALES['empty'])}")
+    return f"cells{parameters['cells']}_macros{parameters['macros']}_shapes{parameters['shapes']}", parameters
+
+
+def run_isolated(function, *args):
+    """Run a function in a freshly spawned process, its peak memory is neither inherited from nor left to this process"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args).result()
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=Path(__file__).parent, encoding='utf-8', stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize_checks(runs):
+    """Median wall & CPU time, largest peak RSS (KiB) and last verdict of every check over the repeated runs"""
+    records = OrderedDict()
+    for usage in runs:
+        for record in usage:
+            records.setdefault(record['name'], []).append(record)
+    return OrderedDict((name, dict(wall=round(statistics.median(x['wall'] for x in records[name]), 2),
+                                   cpu=round(statistics.median(x['user'] + x['sys'] for x in records[name]), 2),
+                                   peak_rss=max(x['peak_rss'] for x in records[name]),
+                                   result=records[name][-1].get('result')))
+                       for name in records)
+
+
+def benchmark_design(name, parameters, designs_directory, output_directory, options, repeat):
+    design_directory = designs_directory / f"{options['pdk_path'].name}_{name}"
+    logging.info(f"{{{{BENCHMARK}}}} Design '{name}': {parameters['cells']} standard cells, {parameters['macros']} macros of {parameters['shapes']} shapes")
+    run_isolated(generate_design, design_directory, options['caravel_root'], options['pdk_path'], parameters['cells'], parameters['macros'], parameters['shapes'])
+
+    runs = []
+    walls = []
+    for index in range(repeat):
+        run_directory = output_directory / 'runs' / f"{name}_{index + 1}"
+        shutil.rmtree(run_directory, ignore_errors=True)
+        project = run_isolated(run_project, design_directory, run_directory, options)
+        logging.info(f"{{{{BENCHMARK}}}} Design '{name}' run {index + 1} of {repeat}: {project['status'].upper()} in {project['wall']}s, the full log is located in '{run_directory / 'logs/precheck.log'}'")
+        try:
+            with open(run_directory / 'outputs/reports/timing.json') as f:
+                runs.append([record for record in json.load(f) if record is not None])
+        except (OSError, ValueError) as e:
+            logging.error(f"{{{{BENCHMARK}}}} Failed to read the timing report of design '{name}': {e}")
+            continue
+        walls.append(project['wall'])
+    return dict(parameters=parameters,
+                gds_size=(design_directory / f"gds/{USER_MODULE}.gds").stat().st_size,
+                wall=statistics.median(walls) if walls else None,
+                checks=summarize_checks(runs))
+
+
+def log_results(results, baseline=None):
+    """Log the results of every design, with the speedup over the baseline results of the same design & check"""
+    if baseline:
+        logging.info(f"{{{{BENCHMARK}}}} Baseline: {baseline.get('commit')} ({baseline.get('date')})")
+    logging.info(f"{{{{BENCHMARK}}}} {'Design':<24} {'Check':<48} {'Wall [s]':>10} {'CPU [s]':>10} {'Peak RSS [MiB]':>15} {'Speedup':>8} {'RSS Ratio':>10}")
+    for name, design in results['designs'].items():
+        baseline_checks = baseline.get('designs', {}).get(name, {}).get('checks', {}) if baseline else {}
+        for check, record in design['checks'].items():
+            reference = baseline_checks.get(check)
+            speedup = f"{reference['wall'] / record['wall']:.2f}x" if reference and record['wall'] else '-'
+            rss_ratio = f"{record['peak_rss'] / reference['peak_rss']:.2f}" if reference and reference['peak_rss'] else '-'
+            logging.info(f"{{{{BENCHMARK}}}} {name:<24} {check:<48} {record['wall']:>10.1f} {record['cpu']:>10.1f} {record['peak_rss'] / 1024:>15.0f} {speedup:>8} {rss_ratio:>10}")
+
+
+def main(*args, **kwargs):
+    options = dict(caravel_root=Path(kwargs['caravel_root']),
+                   pdk_path=Path(kwargs['pdk_path']),
+                   private=False,
+                   sequence=kwargs['sequence'],
+                   default_content=Path(__file__).parent / '_default_content',
+                   jobs=kwargs['jobs'],
+                   cpus=None,
+                   memory=None,
+                   fail_fast=False,
+                   cache=False,
+                   # note: the runs keep a history of their own, the history of the regular runs is not affected
+                   cache_directory=kwargs['output_directory'] / 'cache',
+                   cache_size=0)
+    results = dict(commit=get_commit(),
+                   date=f"{datetime.datetime.utcnow():%Y-%m-%d %H:%M:%S}",
+                   pdk=options['pdk_path'].name,
+                   host=dict(cpus=available_cpus(), memory=round(available_memory(), 1)),
+                   jobs=kwargs['jobs'],
+                   repeat=kwargs['repeat'],
+                   designs=OrderedDict())
+    try:
+        klayout_version, magic_version = mpw_precheck.get_tools_info()
+        results['tools'] = dict(klayout=klayout_version, magic=magic_version)
+    except Exception as e:
+        logging.warning(f"{{{{BENCHMARK}}}} Failed to retrieve the tool versions: {e}")
+
+    for name, parameters in kwargs['scales']:
+        try:
+            results['designs'][name] = benchmark_design(name, parameters, kwargs['designs_directory'], kwargs['output_directory'], options, kwargs['repeat'])
+        except (OSError, ValueError) as e:
+            logging.error(f"{{{{BENCHMARK}}}} Failed to benchmark design '{name}': {e}")
+            continue
+        with open(kwargs['output_directory'] / 'benchmark.json', 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = None
+    if kwargs.get('baseline'):
+        with open(kwargs['baseline']) as f:
+            baseline = json.load(f)
+    log_results(results, baseline)
+    logging.info(f"{{{{BENCHMARK FINISH}}}} Results: '{kwargs['output_directory'] / 'benchmark.json'}'")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the mpw precheck tool on synthetic designs.", allow_abbrev=False)
+    parser.add_argument('-p', '--pdk_path', required=True, help="PDK_PATH, points to the installation path of the pdk (variant specific)")
+    parser.add_argument('-o', '--output_directory', required=False, help="OUTPUT_DIRECTORY, default=./precheck_benchmark_results/DD_MMM_YYYY___HH_MM_SS.")
+    parser.add_argument('-d', '--designs_directory', required=False, default='precheck_benchmark_designs', help="DESIGNS_DIRECTORY, the generated designs are kept there and reused by later benchmarks, default=./precheck_benchmark_designs.")
+    parser.add_argument('-s', '--scales', metavar='scale', type=parse_scale, nargs='+', default=[parse_scale(x) for x in ['empty', 'small', 'medium']], help=f"Scales of the designs: {' '.join(SCALES.keys())} or cells=<n>,macros=<n>,shapes=<n>, default=empty small medium.")
+    parser.add_argument('--checks', metavar='check', type=str, nargs='*', choices=list(open_source_checks.keys()).append([]), help=f"Checks to be benchmarked: {' '.join(open_source_checks.keys())}")
+    parser.add_argument('--skip_checks', metavar='check', type=str, nargs='*', choices=list(open_source_checks.keys()).append([]), help=f"Checks not to be benchmarked: {' '.join(open_source_checks.keys())}")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="JOBS, maximum number of checks executed concurrently, default=1 (sequential).")
+    parser.add_argument('-r', '--repeat', type=int, default=1, help="REPEAT, number of runs per design, the median is reported, default=1.")
+    parser.add_argument('-b', '--baseline', required=False, help="BASELINE, benchmark.json of an earlier benchmark (e.g. of another commit) to compare the results to.")
+    args = parser.parse_args()
+
+    tag = f"{datetime.datetime.utcnow():%d_%b_%Y___%H_%M_%S}".upper()
+    output_directory = Path(args.output_directory if args.output_directory else f"precheck_benchmark_results/{tag}").resolve()
+    output_directory.mkdir(parents=True, exist_ok=True)
+    precheck_logger.initialize_root_logger(output_directory / 'benchmark.log')
+
+    if 'GOLDEN_CARAVEL' not in os.environ:
+        logging.critical("`GOLDEN_CARAVEL` environment variable is not set. Please set it to point to absolute path to the golden caravel")
+        sys.exit(1)
+
+    main(caravel_root=os.environ['GOLDEN_CARAVEL'],
+         pdk_path=args.pdk_path,
+         sequence=mpw_precheck.get_sequence(False, args.checks, args.skip_checks),
+         output_directory=output_directory,
+         designs_directory=Path(args.designs_directory).resolve(),
+         scales=args.scales,
+         jobs=args.jobs,
+         repeat=max(1, args.repeat),
+         baseline=args.baseline)
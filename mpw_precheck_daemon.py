@@ -0,0 +1,282 @@
+# SPDX-FileCopyrightText: 2024 Efabless Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import mpw_precheck
+import precheck_logger
+from check_manager.cache import DEFAULT_CACHE_DIRECTORY, DEFAULT_CACHE_SIZE
+from check_manager.scheduler import available_cpus, available_memory
+from mpw_precheck_batch import create_pool, run_project, warm_shared_state
+
+
+class PrecheckService:
+    """Queue of precheck jobs executed on a pool of warm worker processes
+
+    The state every run rebuilds (tool versions, PDK commits, golden asset hashes, parsed golden netlists, SRAM
+    macros of the PDK, imported modules) is computed once when the service starts, the workers are forked from
+    the service and inherit it. At most `workers` jobs run at the same time, the others wait in the queue.
+
+    Arguments:
+        output_directory: Directory the output directories of the jobs are created in.
+        workers: Number of jobs executed concurrently.
+        options: Default precheck options of the jobs (see mpw_precheck.main).
+    """
+
+    def __init__(self, output_directory, workers, options):
+        self.output_directory = output_directory
+        self.workers = workers
+        self.options = options
+        self.jobs = {}
+        self.queue = deque()
+        self.futures = {}
+        self.running = {}
+        self.lock = threading.Lock()
+        start = time.monotonic()
+        warm_shared_state(options['caravel_root'], options['pdk_path'], options['sequence'])
+        logging.info(f"{{{{DAEMON}}}} Shared state warmed up in {time.monotonic() - start:.1f}s")
+        self.executor = self._create_executor()
+
+    def _create_executor(self):
+        return create_pool(self.workers)
+
+    def submit(self, request):
+        input_directory = Path(request['input_directory'])
+        if not input_directory.is_absolute() or not input_directory.is_dir():
+            raise ValueError(f"input_directory must be the absolute path of a directory: {input_directory}")
+        options = dict(self.options)
+        # note: the options are not converted, e.g. bool("false") is True
+        for option in ['private', 'fail_fast', 'jobs']:
+            expected = type(self.options[option])
+            if option in request and type(request[option]) is not expected:
+                raise ValueError(f"{option} must be a JSON {'boolean' if expected is bool else 'integer'}, not {json.dumps(request[option])}")
+        if request.get('jobs', 1) < 1:
+            raise ValueError(f"jobs must be at least 1, not {request['jobs']}")
+        if 'checks' in request or 'skip_checks' in request or 'private' in request:
+            options['private'] = request.get('private', self.options['private'])
+            options['sequence'] = mpw_precheck.get_sequence(options['private'], request.get('checks'), request.get('skip_checks'))
+        for option in ['fail_fast', 'jobs']:
+            if option in request:
+                options[option] = request[option]
+
+        job_id = uuid.uuid4().hex[:12]
+        output_directory = self.output_directory / f"{input_directory.name}_{job_id}"
+        job = dict(id=job_id, status='queued', input_directory=str(input_directory), output_directory=str(output_directory), submitted=time.time(), result=None)
+        with self.lock:
+            self.jobs[job_id] = job
+            self.queue.append((job_id, input_directory, output_directory, options))
+        logging.info(f"{{{{DAEMON}}}} Job {job_id} queued: {input_directory}")
+        self._dispatch()
+        return self.status(job_id)
+
+    def _dispatch(self):
+        """Hand queued jobs to the pool as long as a worker is free, a job re-run alone waits for the running jobs"""
+        started = []
+        with self.lock:
+            while self.queue and len(self.futures) < self.workers:
+                if any(self.jobs[job_id].get('alone') for job_id in self.futures):
+                    break
+                if self.jobs[self.queue[0][0]].get('alone') and self.futures:
+                    break
+                job_id, *arguments = entry = self.queue.popleft()
+                try:
+                    future = self.executor.submit(run_project, *arguments)
+                except BrokenProcessPool:
+                    self.executor = self._create_executor()
+                    future = self.executor.submit(run_project, *arguments)
+                self.futures[job_id] = future
+                self.running[job_id] = entry
+                self.jobs[job_id]['status'] = 'running'
+                started.append((job_id, future))
+        for job_id, future in started:
+            future.add_done_callback(lambda x, job_id=job_id: self._finish(job_id, x))
+
+    def _finish(self, job_id, future):
+        with self.lock:
+            job = self.jobs[job_id]
+            entry = self.running.pop(job_id)
+            del self.futures[job_id]
+            try:
+                job['result'] = future.result()
+                job['status'] = job['result']['status']
+            except BrokenProcessPool as e:
+                if job.get('alone'):
+                    job['status'] = 'error'
+                    job['error'] = str(e)
+                else:
+                    # note: a worker killed by the OOM killer breaks the pool and the jobs it ran, they are re-run, alone with the memory of all the workers
+                    _, input_directory, output_directory, options = entry
+                    job['alone'] = True
+                    job['status'] = 'queued'
+                    self.queue.appendleft((job_id, input_directory, output_directory, dict(options, memory=available_memory())))
+            except Exception as e:
+                job['status'] = 'error'
+                job['error'] = str(e)
+            if job['status'] != 'queued':
+                job['finished'] = time.time()
+        if job['status'] == 'queued':
+            logging.warning(f"{{{{DAEMON}}}} Job {job_id} lost its worker, most likely to the OOM killer, it is queued to run alone")
+        else:
+            logging.info(f"{{{{DAEMON}}}} Job {job_id} finished: {job['status'].upper()}")
+        self._dispatch()
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        with self.lock:
+            return [dict(id=job['id'], status=job['status'], input_directory=job['input_directory']) for job in self.jobs.values()]
+
+    def info(self):
+        with self.lock:
+            statuses = [job['status'] for job in self.jobs.values()]
+        return dict(workers=self.workers,
+                    queued=statuses.count('queued'),
+                    running=statuses.count('running'),
+                    finished=len([status for status in statuses if status not in ['queued', 'running']]),
+                    pdk_path=str(self.options['pdk_path']),
+                    caravel_root=str(self.options['caravel_root']))
+
+    def shutdown(self):
+        with self.lock:
+            self.queue.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PrecheckRequestHandler(BaseHTTPRequestHandler):
+    """Local API of the precheck daemon
+
+    POST /jobs        submit a job: {"input_directory": <absolute path>[, "checks": [...], "skip_checks": [...], "private": bool, "fail_fast": bool, "jobs": int]}
+    GET  /jobs        list the jobs
+    GET  /jobs/<id>   status & result of a job
+    GET  /info        configuration & queue of the daemon
+    """
+    service = None
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path == '/info':
+            self._reply(HTTPStatus.OK, self.service.info())
+        elif path == '/jobs':
+            self._reply(HTTPStatus.OK, self.service.list())
+        elif path.startswith('/jobs/'):
+            job = self.service.status(path[len('/jobs/'):])
+            self._reply(HTTPStatus.OK, job) if job else self._reply(HTTPStatus.NOT_FOUND, dict(error='unknown job'))
+        else:
+            self._reply(HTTPStatus.NOT_FOUND, dict(error='unknown endpoint'))
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self._reply(HTTPStatus.NOT_FOUND, dict(error='unknown endpoint'))
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            self._reply(HTTPStatus.ACCEPTED, self.service.submit(request))
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(HTTPStatus.BAD_REQUEST, dict(error=str(e)))
+
+    def _reply(self, status, content):
+        body = json.dumps(content, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug(f"{{{{DAEMON}}}} {self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the mpw precheck tool as a daemon serving a local API.", allow_abbrev=False)
+    parser.add_argument('-p', '--pdk_path', required=True, help="PDK_PATH, points to the installation path of the pdk (variant specific)")
+    parser.add_argument('-o', '--output_directory', required=False, default='precheck_daemon_results', help="OUTPUT_DIRECTORY, the jobs are checked into <output_directory>/<project>_<job id>, default=./precheck_daemon_results.")
+    parser.add_argument('--socket', required=False, help="SOCKET, path of the Unix socket to listen on, if not provided the daemon listens on --host:--port.")
+    parser.add_argument('--host', required=False, default='127.0.0.1', help="HOST, address to listen on, default=127.0.0.1.")
+    parser.add_argument('--port', type=int, required=False, default=8080, help="PORT, port to listen on, default=8080.")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="WORKERS, number of jobs executed concurrently, default=1.")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="JOBS, default maximum number of checks of a job executed concurrently, default=1 (sequential).")
+    parser.add_argument('--private', action='store_true', help="If provided, the jobs skip the checks that qualify a project to be Open Source by default.")
+    parser.add_argument('--fail_fast', '--fail-fast', action='store_true', help="If provided, the jobs stop at their first failing check by default.")
+    parser.add_argument('--no_cache', '--no-cache', action='store_true', help="If provided, precheck neither restores nor stores check results in the result cache.")
+    parser.add_argument('--cache_directory', required=False, default=DEFAULT_CACHE_DIRECTORY, help=f"CACHE_DIRECTORY, location of the result cache, default=$PRECHECK_CACHE or {DEFAULT_CACHE_DIRECTORY}.")
+    parser.add_argument('--cache_size', type=float, required=False, default=DEFAULT_CACHE_SIZE, help=f"CACHE_SIZE, GiB the precheck cache (results, decompressed files, golden files, GDS indexes & file hashes together) may grow to before the least recently used entries are evicted, default={DEFAULT_CACHE_SIZE}.")
+    args = parser.parse_args()
+
+    output_directory = Path(args.output_directory).resolve()
+    output_directory.mkdir(parents=True, exist_ok=True)
+    precheck_logger.initialize_root_logger(output_directory / 'daemon.log')
+
+    if 'GOLDEN_CARAVEL' not in os.environ:
+        logging.critical("`GOLDEN_CARAVEL` environment variable is not set. Please set it to point to absolute path to the golden caravel")
+        sys.exit(1)
+
+    workers = max(1, args.workers)
+    # note: the CPUs & memory of the host are split evenly between the jobs executed concurrently
+    options = dict(caravel_root=Path(os.environ['GOLDEN_CARAVEL']),
+                   pdk_path=Path(args.pdk_path),
+                   private=args.private,
+                   sequence=mpw_precheck.get_sequence(args.private, None, None),
+                   default_content=Path(__file__).parent / '_default_content',
+                   jobs=args.jobs,
+                   cpus=max(1, available_cpus() // workers),
+                   memory=available_memory() / workers,
+                   fail_fast=args.fail_fast,
+                   cache=not args.no_cache,
+                   cache_directory=args.cache_directory,
+                   cache_size=args.cache_size)
+    PrecheckRequestHandler.service = PrecheckService(output_directory, workers, options)
+
+    if args.socket:
+        Path(args.socket).unlink(missing_ok=True)
+        server = UnixHTTPServer(args.socket, PrecheckRequestHandler)
+        logging.info(f"{{{{DAEMON}}}} Listening on {args.socket} with {workers} worker(s)")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), PrecheckRequestHandler)
+        logging.info(f"{{{{DAEMON}}}} Listening on http://{args.host}:{args.port} with {workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        PrecheckRequestHandler.service.shutdown()
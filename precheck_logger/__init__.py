@@ -13,9 +13,11 @@
 # limitations under the License.
 # SPDX-License-Identifier: Apache-2.0
 
+import contextlib
 import logging
 import logging.config
 import sys
+import threading
 
 import coloredlogs
 
@@ -36,12 +38,86 @@ def get_stream_handler(stream):
     return stream_handler
 
 
-def initialize_root_logger(log_path):
-    stream_handler = get_stream_handler(sys.stdout)
+def initialize_root_logger(log_path, stream=sys.stdout):
     file_handler = get_file_handler(log_path)
 
     logging.root.setLevel(logging.DEBUG)
-    logging.root.handlers.clear()
-    logging.root.addHandler(stream_handler)
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+        handler.close()
+    if stream:
+        logging.root.addHandler(get_stream_handler(stream))
     logging.root.addHandler(file_handler)
-    coloredlogs.install(level=logging.INFO, fmt='%(message)s', stream=sys.stdout, reconfigure=True)
+    if stream:
+        coloredlogs.install(level=logging.INFO, fmt='%(message)s', stream=stream, reconfigure=True)
+
+
+class OrderedOutputHandler(logging.Handler):
+    """Root handler that keeps the output of concurrently running checks in sequence order
+
+    Records logged by a thread bound to a slot are held back until the slot is released, after which the
+    slot's records are forwarded to the wrapped handlers as they arrive. Records of unbound threads
+    (e.g. the main thread) are always forwarded directly.
+
+    Arguments:
+        handlers: The handlers the records are eventually forwarded to.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(level=logging.NOTSET)
+        self.handlers = handlers
+        self.slots = {}
+        self.threads = {}
+
+    def open(self, slot, live=False):
+        with self.lock:
+            self.slots[slot] = dict(records=[], live=live)
+
+    def bind(self, slot):
+        with self.lock:
+            self.threads[threading.get_ident()] = slot
+
+    def unbind(self):
+        with self.lock:
+            self.threads.pop(threading.get_ident(), None)
+
+    def release(self, slot):
+        with self.lock:
+            records = self.slots[slot]['records']
+            self.slots[slot] = dict(records=[], live=True)
+            for record in records:
+                self._forward(record)
+
+    def close(self, slot):
+        self.release(slot)
+        with self.lock:
+            del self.slots[slot]
+
+    def handle(self, record):
+        with self.lock:
+            slot = self.slots.get(self.threads.get(record.thread))
+            if slot is not None and not slot['live']:
+                slot['records'].append(record)
+            else:
+                self._forward(record)
+        return True
+
+    def emit(self, record):
+        self._forward(record)
+
+    def _forward(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+@contextlib.contextmanager
+def ordered_output():
+    """Temporarily route all root logger output through an OrderedOutputHandler"""
+    handlers = logging.root.handlers[:]
+    ordered_output_handler = OrderedOutputHandler(handlers)
+    logging.root.handlers = [ordered_output_handler]
+    try:
+        yield ordered_output_handler
+    finally:
+        logging.root.handlers = handlers